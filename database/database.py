@@ -1,4 +1,5 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 from dotenv import load_dotenv
 import os
 import logging
@@ -23,9 +24,23 @@ try:
     
     # Obtener las colecciones
     collection_tasks = database.tasks
+    collection_tasks_archive = database.tasks_archive
     collection_users = database.users
     collection_statistics = database.statistics
+    collection_statistics_rollups = database.statistics_rollups
     collection_kanban_columns = database.kanban_columns
+    collection_boards = database.boards
+    collection_counters = database.counters
+    collection_sync_tombstones = database.sync_tombstones
+    collection_task_transitions = database.task_transitions
+    collection_kanban_cfd_daily = database.kanban_cfd_daily
+    collection_kanban_dwell_daily = database.kanban_dwell_daily
+    collection_user_cascade_jobs = database.user_cascade_jobs
+    collection_task_due_events = database.task_due_events
+    collection_task_audit = database.task_audit
+    collection_webhooks = database.webhooks
+    collection_webhook_outbox = database.webhook_outbox
+    collection_webhook_dead_letters = database.webhook_dead_letters
     
     logger.info("Collections initialized successfully")
 except Exception as e:
@@ -35,7 +50,12 @@ except Exception as e:
 async def get_database():
     return database
 
-
-
-
-
+async def get_next_sequence(name: str, count: int = 1) -> int:
+    """Incrementa atómicamente el contador indicado y devuelve su nuevo valor"""
+    counter = await collection_counters.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"seq": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
@@ -1,15 +1,38 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes import routes_auth, routes_user, routes_task, routes_kanban
+from routes import routes_auth, routes_user, routes_task, routes_kanban, routes_board, routes_search, routes_webhook
 from routes.statistics_route import router as statistics_router
 from scripts.init_database import init_database
+from services.service_kanban import run_column_counter_reconciler
+from services.service_archive import run_task_archiver
+from services.statistics_service import StatisticsService
+from services.process_pool import shutdown_process_pool
+from services.leaderboard_service import LeaderboardService
+from services.service_user_cascade import run_user_cascade_worker
+from services.typeahead_service import run_typeahead_indexer
+from services.due_date_scheduler import run_due_date_scheduler
+from services.audit_service import run_audit_flusher, flush_audit_buffer
+from services.service_webhook import run_webhook_dispatcher, close_http_client
+import asyncio
 import logging
+import os
 
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+COLUMN_RECONCILE_INTERVAL_SECONDS = int(os.getenv("COLUMN_RECONCILE_INTERVAL_SECONDS", "3600"))
+TASK_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("TASK_ARCHIVE_INTERVAL_SECONDS", "3600"))
+TASK_ARCHIVE_AFTER_DAYS = int(os.getenv("TASK_ARCHIVE_AFTER_DAYS", "30"))
+STATISTICS_VERIFY_INTERVAL_SECONDS = int(os.getenv("STATISTICS_VERIFY_INTERVAL_SECONDS", "21600"))
+LEADERBOARD_REFRESH_INTERVAL_SECONDS = int(os.getenv("LEADERBOARD_REFRESH_INTERVAL_SECONDS", "300"))
+USER_CASCADE_POLL_INTERVAL_SECONDS = int(os.getenv("USER_CASCADE_POLL_INTERVAL_SECONDS", "30"))
+TYPEAHEAD_REBUILD_INTERVAL_SECONDS = int(os.getenv("TYPEAHEAD_REBUILD_INTERVAL_SECONDS", "900"))
+
+# Tareas en segundo plano iniciadas con la aplicación
+background_tasks = []
+
 app = FastAPI(
     title="API de Gestión de Tareas",
     description="API para gestionar tareas y usuarios",
@@ -31,6 +54,9 @@ app.include_router(routes_auth.router)
 app.include_router(routes_user.router)
 app.include_router(routes_task.router)
 app.include_router(routes_kanban.router)
+app.include_router(routes_board.router)
+app.include_router(routes_search.router)
+app.include_router(routes_webhook.router)
 app.include_router(statistics_router)
 logger.info("Routes registered successfully")
 
@@ -44,6 +70,33 @@ async def startup_event():
     try:
         # Inicializar la base de datos
         await init_database()
+
+        # Sembrar las clasificaciones desde los resúmenes por periodo
+        await LeaderboardService.seed_leaderboards()
+
+        # Iniciar los trabajos en segundo plano
+        background_tasks.append(asyncio.create_task(
+            run_column_counter_reconciler(COLUMN_RECONCILE_INTERVAL_SECONDS)
+        ))
+        background_tasks.append(asyncio.create_task(
+            run_task_archiver(TASK_ARCHIVE_INTERVAL_SECONDS, TASK_ARCHIVE_AFTER_DAYS)
+        ))
+        background_tasks.append(asyncio.create_task(
+            StatisticsService.run_statistics_verifier(STATISTICS_VERIFY_INTERVAL_SECONDS)
+        ))
+        background_tasks.append(asyncio.create_task(
+            LeaderboardService.run_leaderboard_refresher(LEADERBOARD_REFRESH_INTERVAL_SECONDS)
+        ))
+        background_tasks.append(asyncio.create_task(
+            run_user_cascade_worker(USER_CASCADE_POLL_INTERVAL_SECONDS)
+        ))
+        # El índice de autocompletado se construye en segundo plano para no retrasar el arranque
+        background_tasks.append(asyncio.create_task(
+            run_typeahead_indexer(TYPEAHEAD_REBUILD_INTERVAL_SECONDS)
+        ))
+        background_tasks.append(asyncio.create_task(run_due_date_scheduler()))
+        background_tasks.append(asyncio.create_task(run_audit_flusher()))
+        background_tasks.append(asyncio.create_task(run_webhook_dispatcher()))
         logger.info("Aplicación iniciada exitosamente")
     except Exception as e:
         logger.error(f"Error al iniciar la aplicación: {str(e)}")
@@ -52,7 +105,17 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Application shutting down...")
-    # Aquí puedes agregar cualquier código de limpieza necesario
+    # Detener los trabajos en segundo plano
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    # Volcar el historial de cambios que aún está en memoria
+    await flush_audit_buffer()
+    # Cerrar las conexiones del despachador de webhooks
+    await close_http_client()
+    # Detener los procesos de cálculo de estadísticas
+    await asyncio.to_thread(shutdown_process_pool)
 
 
 
@@ -0,0 +1,39 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+DEFAULT_BOARD_ID = 1
+
+class Board(BaseModel):
+    id: int = Field(..., description="ID único del tablero")
+    name: str = Field(..., description="Nombre del tablero")
+    description: Optional[str] = Field(None, description="Descripción del tablero")
+    owner_id: int = Field(..., description="ID del usuario propietario del tablero")
+    members: List[int] = Field(default=[], description="IDs de los usuarios miembros del tablero")
+    is_public: bool = Field(default=False, description="Indica si todos los usuarios pueden ver el tablero")
+    created_at: datetime = Field(default_factory=datetime.now, description="Fecha de creación")
+    updated_at: datetime = Field(default_factory=datetime.now, description="Fecha de última actualización")
+
+    class Config:
+        from_attributes = True
+        json_schema_extra = {
+            "example": {
+                "id": 2,
+                "name": "Proyecto Web",
+                "description": "Tablero del equipo web",
+                "owner_id": 1,
+                "members": [1, 2, 3],
+                "is_public": False,
+                "created_at": "2024-03-20T10:00:00",
+                "updated_at": "2024-03-20T10:00:00"
+            }
+        }
+
+class BoardCreate(BaseModel):
+    name: str = Field(..., min_length=3, max_length=100, description="Nombre del tablero")
+    description: Optional[str] = Field(None, max_length=1000, description="Descripción del tablero")
+    members: List[int] = Field(default=[], description="IDs de los usuarios miembros del tablero")
+    is_public: bool = Field(default=False, description="Indica si todos los usuarios pueden ver el tablero")
+
+    class Config:
+        from_attributes = True
@@ -2,11 +2,15 @@ from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 from models.model_task import Task
+from models.model_board import DEFAULT_BOARD_ID
 
 class KanbanColumn(BaseModel):
     id: int = Field(..., description="ID único de la columna")
+    board_id: int = Field(default=DEFAULT_BOARD_ID, description="ID del tablero al que pertenece la columna")
     title: str = Field(..., description="Título de la columna")
     order: int = Field(..., description="Orden de la columna en el tablero")
+    wip_limit: Optional[int] = Field(None, description="Límite de tareas en curso (WIP) de la columna")
+    task_count: int = Field(default=0, description="Número de tareas en la columna")
     created_at: datetime = Field(default_factory=datetime.now, description="Fecha de creación")
     updated_at: datetime = Field(default_factory=datetime.now, description="Fecha de última actualización")
     tasks: Optional[List[Task]] = Field(default=[], description="Lista de tareas en la columna")
@@ -16,8 +20,11 @@ class KanbanColumn(BaseModel):
         json_schema_extra = {
             "example": {
                 "id": 1,
+                "board_id": 1,
                 "title": "Por Hacer",
                 "order": 1,
+                "wip_limit": 5,
+                "task_count": 0,
                 "created_at": "2024-03-20T10:00:00",
                 "updated_at": "2024-03-20T10:00:00",
                 "tasks": []
@@ -25,8 +32,10 @@ class KanbanColumn(BaseModel):
         }
 
 class KanbanColumnCreate(BaseModel):
+    board_id: int = Field(default=DEFAULT_BOARD_ID, description="ID del tablero al que pertenece la columna")
     title: str = Field(..., description="Título de la columna")
     order: int = Field(..., description="Orden de la columna en el tablero")
+    wip_limit: Optional[int] = Field(None, ge=1, description="Límite de tareas en curso (WIP) de la columna")
 
     class Config:
         from_attributes = True 
\ No newline at end of file
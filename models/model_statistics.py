@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict
-from datetime import datetime
+from typing import Optional, Dict, List
+from datetime import datetime, date
 
 class UserStatistics(BaseModel):
     user_id: str = Field(..., description="ID del usuario")
@@ -37,4 +37,76 @@ class UserStatistics(BaseModel):
                 "streak_days": 7,
                 "productivity_score": 85.5
             }
-        } 
\ No newline at end of file
+        }
+
+class UserActivity(BaseModel):
+    user_id: str = Field(..., description="ID del usuario")
+    year: int = Field(..., description="Año del mapa de actividad")
+    active_days: int = Field(..., description="Número de días con actividad en el año")
+    current_streak: int = Field(..., description="Días consecutivos con actividad hasta hoy")
+    longest_streak: int = Field(..., description="Racha más larga de días consecutivos en el año")
+    days: List[date] = Field(..., description="Días con actividad")
+    bitmap: str = Field(..., description="Mapa de bits del año en base64, un bit por día empezando por el 1 de enero")
+
+    class Config:
+        from_attributes = True
+        json_schema_extra = {
+            "example": {
+                "user_id": "1",
+                "year": 2024,
+                "active_days": 3,
+                "current_streak": 2,
+                "longest_streak": 2,
+                "days": ["2024-03-18", "2024-03-19", "2024-03-20"],
+                "bitmap": "AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=="
+            }
+        }
+
+class RollupPoint(BaseModel):
+    bucket: datetime = Field(..., description="Inicio del periodo")
+    created: int = Field(..., description="Tareas creadas en el periodo")
+    completed: int = Field(..., description="Tareas completadas en el periodo")
+
+class ProductivitySeries(BaseModel):
+    user_ids: List[int] = Field(..., description="IDs de los usuarios incluidos en la serie")
+    granularity: str = Field(..., description="Tamaño del periodo: day, week o month")
+    points: List[RollupPoint] = Field(..., description="Puntos de la serie ordenados por periodo")
+
+    class Config:
+        from_attributes = True
+        json_schema_extra = {
+            "example": {
+                "user_ids": [1],
+                "granularity": "week",
+                "points": [
+                    {"bucket": "2024-03-11T00:00:00", "created": 4, "completed": 2},
+                    {"bucket": "2024-03-18T00:00:00", "created": 1, "completed": 5}
+                ]
+            }
+        }
+
+class LeaderboardEntry(BaseModel):
+    rank: int = Field(..., description="Posición en la clasificación")
+    user_id: int = Field(..., description="ID del usuario")
+    username: Optional[str] = Field(None, description="Nombre de usuario")
+    completed: int = Field(..., description="Tareas completadas en el periodo")
+
+class Leaderboard(BaseModel):
+    window: str = Field(..., description="Periodo de la clasificación: week o month")
+    start: datetime = Field(..., description="Inicio del periodo actual")
+    end: datetime = Field(..., description="Inicio del periodo siguiente")
+    entries: List[LeaderboardEntry] = Field(..., description="Usuarios ordenados por tareas completadas")
+
+    class Config:
+        from_attributes = True
+        json_schema_extra = {
+            "example": {
+                "window": "week",
+                "start": "2024-03-18T00:00:00",
+                "end": "2024-03-25T00:00:00",
+                "entries": [
+                    {"rank": 1, "user_id": 3, "username": "ana", "completed": 12},
+                    {"rank": 2, "user_id": 1, "username": "admin", "completed": 9}
+                ]
+            }
+        }
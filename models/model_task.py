@@ -14,6 +14,21 @@ class Status(str, Enum):
     in_progress = "in_progress"
     completed = "completed"
 
+# Valores de estado que indican que una tarea está completada
+COMPLETED_STATUSES = [Status.completed.value, "completada"]
+
+MAX_LABELS = 20
+MAX_LABEL_LENGTH = 30
+
+def normalize_labels(labels: List[str]) -> List[str]:
+    """Etiquetas en minúsculas, sin espacios sobrantes ni repetidas, conservando el orden"""
+    normalized = list(dict.fromkeys(label.strip().lower() for label in labels if label and label.strip()))
+    if len(normalized) > MAX_LABELS:
+        raise ValueError(f'Una tarea no puede tener más de {MAX_LABELS} etiquetas')
+    if any(len(label) > MAX_LABEL_LENGTH for label in normalized):
+        raise ValueError(f'Las etiquetas no pueden exceder los {MAX_LABEL_LENGTH} caracteres')
+    return normalized
+
 
 class TaskBase(BaseModel):
     title: str = Field(..., description="Título de la tarea")
@@ -22,6 +37,8 @@ class TaskBase(BaseModel):
     priority: Optional[str] = Field(None, description="Prioridad de la tarea")
     status: Optional[str] = Field(None, description="Estado de la tarea")
     column_id: Optional[int] = Field(None, description="ID de la columna del Kanban donde se encuentra la tarea")
+    board_id: Optional[int] = Field(None, description="ID del tablero al que pertenece la tarea")
+    labels: List[str] = Field(default_factory=list, description="Etiquetas de la tarea")
 
 
 class TaskCreate(TaskBase):
@@ -45,6 +62,11 @@ class TaskCreate(TaskBase):
             raise ValueError('La descripción no puede exceder los 1000 caracteres')
         return v.strip()
 
+    @field_validator('labels')
+    @classmethod
+    def validate_labels(cls, v):
+        return normalize_labels(v)
+
     @field_validator('assigned_to')
     @classmethod
     def validate_assigned_users(cls, v):
@@ -62,12 +84,61 @@ class TaskCreate(TaskBase):
         return v
 
 
+class TaskUpdate(BaseModel):
+    """Actualización parcial: solo se validan y escriben los campos enviados"""
+    title: Optional[str] = Field(None, description="Título de la tarea")
+    description: Optional[str] = Field(None, description="Descripción de la tarea")
+    due_date: Optional[datetime] = Field(None, description="Fecha de vencimiento de la tarea")
+    priority: Optional[str] = Field(None, description="Prioridad de la tarea")
+    status: Optional[str] = Field(None, description="Estado de la tarea")
+    column_id: Optional[int] = Field(None, description="ID de la columna del Kanban donde se encuentra la tarea")
+    assigned_to: Optional[int] = Field(None, description="ID del usuario asignado a la tarea")
+    labels: Optional[List[str]] = Field(None, description="Etiquetas de la tarea")
+
+    @field_validator('title')
+    @classmethod
+    def title_length(cls, v):
+        if v is None:
+            raise ValueError('El título no puede ser nulo')
+        if len(v) < 3:
+            raise ValueError('El título debe tener al menos 3 caracteres')
+        if len(v) > 100:
+            raise ValueError('El título no puede exceder los 100 caracteres')
+        return v.strip()
+
+    @field_validator('description')
+    @classmethod
+    def description_length(cls, v):
+        if v is None:
+            return v
+        if len(v) < 10:
+            raise ValueError('La descripción debe tener al menos 10 caracteres')
+        if len(v) > 1000:
+            raise ValueError('La descripción no puede exceder los 1000 caracteres')
+        return v.strip()
+
+    @field_validator('labels')
+    @classmethod
+    def validate_labels(cls, v):
+        if v is None:
+            return []
+        return normalize_labels(v)
+
+    @field_validator('due_date')
+    @classmethod
+    def validate_due_date(cls, v):
+        if v is not None and v < datetime.now():
+            raise ValueError('La fecha de vencimiento no puede ser en el pasado')
+        return v
+
+
 class Task(TaskBase):
     id: int = Field(..., description="ID único de la tarea")
     created_by: int = Field(..., description="ID del usuario que creó la tarea")
     assigned_to: Optional[int] = Field(None, description="ID del usuario asignado a la tarea")
     created_at: datetime = Field(..., description="Fecha de creación de la tarea")
     updated_at: datetime = Field(..., description="Fecha de última actualización de la tarea")
+    overdue: bool = Field(False, description="Indica si la tarea venció sin completarse")
 
     class Config:
         from_attributes = True
@@ -80,10 +151,13 @@ class Task(TaskBase):
                 "priority": "alta",
                 "status": "en_progreso",
                 "column_id": 2,
+                "board_id": 1,
+                "labels": ["backend", "urgente"],
                 "created_by": 1,
                 "assigned_to": 2,
                 "created_at": "2024-03-15T10:00:00",
-                "updated_at": "2024-03-15T10:00:00"
+                "updated_at": "2024-03-15T10:00:00",
+                "overdue": False
             }
         }
 
@@ -0,0 +1,59 @@
+from pydantic import BaseModel, Field, HttpUrl, field_validator
+from typing import List, Optional
+from datetime import datetime
+
+TASK_ASSIGNED = "task.assigned"
+TASK_MOVED = "task.moved"
+WEBHOOK_EVENTS = [TASK_ASSIGNED, TASK_MOVED]
+
+class WebhookCreate(BaseModel):
+    url: HttpUrl = Field(..., description="URL a la que se envían los eventos con POST")
+    events: List[str] = Field(..., description="Tipos de evento suscritos")
+    board_id: Optional[int] = Field(None, description="Limitar los eventos a un tablero")
+    secret: Optional[str] = Field(None, min_length=16, description="Secreto para firmar los envíos; se genera si no se indica")
+
+    @field_validator('events')
+    @classmethod
+    def validate_events(cls, v):
+        events = list(dict.fromkeys(v))
+        if not events:
+            raise ValueError('El webhook debe suscribirse al menos a un evento')
+        unknown = [event for event in events if event not in WEBHOOK_EVENTS]
+        if unknown:
+            raise ValueError(f'Eventos no válidos: {", ".join(unknown)}. Disponibles: {", ".join(WEBHOOK_EVENTS)}')
+        return events
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "url": "https://chat.example.com/hooks/tareas",
+                "events": ["task.assigned", "task.moved"],
+                "board_id": 1
+            }
+        }
+
+class Webhook(BaseModel):
+    id: int = Field(..., description="ID único del webhook")
+    url: str = Field(..., description="URL a la que se envían los eventos")
+    events: List[str] = Field(..., description="Tipos de evento suscritos")
+    board_id: Optional[int] = Field(None, description="Tablero al que se limitan los eventos")
+    active: bool = Field(True, description="Indica si el webhook recibe eventos")
+    created_by: int = Field(..., description="ID del usuario que registró el webhook")
+    created_at: datetime = Field(..., description="Fecha de registro")
+
+    class Config:
+        from_attributes = True
+        json_schema_extra = {
+            "example": {
+                "id": 1,
+                "url": "https://chat.example.com/hooks/tareas",
+                "events": ["task.assigned", "task.moved"],
+                "board_id": 1,
+                "active": True,
+                "created_by": 1,
+                "created_at": "2024-03-20T10:00:00"
+            }
+        }
+
+class WebhookCreated(Webhook):
+    secret: str = Field(..., description="Secreto de la firma X-Webhook-Signature; solo se muestra al crear el webhook")
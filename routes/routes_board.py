@@ -0,0 +1,166 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+from models.model_board import Board, BoardCreate
+from models.model_auth import CurrentUser
+from services.service_board import (
+    get_boards as get_boards_service,
+    get_board as get_board_service,
+    create_board as create_board_service,
+    update_board as update_board_service,
+    delete_board as delete_board_service
+)
+from services.service_auth import get_current_user
+
+router = APIRouter(
+    prefix="/boards",
+    tags=["Boards"],
+    responses={404: {"description": "No encontrado"}}
+)
+
+@router.get(
+    "",
+    response_model=list[Board],
+    status_code=status.HTTP_200_OK,
+    summary="Obtener los tableros",
+    description="Obtiene los tableros de los que el usuario es miembro"
+)
+async def get_boards(current_user: CurrentUser = Depends(get_current_user)):
+    try:
+        boards = await get_boards_service(current_user.id, current_user.role)
+        return boards
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get(
+    "/{board_id}",
+    response_model=Board,
+    status_code=status.HTTP_200_OK,
+    summary="Obtener un tablero",
+    description="Obtiene un tablero del que el usuario es miembro"
+)
+async def get_board(board_id: int, current_user: CurrentUser = Depends(get_current_user)):
+    try:
+        board = await get_board_service(board_id, current_user.id, current_user.role)
+        return board
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post(
+    "",
+    status_code=status.HTTP_201_CREATED,
+    summary="Crear un tablero",
+    description="Crea un nuevo tablero cuyo propietario es el usuario actual",
+    responses={
+        201: {
+            "description": "Tablero creado exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "board": {
+                            "id": 2,
+                            "name": "Proyecto Web",
+                            "owner_id": 1,
+                            "members": [1]
+                        },
+                        "message": "Board created successfully"
+                    }
+                }
+            }
+        }
+    }
+)
+async def create_board(board: BoardCreate, current_user: CurrentUser = Depends(get_current_user)):
+    try:
+        result = await create_board_service(board, current_user.id)
+        return result
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.put(
+    "/{board_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Actualizar un tablero",
+    description="Actualiza el nombre, la descripción o los miembros de un tablero"
+)
+async def update_board(
+    board_id: int,
+    board: BoardCreate,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    try:
+        result = await update_board_service(board_id, board, current_user.id, current_user.role)
+        return result
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.delete(
+    "/{board_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Eliminar un tablero",
+    description="Elimina un tablero. No se puede eliminar si contiene columnas."
+)
+async def delete_board(board_id: int, current_user: CurrentUser = Depends(get_current_user)):
+    try:
+        result = await delete_board_service(board_id, current_user.id, current_user.role)
+        return result
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
@@ -1,12 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, status
 from models.model_kanban import KanbanColumn, KanbanColumnCreate
 from models.model_auth import CurrentUser
+from models.model_board import DEFAULT_BOARD_ID
+from typing import Optional
+from datetime import datetime
+from services.transition_service import TransitionService
 from services.service_kanban import (
     get_columns as get_columns_service,
     create_column as create_column_service,
     update_column as update_column_service,
     delete_column as delete_column_service,
-    move_task as move_task_service
+    move_task as move_task_service,
+    get_changes as get_changes_service,
+    reconcile_column_counters as reconcile_column_counters_service,
+    get_cfd as get_cfd_service,
+    get_dwell_times as get_dwell_times_service
 )
 from services.service_auth import get_current_user
 
@@ -30,8 +38,11 @@ router = APIRouter(
                     "example": [
                         {
                             "id": 1,
+                            "board_id": 1,
                             "title": "Por Hacer",
                             "order": 1,
+                            "wip_limit": 5,
+                            "task_count": 1,
                             "tasks": [
                                 {
                                     "id": 1,
@@ -56,10 +67,83 @@ router = APIRouter(
         }
     }
 )
-async def get_columns(current_user: CurrentUser = Depends(get_current_user)):
+async def get_columns(
+    board_id: int = Query(DEFAULT_BOARD_ID, description="ID del tablero"),
+    include_archived: bool = Query(False, description="Incluir las tareas archivadas"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
     try:
-        columns = await get_columns_service()
+        columns = await get_columns_service(board_id, current_user.id, current_user.role, include_archived)
         return columns
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get(
+    "/changes",
+    status_code=status.HTTP_200_OK,
+    summary="Obtener cambios desde una marca de agua",
+    description="Obtiene solo las tareas y columnas creadas, actualizadas o eliminadas después de la marca de agua indicada",
+    responses={
+        200: {
+            "description": "Cambios obtenidos exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "columns": [],
+                        "tasks": [
+                            {
+                                "id": 1,
+                                "title": "Tarea ejemplo",
+                                "column_id": 2,
+                                "sync_seq": 42
+                            }
+                        ],
+                        "deleted": {
+                            "columns": [],
+                            "tasks": [7]
+                        },
+                        "watermark": 42,
+                        "has_more": False
+                    }
+                }
+            }
+        }
+    }
+)
+async def get_changes(
+    since: int = Query(0, ge=0, description="Marca de agua devuelta por la última sincronización"),
+    limit: int = Query(500, ge=1, le=5000, description="Número máximo de cambios por tipo"),
+    board_id: Optional[int] = Query(None, description="Limitar los cambios a un tablero"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    try:
+        changes = await get_changes_service(since, current_user.id, current_user.role, limit, board_id)
+        return changes
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -102,6 +186,47 @@ async def create_column(column: KanbanColumnCreate, current_user: CurrentUser =
             )
         result = await create_column_service(column)
         return result
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post(
+    "/columns/reconcile",
+    status_code=status.HTTP_200_OK,
+    summary="Reconciliar contadores de columnas",
+    description="Recalcula los contadores de tareas de todas las columnas por lotes y corrige las desviaciones",
+    responses={
+        200: {
+            "description": "Contadores reconciliados exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "repaired": 2
+                    }
+                }
+            }
+        }
+    }
+)
+async def reconcile_column_counters(current_user: CurrentUser = Depends(get_current_user)):
+    try:
+        # Solo los administradores pueden reconciliar los contadores
+        if current_user.role != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Solo los administradores pueden reconciliar los contadores"
+            )
+        result = await reconcile_column_counters_service()
+        return result
     except HTTPException:
         raise
     except Exception as e:
@@ -231,8 +356,77 @@ async def move_task(
     current_user: CurrentUser = Depends(get_current_user)
 ):
     try:
-        result = await move_task_service(task_id, new_column_id)
+        result = await move_task_service(task_id, new_column_id, current_user.id, current_user.role)
         return result
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+def validate_day_range(start: datetime, end: datetime):
+    """Rechaza con 400 los rangos de días no válidos"""
+    try:
+        TransitionService.day_range(start, end)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get(
+    "/cfd",
+    status_code=status.HTTP_200_OK,
+    summary="Obtener el diagrama de flujo acumulado",
+    description="Obtiene por día y columna las llegadas y salidas acumuladas y el trabajo en curso, leyendo solo los agregados diarios",
+    responses={
+        200: {
+            "description": "Flujo acumulado obtenido exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "board_id": 1,
+                        "columns": [{"id": 1, "title": "Por Hacer", "order": 1}],
+                        "points": [
+                            {
+                                "day": "2024-03-18T00:00:00",
+                                "columns": [{"column_id": 1, "arrived": 12, "departed": 9, "wip": 3}]
+                            }
+                        ]
+                    }
+                }
+            }
+        },
+        400: {"description": "Rango de fechas no válido"},
+        403: {"description": "No tienes acceso al tablero"}
+    }
+)
+async def get_cfd(
+    start: datetime = Query(..., alias="from", description="Primer día del rango"),
+    end: datetime = Query(..., alias="to", description="Último día del rango"),
+    board_id: int = Query(DEFAULT_BOARD_ID, description="ID del tablero"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    validate_day_range(start, end)
+    try:
+        return await get_cfd_service(board_id, start, end, current_user.id, current_user.role)
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -244,4 +438,65 @@ async def move_task(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        ) 
\ No newline at end of file
+        )
+
+@router.get(
+    "/dwell-times",
+    status_code=status.HTTP_200_OK,
+    summary="Obtener el tiempo de permanencia por columna",
+    description="Obtiene los percentiles del tiempo que pasan las tareas en cada columna, calculados a partir de histogramas diarios",
+    responses={
+        200: {
+            "description": "Tiempos de permanencia obtenidos exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "board_id": 1,
+                        "from": "2024-03-01T00:00:00",
+                        "to": "2024-03-31T00:00:00",
+                        "columns": [
+                            {
+                                "column_id": 2,
+                                "title": "En Progreso",
+                                "count": 40,
+                                "mean_hours": 30.5,
+                                "p50": 21.3,
+                                "p75": 42.7,
+                                "p90": 85.3,
+                                "p95": 120.7
+                            }
+                        ]
+                    }
+                }
+            }
+        },
+        400: {"description": "Rango de fechas no válido"},
+        403: {"description": "No tienes acceso al tablero"}
+    }
+)
+async def get_dwell_times(
+    start: datetime = Query(..., alias="from", description="Primer día del rango"),
+    end: datetime = Query(..., alias="to", description="Último día del rango"),
+    board_id: int = Query(DEFAULT_BOARD_ID, description="ID del tablero"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    validate_day_range(start, end)
+    try:
+        return await get_dwell_times_service(board_id, start, end, current_user.id, current_user.role)
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
@@ -0,0 +1,59 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from models.model_auth import CurrentUser
+from services.service_auth import get_current_user
+from services.typeahead_service import TYPEAHEAD_MAX_LIMIT, get_typeahead_index
+
+router = APIRouter(
+    prefix="/search",
+    tags=["Search"],
+    responses={404: {"description": "No encontrado"}}
+)
+
+SEARCH_TYPES = ["all", "users", "tasks"]
+
+@router.get(
+    "/typeahead",
+    status_code=status.HTTP_200_OK,
+    summary="Autocompletar usuarios y tareas",
+    description="Busca por prefijo en los nombres de usuario activos y en los títulos de las tareas visibles para el usuario actual",
+    responses={
+        200: {
+            "description": "Sugerencias obtenidas exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "ready": True,
+                        "users": [{"id": 2, "username": "ana"}],
+                        "tasks": [{"id": 14, "title": "Analizar métricas de uso"}]
+                    }
+                }
+            }
+        },
+        400: {"description": "Tipo de búsqueda no válido"}
+    }
+)
+async def typeahead(
+    q: str = Query(..., min_length=1, max_length=100, description="Texto escrito hasta ahora"),
+    type: str = Query("all", description="Qué buscar: all, users o tasks"),
+    limit: int = Query(10, ge=1, le=TYPEAHEAD_MAX_LIMIT, description="Número máximo de sugerencias por tipo"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    if type not in SEARCH_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Tipo de búsqueda no válido: {type}"
+        )
+    try:
+        index = get_typeahead_index()
+        result = {"ready": index.ready}
+        if type in ("all", "users"):
+            result["users"] = index.search_users(q, limit)
+        if type in ("all", "tasks"):
+            # Los usuarios que no son admin solo ven sus tareas, igual que en GET /tasks
+            result["tasks"] = index.search_tasks(q, current_user.id, current_user.role == "admin", limit)
+        return result
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
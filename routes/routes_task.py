@@ -1,15 +1,35 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from models.model_task import Task, TaskCreate
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from bson import ObjectId
+from datetime import datetime
+from typing import Optional
+from models.model_task import Task, TaskCreate, TaskUpdate, normalize_labels
 from models.model_auth import CurrentUser
 from services.service_task import (
     get_tasks as get_tasks_service,
+    get_task_facets as get_task_facets_service,
     get_user_tasks as get_user_tasks_service,
     create_task as create_task_service,
     update_task as update_task_service,
+    patch_task as patch_task_service,
     delete_task as delete_task_service,
     move_task as move_task_service
 )
+from services.service_archive import archive_completed_tasks as archive_completed_tasks_service
+from services.service_calendar import (
+    get_calendar_tasks as get_calendar_tasks_service,
+    create_calendar_token as create_calendar_token_service,
+    get_feed_user,
+    feed_validators,
+    feed_not_modified,
+    stream_calendar_feed
+)
 from services.service_auth import get_current_user
+from services.audit_service import (
+    AUDIT_HISTORY_MAX_LIMIT,
+    get_task_history as get_task_history_service,
+    get_audit_metrics
+)
 
 router = APIRouter(
     prefix="/tasks",
@@ -17,6 +37,18 @@ router = APIRouter(
     responses={404: {"description": "No encontrado"}}
 )
 
+def parse_labels(labels: Optional[str]) -> Optional[list]:
+    """Convierte la lista de etiquetas separadas por comas del parámetro de consulta"""
+    if not labels:
+        return None
+    try:
+        return normalize_labels(labels.split(","))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
 @router.get(
     "",
     response_model=list[Task],
@@ -37,6 +69,8 @@ router = APIRouter(
                             "priority": "alta",
                             "status": "en_progreso",
                             "column_id": 1,
+                            "board_id": 1,
+                            "labels": ["backend"],
                             "created_by": 1,
                             "assigned_to": 2,
                             "created_at": "2024-03-15T10:00:00",
@@ -48,9 +82,16 @@ router = APIRouter(
         }
     }
 )
-async def get_tasks(current_user: CurrentUser = Depends(get_current_user)):
+async def get_tasks(
+    board_id: Optional[int] = Query(None, description="Filtrar por tablero"),
+    include_archived: bool = Query(False, description="Incluir las tareas archivadas"),
+    labels: Optional[str] = Query(None, description="Etiquetas separadas por comas; la tarea debe tenerlas todas"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
     try:
-        tasks = await get_tasks_service(current_user.id, current_user.role)
+        tasks = await get_tasks_service(
+            current_user.id, current_user.role, board_id, include_archived, parse_labels(labels)
+        )
         return tasks
     except HTTPException:
         raise
@@ -60,6 +101,243 @@ async def get_tasks(current_user: CurrentUser = Depends(get_current_user)):
             detail=str(e)
         )
 
+@router.get(
+    "/facets",
+    status_code=status.HTTP_200_OK,
+    summary="Obtener los recuentos de los filtros",
+    description="Cuenta las tareas del filtro actual por etiqueta, prioridad, estado, columna y asignado en una sola consulta",
+    responses={
+        200: {
+            "description": "Recuentos obtenidos exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "total": 12,
+                        "labels": [{"value": "backend", "count": 7}, {"value": "urgente", "count": 3}],
+                        "priority": [{"value": "alta", "count": 5}, {"value": "media", "count": 7}],
+                        "status": [{"value": "en_progreso", "count": 8}, {"value": "pendiente", "count": 4}],
+                        "column": [{"value": 2, "count": 8}, {"value": 1, "count": 4}],
+                        "assignee": [{"value": 2, "count": 9}, {"value": 3, "count": 3}]
+                    }
+                }
+            }
+        }
+    }
+)
+async def get_task_facets(
+    board_id: Optional[int] = Query(None, description="Filtrar por tablero"),
+    include_archived: bool = Query(False, description="Incluir las tareas archivadas"),
+    labels: Optional[str] = Query(None, description="Etiquetas separadas por comas; la tarea debe tenerlas todas"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    try:
+        return await get_task_facets_service(
+            current_user.id, current_user.role, board_id, include_archived, parse_labels(labels)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get(
+    "/calendar",
+    response_model=list[Task],
+    status_code=status.HTTP_200_OK,
+    summary="Obtener el calendario de tareas",
+    description="Obtiene las tareas asignadas o creadas por el usuario que vencen en el rango [from, to), ordenadas por fecha de vencimiento",
+    responses={
+        400: {"description": "Rango de fechas no válido"},
+        403: {"description": "Solo los administradores pueden ver el calendario de otro usuario"}
+    }
+)
+async def get_calendar(
+    start: datetime = Query(..., alias="from", description="Inicio del rango"),
+    end: datetime = Query(..., alias="to", description="Fin del rango, excluido"),
+    user_id: Optional[int] = Query(None, description="Usuario del calendario; por defecto el actual"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    if user_id is not None and user_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permiso para ver el calendario de este usuario"
+        )
+    try:
+        return await get_calendar_tasks_service(user_id if user_id is not None else current_user.id, start, end)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post(
+    "/calendar/token",
+    status_code=status.HTTP_201_CREATED,
+    summary="Generar el enlace del feed de calendario",
+    description="Genera un token nuevo para suscribirse al feed iCalendar del usuario; el enlace anterior deja de funcionar",
+    responses={
+        201: {
+            "description": "Enlace generado exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "token": "m3Q2b0x1...",
+                        "feed_url": "https://api.example.com/tasks/calendar.ics?token=m3Q2b0x1..."
+                    }
+                }
+            }
+        }
+    }
+)
+async def create_calendar_token(request: Request, current_user: CurrentUser = Depends(get_current_user)):
+    try:
+        token = await create_calendar_token_service(current_user.id)
+        feed_url = request.url_for("get_calendar_feed").include_query_params(token=token)
+        return {"token": token, "feed_url": str(feed_url)}
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get(
+    "/calendar.ics",
+    status_code=status.HTTP_200_OK,
+    summary="Feed iCalendar de las tareas",
+    description="Feed para aplicaciones de calendario, autenticado con el token del enlace. "
+                "Responde 304 sin leer las tareas si el ETag o Last-Modified del cliente siguen vigentes",
+    responses={
+        200: {"description": "Feed iCalendar", "content": {"text/calendar": {}}},
+        304: {"description": "El feed no cambió desde la última consulta"},
+        401: {"description": "Token no válido"}
+    }
+)
+async def get_calendar_feed(
+    token: str = Query(..., description="Token del enlace del feed"),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None)
+):
+    try:
+        user = await get_feed_user(token)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token de calendario no válido"
+            )
+
+        # Los clientes consultan cada pocos minutos: comparar los validadores no toca las tareas
+        headers = {**feed_validators(user), "Cache-Control": "private, no-cache"}
+        if feed_not_modified(headers, if_none_match, if_modified_since):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return StreamingResponse(
+            stream_calendar_feed(user),
+            media_type="text/calendar; charset=utf-8",
+            headers=headers
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get(
+    "/audit/metrics",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas del búfer de auditoría",
+    description="Tamaño del búfer de auditoría de este proceso, volcados, esperas por contrapresión y registros descartados",
+    responses={
+        200: {
+            "description": "Métricas obtenidas exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "buffered": 37,
+                        "max_size": 10000,
+                        "batch_size": 500,
+                        "flush_interval_seconds": 2.0,
+                        "recorded": 15230,
+                        "flushed": 15193,
+                        "flushes": 812,
+                        "failed_flushes": 0,
+                        "dropped": 0,
+                        "backpressure_waits": 0,
+                        "backpressure_wait_seconds": 0.0,
+                        "high_water_mark": 640,
+                        "last_flush_at": "2024-03-20T15:30:00",
+                        "last_flush_seconds": 0.0041,
+                        "last_error": None
+                    }
+                }
+            }
+        },
+        403: {"description": "Solo los administradores pueden ver las métricas de auditoría"}
+    }
+)
+async def get_task_audit_metrics(current_user: CurrentUser = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden ver las métricas de auditoría"
+        )
+    return get_audit_metrics()
+
+@router.post(
+    "/archive/run",
+    status_code=status.HTTP_200_OK,
+    summary="Archivar tareas completadas",
+    description="Mueve a la colección de archivo las tareas completadas hace más de los días indicados",
+    responses={
+        200: {
+            "description": "Tareas archivadas exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "archived": 120
+                    }
+                }
+            }
+        }
+    }
+)
+async def archive_tasks(
+    older_than_days: int = Query(30, ge=0, description="Antigüedad mínima en días desde el completado"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    try:
+        # Solo los administradores pueden archivar tareas
+        if current_user.role != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Solo los administradores pueden archivar tareas"
+            )
+        result = await archive_completed_tasks_service(older_than_days)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @router.get(
     "/user/{user_id}",
     response_model=list[Task],
@@ -80,6 +358,8 @@ async def get_tasks(current_user: CurrentUser = Depends(get_current_user)):
                             "priority": "alta",
                             "status": "en_progreso",
                             "column_id": 1,
+                            "board_id": 1,
+                            "labels": ["backend"],
                             "created_by": 1,
                             "assigned_to": 2,
                             "created_at": "2024-03-15T10:00:00",
@@ -108,6 +388,69 @@ async def get_user_tasks(user_id: int, current_user: CurrentUser = Depends(get_c
             detail=str(e)
         )
 
+@router.get(
+    "/{task_id}/history",
+    status_code=status.HTTP_200_OK,
+    summary="Obtener el historial de una tarea",
+    description="Obtiene quién cambió qué campos de la tarea y cuándo, del cambio más reciente al más antiguo",
+    responses={
+        200: {
+            "description": "Historial obtenido exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "task_id": 1,
+                        "entries": [
+                            {
+                                "id": "65fb1c2e9d1e8a0012345678",
+                                "task_id": 1,
+                                "user_id": 2,
+                                "action": "update",
+                                "changes": [{"field": "status", "old": "pendiente", "new": "en_progreso"}],
+                                "ts": "2024-03-20T15:30:00",
+                                "pending": False
+                            }
+                        ],
+                        "next_cursor": None
+                    }
+                }
+            }
+        },
+        403: {"description": "No tienes permiso para ver el historial de esta tarea"},
+        404: {"description": "Tarea no encontrada"}
+    }
+)
+async def get_task_history(
+    task_id: int,
+    before: Optional[str] = Query(None, description="Cursor: id del último registro de la página anterior"),
+    limit: int = Query(50, ge=1, le=AUDIT_HISTORY_MAX_LIMIT, description="Número máximo de registros"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    if before is not None and not ObjectId.is_valid(before):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor no válido"
+        )
+    try:
+        return await get_task_history_service(task_id, current_user.id, current_user.role, before, limit)
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @router.post(
     "",
     response_model=Task,
@@ -127,6 +470,7 @@ async def get_user_tasks(user_id: int, current_user: CurrentUser = Depends(get_c
                         "priority": "alta",
                         "status": "en_progreso",
                         "column_id": 1,
+                        "board_id": 1,
                         "created_by": 1,
                         "assigned_to": 2,
                         "created_at": "2024-03-15T10:00:00",
@@ -139,8 +483,13 @@ async def get_user_tasks(user_id: int, current_user: CurrentUser = Depends(get_c
 )
 async def create_task(task: TaskCreate, current_user: CurrentUser = Depends(get_current_user)):
     try:
-        result = await create_task_service(task, current_user.id)
+        result = await create_task_service(task, current_user.id, current_user.role)
         return result
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -173,6 +522,7 @@ async def create_task(task: TaskCreate, current_user: CurrentUser = Depends(get_
                         "priority": "alta",
                         "status": "en_progreso",
                         "column_id": 1,
+                        "board_id": 1,
                         "created_by": 1,
                         "assigned_to": 2,
                         "created_at": "2024-03-15T10:00:00",
@@ -191,6 +541,67 @@ async def update_task(
     try:
         result = await update_task_service(task_id, task, current_user.id, current_user.role)
         return result
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.patch(
+    "/{task_id}",
+    response_model=Task,
+    status_code=status.HTTP_200_OK,
+    summary="Actualizar parcialmente una tarea",
+    description="Actualiza solo los campos enviados de una tarea. Si ningún campo cambia no se escribe en la base de datos.",
+    responses={
+        200: {
+            "description": "Tarea actualizada exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "id": 1,
+                        "title": "Tarea ejemplo",
+                        "description": "Descripción de la tarea",
+                        "due_date": "2024-03-31T23:59:59",
+                        "priority": "alta",
+                        "status": "completada",
+                        "column_id": 1,
+                        "board_id": 1,
+                        "created_by": 1,
+                        "assigned_to": 2,
+                        "created_at": "2024-03-15T10:00:00",
+                        "updated_at": "2024-03-16T10:00:00"
+                    }
+                }
+            }
+        }
+    }
+)
+async def patch_task(
+    task_id: int,
+    task: TaskUpdate,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    try:
+        result = await patch_task_service(task_id, task, current_user.id, current_user.role)
+        return result
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -276,6 +687,11 @@ async def move_task(
     try:
         result = await move_task_service(task_id, new_column_id, current_user.id, current_user.role)
         return result
+    except PermissionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
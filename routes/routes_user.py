@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from typing import Optional
 from models.model_user import UserCreate
 from models.model_auth import CurrentUser
 from services.service_user import (
@@ -6,7 +7,14 @@ from services.service_user import (
     create_user as create_user_service,
     get_user as get_user_service,
     update_user as update_user_service,
-    delete_user as delete_user_service
+    delete_user as delete_user_service,
+    import_users as import_users_service,
+    deactivate_user as deactivate_user_service,
+    get_user_tasks as get_user_tasks_service
+)
+from services.service_user_cascade import (
+    get_cascade_job as get_cascade_job_service,
+    get_cascade_jobs as get_cascade_jobs_service
 )
 from services.service_auth import get_current_user
 
@@ -54,10 +62,78 @@ async def create_user(user: UserCreate, current_user: CurrentUser = Depends(get_
             detail=str(e)
         )
 
+@router.post("/import", status_code=status.HTTP_200_OK)
+async def import_users(
+    request: Request,
+    format: Optional[str] = Query(None, description="csv o ndjson; por defecto se deduce del Content-Type"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Importa usuarios desde un CSV con cabecera o un NDJSON, devolviendo el resultado de cada fila"""
+    try:
+        # Solo los administradores pueden importar usuarios
+        check_admin_access(current_user)
+        if format is None:
+            content_type = request.headers.get("content-type", "")
+            format = "csv" if "csv" in content_type else "ndjson"
+        result = await import_users_service(request.stream(), format)
+        return result
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/cascade-jobs", status_code=status.HTTP_200_OK)
+async def get_cascade_jobs(
+    limit: int = Query(50, ge=1, le=500, description="Número máximo de trabajos"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Lista los trabajos de cascada más recientes con su progreso"""
+    try:
+        # Solo los administradores pueden ver los trabajos de cascada
+        check_admin_access(current_user)
+        jobs = await get_cascade_jobs_service(limit)
+        return {"jobs": jobs}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/cascade-jobs/{job_id}", status_code=status.HTTP_200_OK)
+async def get_cascade_job(job_id: int, current_user: CurrentUser = Depends(get_current_user)):
+    """Obtiene el estado, el punto de control y las tareas procesadas de un trabajo de cascada"""
+    try:
+        check_admin_access(current_user)
+        job = await get_cascade_job_service(job_id)
+        if not job:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Cascade job not found"
+            )
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @router.get("/{user_id}", status_code=status.HTTP_200_OK)
 async def get_user(
     user_id: int,
     include_tasks: bool = False,
+    task_limit: int = Query(20, ge=1, le=100, description="Tamaño de la primera página de tareas"),
     current_user: CurrentUser = Depends(get_current_user)
 ):
     try:
@@ -68,7 +144,7 @@ async def get_user(
                 detail="No tienes permiso para ver este usuario"
             )
             
-        user = await get_user_service(user_id, include_tasks)
+        user = await get_user_service(user_id, include_tasks, task_limit)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -83,6 +159,29 @@ async def get_user(
             detail=str(e)
         )
 
+@router.get("/{user_id}/tasks", status_code=status.HTTP_200_OK)
+async def get_user_tasks(
+    user_id: int,
+    after: int = Query(0, ge=0, description="Cursor devuelto en next_cursor"),
+    limit: int = Query(20, ge=1, le=100, description="Número máximo de tareas"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Pagina los resúmenes de las tareas asignadas o creadas por el usuario"""
+    try:
+        if current_user.role != "admin" and current_user.id != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="No tienes permiso para ver este usuario"
+            )
+        return await get_user_tasks_service(user_id, after, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @router.put("/{user_id}", status_code=status.HTTP_200_OK)
 async def update_user(user_id: int, user: UserCreate, current_user: CurrentUser = Depends(get_current_user)):
     try:
@@ -113,31 +212,54 @@ async def update_user(user_id: int, user: UserCreate, current_user: CurrentUser
         )
 
 @router.delete("/{user_id}", status_code=status.HTTP_200_OK)
-async def delete_user(user_id: int, current_user: CurrentUser = Depends(get_current_user)):
+async def delete_user(
+    user_id: int,
+    reassign_to: Optional[int] = Query(None, description="Usuario que recibe las tareas; si no se indica quedan sin asignar"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
     try:
         # Solo los administradores pueden eliminar usuarios
         check_admin_access(current_user)
-        result = await delete_user_service(user_id)
+        result = await delete_user_service(user_id, reassign_to, current_user.id)
         if result["message"] == "User not found":
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         return result
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        )   
-
-
-
-
-
-
-
-
-
+        )
 
+@router.post("/{user_id}/deactivate", status_code=status.HTTP_200_OK)
+async def deactivate_user(
+    user_id: int,
+    reassign_to: Optional[int] = Query(None, description="Usuario que recibe las tareas abiertas; si no se indica quedan sin asignar"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    try:
+        # Solo los administradores pueden desactivar usuarios
+        check_admin_access(current_user)
+        result = await deactivate_user_service(user_id, reassign_to, current_user.id)
+        return result
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND if str(e) == "Usuario no encontrado" else status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
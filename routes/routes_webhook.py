@@ -0,0 +1,172 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from typing import Optional
+from models.model_webhook import Webhook, WebhookCreate, WebhookCreated
+from models.model_auth import CurrentUser
+from services.service_webhook import (
+    create_webhook as create_webhook_service,
+    get_webhooks as get_webhooks_service,
+    delete_webhook as delete_webhook_service,
+    get_dead_letters as get_dead_letters_service,
+    retry_dead_letter as retry_dead_letter_service,
+    get_dispatch_metrics
+)
+from services.service_auth import get_current_user
+
+router = APIRouter(
+    prefix="/webhooks",
+    tags=["Webhooks"],
+    responses={404: {"description": "No encontrado"}}
+)
+
+def require_admin(current_user: CurrentUser):
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden gestionar los webhooks"
+        )
+
+@router.get(
+    "",
+    response_model=list[Webhook],
+    status_code=status.HTTP_200_OK,
+    summary="Obtener los webhooks",
+    description="Obtiene los webhooks registrados, sin sus secretos"
+)
+async def get_webhooks(current_user: CurrentUser = Depends(get_current_user)):
+    require_admin(current_user)
+    try:
+        return await get_webhooks_service()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post(
+    "",
+    response_model=WebhookCreated,
+    status_code=status.HTTP_201_CREATED,
+    summary="Registrar un webhook",
+    description="Registra una URL que recibirá por POST los eventos task.assigned y task.moved suscritos. "
+                "Cada envío lleva la cabecera X-Webhook-Signature con el HMAC-SHA256 del cuerpo"
+)
+async def create_webhook(webhook: WebhookCreate, current_user: CurrentUser = Depends(get_current_user)):
+    require_admin(current_user)
+    try:
+        return await create_webhook_service(webhook, current_user.id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get(
+    "/metrics",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas del despachador",
+    description="Entregas pendientes y vencidas en la bandeja de salida, mensajes muertos y contadores de este proceso",
+    responses={
+        200: {
+            "description": "Métricas obtenidas exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "relayed": 420,
+                        "delivered": 415,
+                        "retried": 9,
+                        "dead_lettered": 1,
+                        "in_flight": 0,
+                        "pending": 4,
+                        "due": 0,
+                        "dead_letters": 1
+                    }
+                }
+            }
+        }
+    }
+)
+async def get_webhook_metrics(current_user: CurrentUser = Depends(get_current_user)):
+    require_admin(current_user)
+    try:
+        return await get_dispatch_metrics()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get(
+    "/dead-letters",
+    status_code=status.HTTP_200_OK,
+    summary="Obtener las entregas muertas",
+    description="Entregas que agotaron los reintentos o que el destino rechazó, de la más reciente a la más antigua"
+)
+async def get_dead_letters(
+    webhook_id: Optional[int] = Query(None, description="Filtrar por webhook"),
+    limit: int = Query(50, ge=1, le=500, description="Número máximo de entregas"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    require_admin(current_user)
+    try:
+        return await get_dead_letters_service(webhook_id, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post(
+    "/dead-letters/{delivery_id}/retry",
+    status_code=status.HTTP_200_OK,
+    summary="Reenviar una entrega muerta",
+    description="Devuelve la entrega a la bandeja de salida con los intentos a cero"
+)
+async def retry_dead_letter(delivery_id: str, current_user: CurrentUser = Depends(get_current_user)):
+    require_admin(current_user)
+    try:
+        delivery = await retry_dead_letter_service(delivery_id)
+        return {"message": "Entrega reenviada a la bandeja de salida", "delivery_id": delivery["_id"]}
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.delete(
+    "/{webhook_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Eliminar un webhook",
+    description="Elimina el webhook y descarta sus entregas pendientes"
+)
+async def delete_webhook(webhook_id: int, current_user: CurrentUser = Depends(get_current_user)):
+    require_admin(current_user)
+    try:
+        await delete_webhook_service(webhook_id)
+        return {"message": "Webhook eliminado exitosamente"}
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from database.database import get_database
 from services.statistics_service import StatisticsService
 from services.service_auth import get_current_user
 from models.model_user import User
-from models.model_statistics import UserStatistics
+from models.model_statistics import UserStatistics, UserActivity, ProductivitySeries, Leaderboard
+from services.rollup_service import RollupService
+from services.analytics_service import AnalyticsService
+from services.leaderboard_service import LeaderboardService
+from services.cache_service import statistics_cache
+from datetime import datetime
 from bson import ObjectId
-from typing import List
+from typing import List, Optional
 
 router = APIRouter(
     prefix="/statistics",
@@ -51,6 +57,7 @@ router = APIRouter(
 )
 async def get_user_statistics(
     user_id: str,
+    response: Response,
     current_user: User = Depends(get_current_user)
 ):
     # Solo permitir que los usuarios vean sus propias estadísticas o que los admins vean todas
@@ -60,9 +67,225 @@ async def get_user_statistics(
             detail="No tienes permiso para ver estas estadísticas"
         )
     
-    statistics = await StatisticsService.calculate_user_statistics(user_id)
+    statistics, age, state = await statistics_cache.get(
+        ("user", user_id),
+        lambda: StatisticsService.get_user_statistics(user_id)
+    )
+    response.headers.update(statistics_cache.headers(age, state))
     return statistics
 
+@router.get(
+    "/user/{user_id}/activity",
+    response_model=UserActivity,
+    status_code=status.HTTP_200_OK,
+    responses={
+        403: {"description": "No tienes permiso para ver estas estadísticas"}
+    }
+)
+async def get_user_activity(
+    user_id: str,
+    response: Response,
+    year: int = Query(None, ge=2000, le=2100, description="Año del mapa de actividad, por defecto el actual"),
+    current_user: User = Depends(get_current_user)
+):
+    # Solo permitir que los usuarios vean su propia actividad o que los admins vean todas
+    if str(current_user.id) != user_id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permiso para ver estas estadísticas"
+        )
+
+    year = year or datetime.utcnow().year
+    activity, age, state = await statistics_cache.get(
+        ("activity", user_id, year),
+        lambda: StatisticsService.get_user_activity(user_id, year)
+    )
+    response.headers.update(statistics_cache.headers(age, state))
+    return activity
+
+@router.get(
+    "/rollups",
+    response_model=ProductivitySeries,
+    status_code=status.HTTP_200_OK,
+    responses={
+        400: {"description": "Parámetros de la serie no válidos"},
+        403: {"description": "No tienes permiso para ver estas estadísticas"}
+    }
+)
+async def get_rollups(
+    response: Response,
+    start: datetime = Query(..., alias="from", description="Inicio del rango"),
+    end: datetime = Query(..., alias="to", description="Fin del rango"),
+    granularity: str = Query("day", description="Tamaño del periodo: day, week o month"),
+    user_ids: Optional[str] = Query(None, description="IDs de usuarios separados por comas; por defecto el usuario actual"),
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        ids = [int(value) for value in user_ids.split(",")] if user_ids else [current_user.id]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Lista de usuarios no válida"
+        )
+
+    # Solo los admins pueden ver las series de otros usuarios o de equipos
+    if ids != [current_user.id] and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permiso para ver estas estadísticas"
+        )
+
+    try:
+        points, age, state = await statistics_cache.get(
+            ("rollups", tuple(ids), granularity, start, end),
+            lambda: RollupService.get_series(ids, granularity, start, end)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    response.headers.update(statistics_cache.headers(age, state))
+    return {"user_ids": ids, "granularity": granularity, "points": points}
+
+@router.get(
+    "/leaderboard",
+    response_model=Leaderboard,
+    status_code=status.HTTP_200_OK,
+    responses={
+        400: {"description": "Periodo no válido"},
+        403: {"description": "Solo los administradores pueden ver la clasificación"}
+    }
+)
+async def get_leaderboard(
+    window: str = Query("week", description="Periodo de la clasificación: week o month"),
+    limit: int = Query(10, ge=1, le=100, description="Número de usuarios de la clasificación"),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden ver la clasificación"
+        )
+
+    try:
+        return await LeaderboardService.get_leaderboard(window, limit)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get(
+    "/completion-times",
+    status_code=status.HTTP_200_OK,
+    responses={
+        200: {
+            "description": "Distribución de tiempos de completado obtenida exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "scope": "user",
+                        "id": 1,
+                        "overall": {
+                            "count": 120,
+                            "mean": 30.2,
+                            "percentiles": {"p50": 20.1, "p75": 40.7, "p90": 65.4, "p95": 84.6, "p99": 132.6},
+                            "histogram": [5, 12, 10, 30, 20, 15, 18, 6, 3, 1]
+                        },
+                        "by_priority": {},
+                        "by_assignee": [{"assigned_to": 1, "count": 120, "p50": 20.1}],
+                        "histogram_edges_hours": [0, 1, 4, 8, 24, 48, 72, 168, 336, 720, None]
+                    }
+                }
+            }
+        },
+        400: {"description": "Ámbito no válido"},
+        403: {"description": "No tienes permiso para ver estas estadísticas"}
+    }
+)
+async def get_completion_times(
+    response: Response,
+    scope: str = Query("user", description="Ámbito: user, column u org"),
+    id: Optional[int] = Query(None, description="ID del usuario o de la columna; por defecto el usuario actual"),
+    current_user: User = Depends(get_current_user)
+):
+    if scope == "user" and id is None:
+        id = current_user.id
+
+    # Los usuarios solo ven su propia distribución; las columnas y la organización son para admins
+    if current_user.role != "admin" and (scope != "user" or id != current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permiso para ver estas estadísticas"
+        )
+
+    try:
+        distribution, age, state = await statistics_cache.get(
+            ("completion-times", scope, id),
+            lambda: AnalyticsService.completion_time_distribution(scope, id)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    response.headers.update(statistics_cache.headers(age, state))
+    return distribution
+
+@router.post(
+    "/rollups/backfill",
+    status_code=status.HTTP_200_OK,
+    responses={
+        403: {"description": "Solo los administradores pueden reconstruir los resúmenes"}
+    }
+)
+async def backfill_rollups(
+    current_user: User = Depends(get_current_user)
+):
+    # Solo los admins pueden reconstruir los resúmenes
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden reconstruir los resúmenes"
+        )
+
+    result = await RollupService.backfill_rollups()
+    statistics_cache.clear()
+    return result
+
+@router.post(
+    "/verify",
+    status_code=status.HTTP_200_OK,
+    responses={
+        200: {
+            "description": "Estadísticas verificadas exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "checked": 120,
+                        "repaired": 1
+                    }
+                }
+            }
+        },
+        403: {"description": "Solo los administradores pueden verificar las estadísticas"}
+    }
+)
+async def verify_statistics(
+    current_user: User = Depends(get_current_user)
+):
+    # Solo los admins pueden verificar las estadísticas
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden verificar las estadísticas"
+        )
+
+    result = await StatisticsService.verify_statistics()
+    statistics_cache.clear()
+    return result
+
 @router.get(
     "/all",
     response_model=List[UserStatistics],
@@ -101,6 +324,8 @@ async def get_user_statistics(
     }
 )
 async def get_all_statistics(
+    after: int = Query(0, ge=0, description="ID del último usuario de la página anterior"),
+    limit: int = Query(100, ge=1, le=1000, description="Número máximo de usuarios por página"),
     current_user: User = Depends(get_current_user)
 ):
     # Solo los admins pueden ver todas las estadísticas
@@ -110,8 +335,18 @@ async def get_all_statistics(
             detail="Solo los administradores pueden ver todas las estadísticas"
         )
     
-    # Obtener todos los usuarios
-    db = await get_database()
-    users = await db.users.find().to_list(None)
-    statistics = [await StatisticsService.calculate_user_statistics(str(user["_id"])) for user in users]
-    return statistics 
\ No newline at end of file
+    # Obtener una página de usuarios y agrupar sus tareas en una sola pasada
+    user_ids = await StatisticsService.get_org_user_page(after, limit)
+
+    async def stream():
+        yield "["
+        first = True
+        async for statistics in StatisticsService.stream_org_statistics(user_ids):
+            yield ("" if first else ",") + statistics.model_dump_json()
+            first = False
+        yield "]"
+
+    headers = {}
+    if len(user_ids) == limit:
+        headers["X-Next-Cursor"] = str(user_ids[-1])
+    return StreamingResponse(stream(), media_type="application/json", headers=headers) 
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""Mide el retraso del bucle de eventos mientras se calcula una distribución grande de tiempos de completado.
+
+Uso:
+    python -m scripts.bench_event_loop_lag [--tasks 2000000]
+
+Un latido comprueba cada 10 ms cuánto tarda en despertar. Los lotes en BSON se
+decodifican y la distribución se calcula primero en el propio bucle y después
+en el pool de procesos, igual que en AnalyticsService.load_completion_arrays.
+Los lotes son sintéticos, con la forma de la proyección de la agregación, así
+que no hace falta una base de datos. Con el pool el retraso debe mantenerse plano.
+"""
+import argparse
+import asyncio
+import random
+import time
+import bson
+import numpy as np
+from services.analytics_arrays import TaskArrays, arrays_from_bson, compute_distribution
+from services.analytics_service import BATCH_SIZE
+from services.process_pool import PROCESS_POOL_WORKERS, get_process_pool, run_in_process, shutdown_process_pool
+
+HEARTBEAT_SECONDS = 0.01
+PRIORITIES = ["alta", "media", "baja", None]
+
+def generate_raw_batches(total: int) -> list:
+    """Genera lotes en BSON como los de aggregate_raw_batches"""
+    batches = []
+    for start in range(0, total, BATCH_SIZE):
+        batches.append(b"".join(
+            bson.encode({
+                "duration": random.expovariate(1 / 36),
+                "priority": random.choice(PRIORITIES),
+                "assigned_to": random.randint(1, 2000)
+            })
+            for _ in range(min(BATCH_SIZE, total - start))
+        ))
+    return batches
+
+async def heartbeat(lags: list, stop: asyncio.Event):
+    """Anota cuánto se retrasa cada despertar respecto a lo previsto"""
+    while not stop.is_set():
+        expected = time.perf_counter() + HEARTBEAT_SECONDS
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+async def report(batches: list, offload: bool):
+    """Decodifica los lotes y calcula la distribución de tiempos de completado"""
+    arrays = TaskArrays()
+    for raw in batches:
+        if offload:
+            arrays.add_arrays(*await run_in_process(arrays_from_bson, raw))
+        else:
+            arrays.add_arrays(*arrays_from_bson(raw))
+            await asyncio.sleep(0)
+    durations, priorities, assignees = arrays.finish()
+    if offload:
+        await run_in_process(compute_distribution, durations, priorities, assignees)
+    else:
+        compute_distribution(durations, priorities, assignees)
+
+async def measure(batches: list, offload: bool) -> dict:
+    lags = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    await report(batches, offload)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    lags_ms = np.array(lags) * 1000
+    return {"elapsed": elapsed, "p99": float(np.percentile(lags_ms, 99)), "max": float(lags_ms.max())}
+
+async def main(tasks: int):
+    batches = generate_raw_batches(tasks)
+    # Arrancar los procesos antes de medir para no contar el coste de spawn
+    await asyncio.gather(*(run_in_process(sum, [i]) for i in range(PROCESS_POOL_WORKERS)))
+
+    print(f"tareas: {tasks}, lotes: {len(batches)}, procesos: {PROCESS_POOL_WORKERS}")
+    for label, offload in (("en el bucle", False), ("en el pool", True)):
+        result = await measure(batches, offload)
+        print(f"{label:12} total {result['elapsed']:.2f} s, retraso p99 {result['p99']:.1f} ms, máximo {result['max']:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=2_000_000)
+    args = parser.parse_args()
+    get_process_pool()
+    try:
+        asyncio.run(main(args.tasks))
+    finally:
+        shutdown_process_pool()
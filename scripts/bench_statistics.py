@@ -0,0 +1,98 @@
+"""Compara el cálculo de estadísticas en Python con el pipeline de agregación.
+
+Uso:
+    python -m scripts.bench_statistics [--sizes 100 10000 100000]
+
+Utiliza la base de datos indicada en BENCH_DATABASE_NAME (por defecto
+seekanban_bench) y borra sus tareas antes de cada tamaño.
+"""
+import os
+
+os.environ["DATABASE_NAME"] = os.getenv("BENCH_DATABASE_NAME", "seekanban_bench")
+
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from database.database import collection_tasks, collection_tasks_archive
+from services.statistics_service import StatisticsService
+
+USER_ID = 1
+STATUSES = ["pendiente", "en_progreso", "completada"]
+PRIORITIES = ["alta", "media", "baja"]
+
+async def seed_tasks(count: int):
+    """Inserta count tareas sintéticas del usuario de prueba"""
+    await collection_tasks.delete_many({})
+    await collection_tasks_archive.delete_many({})
+    now = datetime.utcnow()
+    batch = []
+    for i in range(count):
+        created_at = now - timedelta(days=random.randint(0, 365), hours=random.randint(0, 23))
+        status = random.choice(STATUSES)
+        batch.append({
+            "id": i + 1,
+            "title": f"Tarea {i}",
+            "status": status,
+            "priority": random.choice(PRIORITIES),
+            "created_by": USER_ID,
+            "assigned_to": USER_ID,
+            "created_at": created_at,
+            "updated_at": created_at + timedelta(hours=random.randint(0, 48)),
+            "completed_at": created_at + timedelta(hours=random.randint(1, 72)) if status == "completada" else None
+        })
+        if len(batch) == 10000:
+            await collection_tasks.insert_many(batch)
+            batch = []
+    if batch:
+        await collection_tasks.insert_many(batch)
+    await collection_tasks.create_index("assigned_to")
+    await collection_tasks.create_index("created_by")
+
+async def python_statistics(user_id: int):
+    """Cálculo anterior: carga todas las tareas y las recorre en Python"""
+    tasks = await collection_tasks.find({
+        "$or": [{"assigned_to": user_id}, {"created_by": user_id}]
+    }).to_list(None)
+    total_tasks = len(tasks)
+    completed_tasks = len([t for t in tasks if t["status"] == "completada"])
+    completed_with_time = [t for t in tasks if t["status"] == "completada" and t.get("completed_at") and t.get("created_at")]
+    total_time = sum((t["completed_at"] - t["created_at"]).total_seconds() for t in completed_with_time)
+    tasks_by_priority = {p: len([t for t in tasks if t["priority"] == p]) for p in PRIORITIES}
+    tasks_by_status = {s: len([t for t in tasks if t["status"] == s]) for s in STATUSES}
+    last_activity = max((t["updated_at"] for t in tasks), default=datetime.now())
+    streak_days = 0
+    current_date = datetime.now().date()
+    while any(t["updated_at"].date() == current_date for t in tasks):
+        streak_days += 1
+        current_date -= timedelta(days=1)
+    return total_tasks, completed_tasks, total_time, tasks_by_priority, tasks_by_status, last_activity, streak_days
+
+async def measure(coro_factory, repeat: int):
+    """Devuelve la latencia media en ms y el pico de memoria en KiB"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await coro_factory()
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024
+
+async def main(sizes):
+    print(f"{'tareas':>8} | {'python ms':>10} | {'python KiB':>11} | {'pipeline ms':>11} | {'pipeline KiB':>12}")
+    for size in sizes:
+        await seed_tasks(size)
+        repeat = 5 if size <= 10000 else 1
+        py_ms, py_kib = await measure(lambda: python_statistics(USER_ID), repeat)
+        agg_ms, agg_kib = await measure(lambda: StatisticsService.calculate_user_statistics(str(USER_ID)), repeat)
+        print(f"{size:>8} | {py_ms:>10.1f} | {py_kib:>11.0f} | {agg_ms:>11.1f} | {agg_kib:>12.0f}")
+    await collection_tasks.delete_many({})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes))
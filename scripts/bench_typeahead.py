@@ -0,0 +1,65 @@
+"""Mide la memoria y la latencia del índice de autocompletado con títulos sintéticos.
+
+Uso:
+    python -m scripts.bench_typeahead [--titles 1000000] [--queries 2000]
+
+Los títulos se generan combinando palabras de un vocabulario y se indexan con
+TypeaheadIndex igual que en build_typeahead_index, sin base de datos. Las
+consultas son prefijos de 1 a 5 letras de palabras del vocabulario, buscadas
+como admin (árbol completo) y como usuario normal (solo sus tareas).
+"""
+import argparse
+import random
+import resource
+import string
+import time
+from services.typeahead_service import TypeaheadIndex
+
+def rss_mb() -> float:
+    """Memoria residente máxima del proceso en MiB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def make_vocabulary(size: int) -> list:
+    rng = random.Random(1)
+    return ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(size)]
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def main(total: int, queries: int, users: int):
+    vocabulary = make_vocabulary(50000)
+    rng = random.Random(2)
+    before = rss_mb()
+    index = TypeaheadIndex()
+    started = time.perf_counter()
+    for task_id in range(1, total + 1):
+        index.add_task({
+            "id": task_id,
+            "title": " ".join(rng.choices(vocabulary, k=rng.randint(2, 6))),
+            "assigned_to": rng.randint(1, users),
+            "created_by": rng.randint(1, users)
+        })
+    built = time.perf_counter() - started
+    after = rss_mb()
+
+    prefixes = [word[:rng.randint(1, 5)] for word in rng.choices(vocabulary, k=queries)]
+    print(f"títulos:            {total}")
+    print(f"construcción:       {built:.1f} s")
+    print(f"memoria del índice: {after - before:.0f} MiB (RSS máximo {after:.0f} MiB)")
+    for label, is_admin in (("admin", True), ("usuario", False)):
+        latencies = []
+        for prefix in prefixes:
+            start = time.perf_counter()
+            index.search_tasks(prefix, rng.randint(1, users), is_admin, 10)
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"latencia {label:8} p50 {percentile(latencies, 50):.3f} ms, p99 {percentile(latencies, 99):.3f} ms, "
+              f"máx {max(latencies):.3f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--titles", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.titles, args.queries, args.users)
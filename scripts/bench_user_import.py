@@ -0,0 +1,57 @@
+"""Mide los usuarios por segundo que puede preparar la importación según el tamaño del pool de procesos.
+
+Uso:
+    python -m scripts.bench_user_import [--users 200] [--pool-sizes 1,2,4,8]
+
+Cada fila se valida con UserCreate y las contraseñas se hashean repartidas
+entre los procesos del pool, igual que en service_user.insert_import_batch.
+No se inserta en MongoDB: el coste dominante de una importación es bcrypt.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from models.model_user import UserCreate
+from services.password_hashing import hash_passwords
+
+def generate_rows(total: int) -> list:
+    return [
+        {
+            "username": f"usuario{index}",
+            "email": f"usuario{index}@example.com",
+            "phone": f"+1{index:09d}",
+            "password": f"Clave{index}!a"
+        }
+        for index in range(total)
+    ]
+
+async def prepare(rows: list, pool: ProcessPoolExecutor, workers: int) -> float:
+    """Valida las filas y hashea sus contraseñas; devuelve los segundos empleados"""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    users = [UserCreate(**row) for row in rows]
+    passwords = [user.password for user in users]
+    size = -(-len(passwords) // workers)
+    await asyncio.gather(*(
+        loop.run_in_executor(pool, hash_passwords, passwords[offset:offset + size])
+        for offset in range(0, len(passwords), size)
+    ))
+    return time.perf_counter() - start
+
+async def main(total: int, pool_sizes: list):
+    rows = generate_rows(total)
+    print(f"usuarios: {total}, CPUs: {multiprocessing.cpu_count()}")
+    for workers in pool_sizes:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # Arrancar los procesos antes de medir
+            await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(pool, sum, [0]) for _ in range(workers)))
+            elapsed = await prepare(rows, pool, workers)
+        print(f"pool de {workers:2}: {elapsed:6.2f} s, {total / elapsed:7.1f} usuarios/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--pool-sizes", default="1,2,4,8")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, [int(size) for size in args.pool_sizes.split(",")]))
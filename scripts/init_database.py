@@ -1,10 +1,156 @@
-from database.database import collection_tasks, collection_users, collection_kanban_columns
+from database.database import (
+    collection_tasks,
+    collection_tasks_archive,
+    collection_users,
+    collection_kanban_columns,
+    collection_sync_tombstones,
+    collection_boards,
+    collection_statistics,
+    collection_statistics_rollups,
+    collection_task_transitions,
+    collection_kanban_cfd_daily,
+    collection_kanban_dwell_daily,
+    collection_counters,
+    collection_user_cascade_jobs,
+    collection_task_due_events,
+    collection_task_audit,
+    collection_webhooks,
+    collection_webhook_outbox,
+    collection_webhook_dead_letters,
+    get_next_sequence
+)
+from models.model_board import DEFAULT_BOARD_ID
 from services.service_auth import get_password_hash
+from services.service_sync import SYNC_COUNTER
+from services.transition_service import TransitionService
+from services.service_user import USERS_COUNTER, user_keys
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import OperationFailure
 import logging
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+async def create_indexes():
+    """Crea los índices que necesitan las consultas de la aplicación"""
+    await collection_tasks.create_index([("id", ASCENDING)])
+    await collection_tasks.create_index([("sync_seq", ASCENDING)])
+    await collection_tasks.create_index([("column_id", ASCENDING)])
+    await collection_tasks.create_index([("board_id", ASCENDING), ("column_id", ASCENDING)])
+    await collection_tasks.create_index([("board_id", ASCENDING), ("sync_seq", ASCENDING)])
+    await collection_tasks.create_index([("status", ASCENDING), ("completed_at", ASCENDING)])
+    await collection_tasks.create_index([("assigned_to", ASCENDING)])
+    await collection_tasks.create_index([("created_by", ASCENDING)])
+    await collection_tasks.create_index([("labels", ASCENDING)])
+    # Ventanas del planificador de vencimientos
+    await collection_tasks.create_index([("due_date", ASCENDING)])
+    # Calendario: una rama del $or por participante, cada una con su índice ordenado por vencimiento
+    await collection_tasks.create_index([("assigned_to", ASCENDING), ("due_date", ASCENDING)])
+    await collection_tasks.create_index([("created_by", ASCENDING), ("due_date", ASCENDING)])
+    await collection_tasks.create_index([("board_id", ASCENDING), ("labels", ASCENDING)])
+    await collection_tasks_archive.create_index([("id", ASCENDING)])
+    await collection_tasks_archive.create_index([("board_id", ASCENDING), ("column_id", ASCENDING)])
+    await collection_tasks_archive.create_index([("assigned_to", ASCENDING)])
+    await collection_tasks_archive.create_index([("created_by", ASCENDING)])
+    await collection_tasks_archive.create_index([("labels", ASCENDING)])
+    # Archivados interrumpidos pendientes de terminar
+    await collection_tasks_archive.create_index(
+        [("archived_at", ASCENDING)],
+        partialFilterExpression={"archive_pending": True}
+    )
+    await collection_kanban_columns.create_index([("sync_seq", ASCENDING)])
+    await collection_kanban_columns.create_index([("board_id", ASCENDING), ("order", ASCENDING)])
+    await collection_kanban_columns.create_index([("board_id", ASCENDING), ("sync_seq", ASCENDING)])
+    await collection_sync_tombstones.create_index([("seq", ASCENDING)])
+    await collection_sync_tombstones.create_index([("board_id", ASCENDING), ("seq", ASCENDING)])
+    await collection_boards.create_index([("id", ASCENDING)], unique=True)
+    await collection_boards.create_index([("members", ASCENDING)])
+    await collection_statistics.create_index([("user_id", ASCENDING)], unique=True)
+    await collection_statistics_rollups.create_index(
+        [("user_id", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)],
+        unique=True
+    )
+    await collection_users.create_index([("id", ASCENDING)], unique=True)
+    await collection_users.create_index([("calendar_token", ASCENDING)], unique=True, sparse=True)
+    for key in ("email_key", "username_key"):
+        try:
+            await collection_users.create_index([(key, ASCENDING)], unique=True)
+        except OperationFailure as e:
+            # Sin el índice se aceptarían duplicados: el servicio ya no los comprueba antes de escribir.
+            # Hay usuarios que solo se distinguen en mayúsculas y hay que resolverlos a mano
+            duplicates = await collection_users.aggregate([
+                {"$group": {"_id": f"${key}", "ids": {"$push": "$id"}, "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gt": 1}}},
+                {"$limit": 20}
+            ]).to_list(None)
+            for duplicate in duplicates:
+                logger.error(f"Usuarios duplicados con {key} '{duplicate['_id']}': {duplicate['ids']}")
+            raise RuntimeError(f"No se pudo crear el índice único de {key}: {str(e)}") from e
+    await collection_user_cascade_jobs.create_index([("id", ASCENDING)], unique=True)
+    await collection_user_cascade_jobs.create_index([("status", ASCENDING), ("id", ASCENDING)])
+    await collection_task_transitions.create_index([("task_id", ASCENDING), ("ts", ASCENDING)])
+    await collection_kanban_cfd_daily.create_index(
+        [("board_id", ASCENDING), ("column_id", ASCENDING), ("day", ASCENDING)],
+        unique=True
+    )
+    await collection_kanban_cfd_daily.create_index([("board_id", ASCENDING), ("day", ASCENDING)])
+    await collection_kanban_dwell_daily.create_index(
+        [("board_id", ASCENDING), ("column_id", ASCENDING), ("day", ASCENDING)],
+        unique=True
+    )
+    await collection_kanban_dwell_daily.create_index([("board_id", ASCENDING), ("day", ASCENDING)])
+    # Un evento por aviso y vencimiento aunque varios procesos lo disparen
+    await collection_task_due_events.create_index(
+        [("task_id", ASCENDING), ("type", ASCENDING), ("due_date", ASCENDING)],
+        unique=True
+    )
+    await collection_task_due_events.create_index([("created_at", ASCENDING)])
+    await collection_task_audit.create_index([("task_id", ASCENDING), ("_id", DESCENDING)])
+    # Solo las tareas con eventos sin relevar entran en el índice del relevo de la bandeja de salida
+    await collection_tasks.create_index(
+        [("outbox_pending", ASCENDING)],
+        partialFilterExpression={"outbox_pending": True}
+    )
+    await collection_webhooks.create_index([("id", ASCENDING)], unique=True)
+    await collection_webhook_outbox.create_index([("next_attempt_at", ASCENDING)])
+    await collection_webhook_outbox.create_index([("webhook_id", ASCENDING)])
+    await collection_webhook_dead_letters.create_index([("dead_lettered_at", DESCENDING)])
+    await collection_webhook_dead_letters.create_index([("webhook_id", ASCENDING), ("dead_lettered_at", DESCENDING)])
+    logger.info("Índices creados exitosamente")
+
+async def backfill_sync_seq(collection):
+    """Asigna una secuencia de sincronización única a los documentos que no la tienen"""
+    docs = await collection.find({"sync_seq": {"$exists": False}}, {"_id": 1}).to_list(None)
+    if not docs:
+        return
+    last_seq = await get_next_sequence(SYNC_COUNTER, len(docs))
+    first_seq = last_seq - len(docs) + 1
+    await collection.bulk_write([
+        UpdateOne({"_id": doc["_id"]}, {"$set": {"sync_seq": first_seq + i}})
+        for i, doc in enumerate(docs)
+    ])
+    logger.info(f"Se asignó sync_seq a {len(docs)} documentos de {collection.name}")
+
+async def backfill_user_keys():
+    """Normaliza email y username de los usuarios anteriores a los índices únicos y siembra su contador"""
+    result = await collection_users.update_many(
+        {"$or": [{"email_key": {"$exists": False}}, {"username_key": {"$exists": False}}]},
+        [{"$set": {
+            "email_key": {"$toLower": {"$trim": {"input": "$email"}}},
+            "username_key": {"$toLower": {"$trim": {"input": "$username"}}}
+        }}]
+    )
+    if result.modified_count:
+        logger.info(f"Se normalizaron las claves de {result.modified_count} usuarios")
+
+    last_user = await collection_users.find_one(sort=[("id", -1)], projection={"id": 1})
+    if last_user:
+        await collection_counters.update_one(
+            {"_id": USERS_COUNTER},
+            {"$max": {"seq": last_user["id"]}},
+            upsert=True
+        )
+
 async def init_database():
     """Inicializa todas las colecciones de la base de datos"""
     try:
@@ -20,12 +166,29 @@ async def init_database():
                 "phone": "+1234567890",
                 "role": "admin",
                 "is_active": True,
+                **user_keys("admin", "admin@example.com"),
                 "created_at": datetime.now(),
                 "updated_at": datetime.now()
             }
             await collection_users.insert_one(admin_user)
             logger.info("Usuario administrador creado exitosamente")
 
+        # Inicializar el tablero por defecto
+        boards_count = await collection_boards.count_documents({})
+        if boards_count == 0:
+            default_board = {
+                "id": DEFAULT_BOARD_ID,
+                "name": "Tablero principal",
+                "description": "Tablero compartido por todos los usuarios",
+                "owner_id": 1,
+                "members": [1],
+                "is_public": True,
+                "created_at": datetime.now(),
+                "updated_at": datetime.now()
+            }
+            await collection_boards.insert_one(default_board)
+            logger.info("Tablero por defecto creado exitosamente")
+
         # Inicializar columnas del Kanban
         columns_count = await collection_kanban_columns.count_documents({})
         if columns_count == 0:
@@ -102,6 +265,27 @@ async def init_database():
             await collection_tasks.insert_many(sample_tasks)
             logger.info(f"Se crearon {len(sample_tasks)} tareas de ejemplo")
 
+        # Asignar al tablero por defecto las columnas y tareas anteriores a los tableros
+        for collection in (collection_kanban_columns, collection_tasks):
+            result = await collection.update_many(
+                {"board_id": {"$exists": False}},
+                {"$set": {"board_id": DEFAULT_BOARD_ID}}
+            )
+            if result.modified_count:
+                logger.info(f"Se asignaron {result.modified_count} documentos de {collection.name} al tablero por defecto")
+
+        await backfill_sync_seq(collection_kanban_columns)
+        await backfill_sync_seq(collection_tasks)
+        await backfill_user_keys()
+        await create_indexes()
+
+        # Las tareas anteriores al registro de transiciones entran en su columna al crearse
+        await collection_tasks.update_many(
+            {"column_entered_at": {"$exists": False}},
+            [{"$set": {"column_entered_at": "$created_at"}}]
+        )
+        await TransitionService.backfill_cfd()
+
         logger.info("Inicialización de la base de datos completada exitosamente")
 
     except Exception as e:
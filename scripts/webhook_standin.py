@@ -0,0 +1,108 @@
+"""Servidor HTTP local que sustituye a los destinos de los webhooks durante las pruebas.
+
+Uso:
+    python -m scripts.webhook_standin [--port 9000] [--secret SECRETO]
+        [--fail-rate 0.3] [--fail-status 503] [--retry-after 2] [--delay 0.2]
+
+Registrar después un webhook apuntando a http://localhost:9000/<ruta>. Cada
+envío se muestra con su evento, su id de entrega y si la firma es válida.
+Con --fail-rate una fracción de los envíos responde --fail-status, para
+comprobar los reintentos, la espera exponencial y los mensajes muertos
+(un 4xx distinto de 408, 425 y 429 pasa directamente a mensajes muertos).
+El máximo de peticiones simultáneas por ruta permite comprobar el límite de
+concurrencia por webhook. Ctrl+C o SIGTERM muestran el resumen.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import signal
+import threading
+import time
+
+lock = threading.Lock()
+in_flight = Counter()
+max_in_flight = Counter()
+totals = Counter()
+deliveries = Counter()
+
+def make_handler(options):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with lock:
+                in_flight[self.path] += 1
+                max_in_flight[self.path] = max(max_in_flight[self.path], in_flight[self.path])
+            try:
+                if options.delay:
+                    time.sleep(options.delay)
+                self.respond(body)
+            finally:
+                with lock:
+                    in_flight[self.path] -= 1
+
+        def respond(self, body: bytes):
+            delivery_id = self.headers.get("X-Webhook-Delivery")
+            signature = "-"
+            if options.secret:
+                expected = "sha256=" + hmac.new(options.secret.encode(), body, hashlib.sha256).hexdigest()
+                signature = "ok" if hmac.compare_digest(expected, self.headers.get("X-Webhook-Signature", "")) else "INVÁLIDA"
+            with lock:
+                deliveries[delivery_id] += 1
+                attempt = deliveries[delivery_id]
+
+            failed = random.random() < options.fail_rate
+            status = options.fail_status if failed else 200
+            with lock:
+                totals["failed" if failed else "ok"] += 1
+                if signature == "INVÁLIDA":
+                    totals["bad_signature"] += 1
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                payload = {}
+            print(f"{time.strftime('%H:%M:%S')} {self.path} {self.headers.get('X-Webhook-Event')} "
+                  f"tarea={payload.get('task_id')} entrega={delivery_id} intento={attempt} "
+                  f"firma={signature} -> {status}", flush=True)
+
+            self.send_response(status)
+            if failed and options.retry_after is not None:
+                self.send_header("Retry-After", str(options.retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--secret", help="Secreto del webhook para verificar X-Webhook-Signature")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fracción de envíos que fallan")
+    parser.add_argument("--fail-status", type=int, default=503, help="Código de respuesta de los fallos")
+    parser.add_argument("--retry-after", type=int, help="Segundos de Retry-After en las respuestas fallidas")
+    parser.add_argument("--delay", type=float, default=0.0, help="Segundos que tarda cada respuesta")
+    options = parser.parse_args()
+
+    server = ThreadingHTTPServer((options.host, options.port), make_handler(options))
+    # Terminar igual con SIGTERM que con Ctrl+C para mostrar el resumen también en segundo plano
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"Escuchando en http://{options.host}:{options.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\nrespuestas: {dict(totals)}")
+        print(f"entregas distintas: {len(deliveries)}, repetidas: {sum(1 for count in deliveries.values() if count > 1)}")
+        print(f"máximo de peticiones simultáneas por ruta: {dict(max_in_flight)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Mapas de bits de actividad diaria: un bit por día del año.
+
+Cada año se guarda en el documento de estadísticas como palabras de 64 bits
+(activity.<año>.w0 ... w5) para poder activar un día de forma atómica con $bit.
+"""
+from datetime import date, timedelta
+from bson.int64 import Int64
+
+WORD_BITS = 64
+WORDS_PER_YEAR = 6  # 366 días caben en 6 palabras de 64 bits
+WORD_MASK = (1 << WORD_BITS) - 1
+
+def day_index(day: date) -> int:
+    """Posición del día dentro de su año (0 = 1 de enero)"""
+    return day.timetuple().tm_yday - 1
+
+def to_signed(value: int) -> Int64:
+    """Convierte una palabra sin signo en el Int64 con signo que guarda MongoDB"""
+    value &= WORD_MASK
+    if value >= 1 << (WORD_BITS - 1):
+        value -= 1 << WORD_BITS
+    return Int64(value)
+
+def bit_update(day: date) -> dict:
+    """Operación $bit que marca el día como activo"""
+    index = day_index(day)
+    field = f"activity.{day.year}.w{index // WORD_BITS}"
+    return {field: {"or": to_signed(1 << (index % WORD_BITS))}}
+
+def year_bitmap(document: dict, year: int) -> int:
+    """Reconstruye como entero el mapa de bits de un año"""
+    words = (document or {}).get("activity", {}).get(str(year), {})
+    bitmap = 0
+    for word in range(WORDS_PER_YEAR):
+        bitmap |= (int(words.get(f"w{word}", 0)) & WORD_MASK) << (word * WORD_BITS)
+    return bitmap
+
+def year_words(bitmap: int) -> dict:
+    """Divide el mapa de bits de un año en las palabras que se guardan en MongoDB"""
+    return {
+        f"w{word}": to_signed(bitmap >> (word * WORD_BITS))
+        for word in range(WORDS_PER_YEAR)
+        if (bitmap >> (word * WORD_BITS)) & WORD_MASK
+    }
+
+def activity_from_days(days: list) -> dict:
+    """Construye el campo activity a partir de fechas YYYY-MM-DD"""
+    bitmaps = {}
+    for value in days:
+        day = date.fromisoformat(value)
+        bitmaps[day.year] = bitmaps.get(day.year, 0) | (1 << day_index(day))
+    return {str(year): year_words(bitmap) for year, bitmap in bitmaps.items()}
+
+def merge_activity(left: dict, right: dict) -> dict:
+    """Une dos campos activity con un OR bit a bit por año"""
+    merged = {}
+    for year in set(left or {}) | set(right or {}):
+        bitmap = year_bitmap({"activity": left or {}}, year) | year_bitmap({"activity": right or {}}, year)
+        merged[str(year)] = year_words(bitmap)
+    return merged
+
+def trailing_ones(bitmap: int, position: int) -> int:
+    """Cuenta los bits a uno consecutivos desde position hacia el bit 0"""
+    # Invertir y aislar la parte baja: el primer cero marca el final de la racha
+    window = bitmap & ((1 << (position + 1)) - 1)
+    zeros = ~window & ((1 << (position + 1)) - 1)
+    if not zeros:
+        return position + 1
+    return position - zeros.bit_length() + 1
+
+def current_streak(document: dict, today: date) -> int:
+    """Días consecutivos con actividad terminando hoy, cruzando años si hace falta"""
+    streak = 0
+    year = today.year
+    position = day_index(today)
+    while True:
+        bitmap = year_bitmap(document, year)
+        run = trailing_ones(bitmap, position)
+        streak += run
+        if run <= position:
+            return streak
+        year -= 1
+        position = day_index(date(year, 12, 31))
+
+def longest_run(bitmap: int) -> int:
+    """Longitud de la racha más larga: cada AND con el desplazamiento acorta todas las rachas en uno"""
+    length = 0
+    while bitmap:
+        bitmap &= bitmap >> 1
+        length += 1
+    return length
+
+def active_days(bitmap: int, year: int) -> list:
+    """Lista de fechas activas de un año"""
+    start = date(year, 1, 1)
+    days = []
+    while bitmap:
+        lowest = bitmap & -bitmap
+        days.append(start + timedelta(days=lowest.bit_length() - 1))
+        bitmap ^= lowest
+    return days
+
+def to_bytes(bitmap: int) -> bytes:
+    """Empaqueta el mapa de bits de un año en 46 bytes (bit 0 = 1 de enero)"""
+    return bitmap.to_bytes(46, "little")
@@ -0,0 +1,109 @@
+"""Cálculos con NumPy de las distribuciones de tiempos de completado.
+
+Funciones puras sin acceso a la base de datos: se ejecutan tanto en el bucle de
+eventos como en el pool de procesos, y los procesos del pool solo importan este
+módulo, no el cliente de MongoDB.
+"""
+import bson
+import numpy as np
+
+PERCENTILES = [50, 75, 90, 95, 99]
+# Límites de los intervalos del histograma, en horas
+HISTOGRAM_EDGES = np.array([0, 1, 4, 8, 24, 48, 72, 168, 336, 720, np.inf])
+PRIORITY_CODES = {"alta": 0, "high": 0, "media": 1, "medium": 1, "baja": 2, "low": 2}
+PRIORITY_NAMES = ["alta", "media", "baja", "sin_prioridad"]
+NO_PRIORITY = 3
+
+def arrays_from_docs(docs: list) -> tuple:
+    """Convierte un lote de documentos proyectados en arrays compactos"""
+    return (
+        np.fromiter((doc["duration"] for doc in docs), dtype=np.float32, count=len(docs)),
+        np.fromiter((PRIORITY_CODES.get(doc.get("priority"), NO_PRIORITY) for doc in docs), dtype=np.int8, count=len(docs)),
+        np.fromiter((doc.get("assigned_to") or 0 for doc in docs), dtype=np.int32, count=len(docs))
+    )
+
+def arrays_from_bson(raw: bytes) -> tuple:
+    """Decodifica un lote de documentos en BSON y lo convierte en arrays; se ejecuta en el pool de procesos"""
+    return arrays_from_docs(bson.decode_all(raw))
+
+class TaskArrays:
+    """Acumula por lotes las columnas proyectadas de las tareas completadas como arrays de NumPy"""
+
+    def __init__(self):
+        self._durations = []
+        self._priorities = []
+        self._assignees = []
+
+    def add_batch(self, docs: list):
+        """Convierte un lote de documentos en arrays compactos"""
+        if docs:
+            self.add_arrays(*arrays_from_docs(docs))
+
+    def add_arrays(self, durations: np.ndarray, priorities: np.ndarray, assignees: np.ndarray):
+        """Añade un lote ya convertido en arrays"""
+        if durations.size:
+            self._durations.append(durations)
+            self._priorities.append(priorities)
+            self._assignees.append(assignees)
+
+    def finish(self):
+        """Devuelve (duraciones en horas, códigos de prioridad, asignados)"""
+        if not self._durations:
+            return np.empty(0, np.float32), np.empty(0, np.int8), np.empty(0, np.int32)
+        arrays = (
+            np.concatenate(self._durations),
+            np.concatenate(self._priorities),
+            np.concatenate(self._assignees)
+        )
+        self._durations, self._priorities, self._assignees = [], [], []
+        return arrays
+
+def summarize(durations: np.ndarray) -> dict:
+    """Percentiles, media e histograma de un array de duraciones en horas"""
+    if durations.size == 0:
+        return {
+            "count": 0,
+            "mean": 0.0,
+            "percentiles": {f"p{p}": 0.0 for p in PERCENTILES},
+            "histogram": [0] * (len(HISTOGRAM_EDGES) - 1)
+        }
+    values = np.percentile(durations, PERCENTILES)
+    counts, _ = np.histogram(durations, bins=HISTOGRAM_EDGES)
+    return {
+        "count": int(durations.size),
+        "mean": float(durations.mean(dtype=np.float64)),
+        "percentiles": {f"p{p}": float(v) for p, v in zip(PERCENTILES, values)},
+        "histogram": counts.tolist()
+    }
+
+def assignee_medians(durations: np.ndarray, assignees: np.ndarray, limit: int = 50) -> list:
+    """Número de tareas y mediana por asignado, para los asignados con más tareas"""
+    if durations.size == 0:
+        return []
+    order = np.argsort(assignees, kind="stable")
+    sorted_assignees = assignees[order]
+    sorted_durations = durations[order]
+    users, starts, counts = np.unique(sorted_assignees, return_index=True, return_counts=True)
+    top = np.argsort(counts)[::-1][:limit]
+    return [
+        {
+            "assigned_to": int(users[i]) or None,
+            "count": int(counts[i]),
+            "p50": float(np.median(sorted_durations[starts[i]:starts[i] + counts[i]]))
+        }
+        for i in top
+    ]
+
+def compute_distribution(durations: np.ndarray, priorities: np.ndarray, assignees: np.ndarray) -> dict:
+    """Distribución de tiempos de completado total, por prioridad y por asignado"""
+    by_priority = {}
+    for code, name in enumerate(PRIORITY_NAMES):
+        selected = durations[priorities == code]
+        if selected.size:
+            by_priority[name] = summarize(selected)
+    return {
+        "overall": summarize(durations),
+        "by_priority": by_priority,
+        "by_assignee": assignee_medians(durations, assignees),
+        "histogram_edges_hours": [float(edge) if np.isfinite(edge) else None for edge in HISTOGRAM_EDGES]
+    }
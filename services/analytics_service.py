@@ -0,0 +1,74 @@
+from database.database import get_database
+from models.model_task import COMPLETED_STATUSES
+from services.process_pool import run_in_process
+from services.analytics_arrays import TaskArrays, arrays_from_bson, compute_distribution
+import logging
+import os
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50000
+# Lotes del cursor de al menos este tamaño en BSON se decodifican en el pool de procesos
+ANALYTICS_DECODE_OFFLOAD_MIN_BYTES = int(os.getenv("ANALYTICS_DECODE_OFFLOAD_MIN_BYTES", str(1024 * 1024)))
+# Distribuciones de al menos este número de tareas se calculan en el pool de procesos
+ANALYTICS_OFFLOAD_MIN_TASKS = int(os.getenv("ANALYTICS_OFFLOAD_MIN_TASKS", "200000"))
+
+class AnalyticsService:
+    @staticmethod
+    def scope_filter(scope: str, scope_id: int = None) -> dict:
+        """Filtro de las tareas de un usuario, una columna o toda la organización"""
+        if scope == "org":
+            return {}
+        if scope_id is None:
+            raise ValueError(f"El ámbito {scope} necesita un id")
+        if scope == "user":
+            return {"$or": [{"assigned_to": scope_id}, {"created_by": scope_id}]}
+        if scope == "column":
+            return {"column_id": scope_id}
+        raise ValueError(f"Ámbito no válido: {scope}")
+
+    @staticmethod
+    async def load_completion_arrays(match: dict, batch_size: int = BATCH_SIZE):
+        """Lee por lotes solo las columnas necesarias de las tareas completadas"""
+        db = await get_database()
+        completed = {
+            **match,
+            "status": {"$in": COMPLETED_STATUSES},
+            "completed_at": {"$type": "date"},
+            "created_at": {"$type": "date"}
+        }
+        pipeline = [
+            {"$match": completed},
+            {"$unionWith": {"coll": "tasks_archive", "pipeline": [{"$match": completed}]}},
+            # Calcular la duración en el servidor para transferir un número en lugar de dos fechas
+            {"$project": {
+                "_id": 0,
+                "duration": {"$divide": [{"$subtract": ["$completed_at", "$created_at"]}, 3600000]},
+                "priority": 1,
+                "assigned_to": 1
+            }}
+        ]
+        # Los lotes llegan sin decodificar: decodificar millones de documentos es lo
+        # que más CPU cuesta, así que los lotes grandes se decodifican en el pool
+        arrays = TaskArrays()
+        async for raw in db.tasks.aggregate_raw_batches(pipeline, batchSize=batch_size, allowDiskUse=True):
+            if len(raw) >= ANALYTICS_DECODE_OFFLOAD_MIN_BYTES:
+                arrays.add_arrays(*await run_in_process(arrays_from_bson, raw))
+            else:
+                arrays.add_arrays(*arrays_from_bson(raw))
+        return arrays.finish()
+
+    @staticmethod
+    async def completion_time_distribution(scope: str, scope_id: int = None) -> dict:
+        """Percentiles, histograma y desglose por prioridad de los tiempos de completado"""
+        match = AnalyticsService.scope_filter(scope, scope_id)
+        durations, priorities, assignees = await AnalyticsService.load_completion_arrays(match)
+        logger.info(f"Computing completion time distribution for {scope} {scope_id} over {durations.size} tasks")
+        if durations.size >= ANALYTICS_OFFLOAD_MIN_TASKS:
+            # Los arrays se envían al proceso como bloques contiguos, sin convertirlos a objetos
+            distribution = await run_in_process(compute_distribution, durations, priorities, assignees)
+        else:
+            distribution = compute_distribution(durations, priorities, assignees)
+        return {"scope": scope, "id": scope_id, **distribution}
@@ -0,0 +1,238 @@
+"""Historial de cambios de las tareas con escritura diferida.
+
+Los servicios calculan qué campos cambió cada escritura y dejan el registro en
+un búfer en memoria en lugar de insertarlo en la misma petición. Un trabajo en
+segundo plano vuelca el búfer con insert_many cuando alcanza el tamaño de lote
+o pasa el intervalo máximo, y al apagar la aplicación se vuelca lo que quede.
+Si la base de datos no da abasto y el búfer se llena, las escrituras esperan
+a que haya sitio (contrapresión) y solo se descartan registros si la espera
+supera el límite; las métricas permiten vigilar ambas situaciones. Una caída
+del proceso pierde como mucho los registros que aún no se habían volcado.
+"""
+from database.database import collection_task_audit, collection_tasks, collection_tasks_archive
+from bson import ObjectId
+from collections import deque
+from itertools import islice
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+import asyncio
+import logging
+import os
+import time
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AUDIT_BUFFER_MAX_SIZE = int(os.getenv("AUDIT_BUFFER_MAX_SIZE", "10000"))
+AUDIT_FLUSH_BATCH_SIZE = int(os.getenv("AUDIT_FLUSH_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "2"))
+AUDIT_BACKPRESSURE_TIMEOUT_SECONDS = float(os.getenv("AUDIT_BACKPRESSURE_TIMEOUT_SECONDS", "5"))
+AUDIT_RETRY_SECONDS = 1
+AUDIT_HISTORY_MAX_LIMIT = 200
+# Campos de la tarea cuyo cambio queda registrado
+AUDITED_FIELDS = [
+    "title", "description", "due_date", "priority", "status",
+    "column_id", "board_id", "assigned_to", "created_by", "labels"
+]
+DUPLICATE_KEY_ERROR = 11000
+
+def field_changes(before: dict, after: dict) -> list:
+    """Diferencias campo a campo entre dos versiones de una tarea"""
+    before, after = before or {}, after or {}
+    return [
+        {"field": field, "old": before.get(field), "new": after.get(field)}
+        for field in AUDITED_FIELDS
+        if before.get(field) != after.get(field)
+    ]
+
+class AuditBuffer:
+    def __init__(self, max_size: int, batch_size: int):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.entries = deque()
+        self.flush_lock = asyncio.Lock()
+        self.flush_requested = asyncio.Event()
+        self.space_available = asyncio.Event()
+        self.space_available.set()
+        self.metrics = {
+            "recorded": 0,
+            "flushed": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "dropped": 0,
+            "backpressure_waits": 0,
+            "backpressure_wait_seconds": 0.0,
+            "high_water_mark": 0,
+            "last_flush_at": None,
+            "last_flush_seconds": None,
+            "last_error": None
+        }
+
+    async def record(self, entry: dict):
+        """Encola un registro; solo espera si el búfer está lleno"""
+        if len(self.entries) >= self.max_size:
+            self.metrics["backpressure_waits"] += 1
+            self.flush_requested.set()
+            started = time.monotonic()
+            try:
+                while len(self.entries) >= self.max_size:
+                    self.space_available.clear()
+                    remaining = AUDIT_BACKPRESSURE_TIMEOUT_SECONDS - (time.monotonic() - started)
+                    await asyncio.wait_for(self.space_available.wait(), timeout=max(0.0, remaining))
+            except asyncio.TimeoutError:
+                self.metrics["dropped"] += 1
+                logger.error(f"Audit buffer full, dropping {entry['action']} entry for task {entry['task_id']}")
+                return
+            finally:
+                self.metrics["backpressure_wait_seconds"] += time.monotonic() - started
+
+        # El _id se asigna aquí para que reintentar un volcado no duplique registros
+        entry.setdefault("_id", ObjectId())
+        self.entries.append(entry)
+        self.metrics["recorded"] += 1
+        self.metrics["high_water_mark"] = max(self.metrics["high_water_mark"], len(self.entries))
+        if len(self.entries) >= self.batch_size:
+            self.flush_requested.set()
+
+    async def flush(self) -> int:
+        """Vuelca el búfer por lotes; los registros solo salen de él cuando se insertaron"""
+        flushed = 0
+        async with self.flush_lock:
+            while self.entries:
+                batch = list(islice(self.entries, self.batch_size))
+                started = time.monotonic()
+                try:
+                    await collection_task_audit.insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    # Los duplicados son registros de un volcado anterior interrumpido
+                    if any(error.get("code") != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+                        self._flush_failed(e)
+                        raise
+                except Exception as e:
+                    self._flush_failed(e)
+                    raise
+                for _ in batch:
+                    self.entries.popleft()
+                flushed += len(batch)
+                self.metrics["flushed"] += len(batch)
+                self.metrics["flushes"] += 1
+                self.metrics["last_flush_at"] = datetime.utcnow()
+                self.metrics["last_flush_seconds"] = round(time.monotonic() - started, 4)
+                self.space_available.set()
+        return flushed
+
+    def _flush_failed(self, error: Exception):
+        self.metrics["failed_flushes"] += 1
+        self.metrics["last_error"] = str(error)
+        logger.error(f"Error flushing audit buffer: {str(error)}")
+
+    def pending(self, task_id: int) -> list:
+        """Registros de una tarea que aún no se volcaron, del más reciente al más antiguo"""
+        return [entry for entry in reversed(self.entries) if entry["task_id"] == task_id]
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self.entries),
+            "max_size": self.max_size,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": AUDIT_FLUSH_INTERVAL_SECONDS,
+            **self.metrics,
+            "backpressure_wait_seconds": round(self.metrics["backpressure_wait_seconds"], 3)
+        }
+
+audit_buffer = AuditBuffer(AUDIT_BUFFER_MAX_SIZE, AUDIT_FLUSH_BATCH_SIZE)
+
+async def record_task_change(action: str, before: dict, after: dict, user_id: int = None):
+    """Registra en el búfer los campos que cambió una escritura de tarea"""
+    changes = field_changes(before, after)
+    if not changes and action not in ("create", "delete"):
+        return
+    task = after or before
+    await audit_buffer.record({
+        "task_id": task["id"],
+        "board_id": task.get("board_id"),
+        "user_id": user_id,
+        "action": action,
+        "changes": changes,
+        "ts": (after or {}).get("updated_at") or datetime.utcnow()
+    })
+
+def serialize_entry(entry: dict, pending: bool = False) -> dict:
+    return {
+        "id": str(entry["_id"]),
+        "task_id": entry["task_id"],
+        "user_id": entry.get("user_id"),
+        "action": entry["action"],
+        "changes": entry.get("changes", []),
+        "ts": entry["ts"],
+        "pending": pending
+    }
+
+async def check_history_access(task_id: int, user_id: int, user_role: str):
+    """Solo los admins y los participantes de la tarea ven su historial"""
+    if user_role == "admin":
+        return
+    participants = {"_id": 0, "assigned_to": 1, "created_by": 1}
+    task = await collection_tasks.find_one({"id": task_id}, participants)
+    if task is None:
+        task = await collection_tasks_archive.find_one({"id": task_id}, participants)
+    if task is None:
+        # Las tareas eliminadas solo las pueden auditar los admins
+        raise ValueError(f"Tarea con id {task_id} no encontrada")
+    if user_id not in (task.get("assigned_to"), task.get("created_by")):
+        raise PermissionError("No tienes permiso para ver el historial de esta tarea")
+
+async def get_task_history(task_id: int, user_id: int, user_role: str, before: str = None, limit: int = 50) -> dict:
+    """Historial de una tarea del cambio más reciente al más antiguo, paginado por cursor"""
+    await check_history_access(task_id, user_id, user_role)
+    query = {"task_id": task_id}
+    entries = []
+    pending_ids = set()
+    if before:
+        query["_id"] = {"$lt": ObjectId(before)}
+    else:
+        # La primera página incluye lo que este proceso aún no ha volcado
+        entries = [serialize_entry(entry, pending=True) for entry in audit_buffer.pending(task_id)][:limit]
+        pending_ids = {entry["id"] for entry in entries}
+
+    if len(entries) < limit:
+        # Un registro puede estar en el búfer y ya insertado si hay un volcado en curso
+        async for entry in collection_task_audit.find(query).sort("_id", -1).limit(limit):
+            if str(entry["_id"]) in pending_ids:
+                continue
+            entries.append(serialize_entry(entry))
+            if len(entries) == limit:
+                break
+    return {
+        "task_id": task_id,
+        "entries": entries,
+        "next_cursor": entries[-1]["id"] if len(entries) == limit else None
+    }
+
+def get_audit_metrics() -> dict:
+    return audit_buffer.stats()
+
+async def flush_audit_buffer():
+    """Vuelca lo que quede en el búfer; se llama al apagar la aplicación"""
+    try:
+        flushed = await audit_buffer.flush()
+        logger.info(f"Flushed {flushed} audit entries on shutdown")
+    except Exception as e:
+        logger.error(f"Audit entries lost on shutdown: {len(audit_buffer.entries)} ({str(e)})")
+
+async def run_audit_flusher():
+    """Vuelca el búfer al llenarse un lote o, como mucho, cada AUDIT_FLUSH_INTERVAL_SECONDS"""
+    while True:
+        try:
+            await asyncio.wait_for(audit_buffer.flush_requested.wait(), timeout=AUDIT_FLUSH_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        audit_buffer.flush_requested.clear()
+        try:
+            await audit_buffer.flush()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Los registros siguen en el búfer; se reintenta tras una pausa
+            await asyncio.sleep(AUDIT_RETRY_SECONDS)
@@ -0,0 +1,140 @@
+from collections import OrderedDict
+import asyncio
+import logging
+import os
+import time
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATISTICS_CACHE_TTL_SECONDS = float(os.getenv("STATISTICS_CACHE_TTL_SECONDS", "30"))
+STATISTICS_CACHE_STALE_SECONDS = float(os.getenv("STATISTICS_CACHE_STALE_SECONDS", "300"))
+STATISTICS_CACHE_MAX_ENTRIES = int(os.getenv("STATISTICS_CACHE_MAX_ENTRIES", "2048"))
+
+HIT = "HIT"
+MISS = "MISS"
+STALE = "STALE"
+
+class ResultCache:
+    """Caché LRU de resultados con coalescencia de fallos concurrentes y revalidación en segundo plano.
+
+    Mientras un resultado tiene menos de ttl segundos se sirve directamente. Hasta
+    ttl + stale_ttl se sirve el valor antiguo y se recalcula en segundo plano. Si
+    varias peticiones fallan a la vez sobre la misma clave, solo una calcula.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # clave -> (valor, instante de cálculo)
+        self._inflight = {}  # clave -> futuro del cálculo en curso
+        self._refreshes = set()
+
+    def _store(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _compute(self, key, compute):
+        """Calcula el valor una sola vez aunque lo pidan varias peticiones a la vez"""
+        future = self._inflight.get(key)
+        if future is not None:
+            # wait no cancela el futuro compartido si se cancela esta petición
+            await asyncio.wait({future})
+            if future.cancelled():
+                # Se canceló la petición que calculaba: otra toma el relevo
+                return await self._compute(key, compute)
+            return future.result()
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except Exception as e:
+            future.set_exception(e)
+            # Marcar la excepción como recuperada si nadie más la espera
+            future.exception()
+            raise
+        else:
+            # Un resultado calculado antes de invalidar la clave ya no se guarda
+            if self._inflight.get(key) is future:
+                self._store(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            # Si se cancela al líder, los que esperan el futuro no deben quedarse colgados
+            if not future.done():
+                future.cancel()
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def _refresh(self, key, compute):
+        try:
+            await self._compute(key, compute)
+        except Exception as e:
+            logger.error(f"Background refresh of {key} failed: {str(e)}")
+
+    async def get(self, key, compute):
+        """Devuelve (valor, antigüedad en segundos, estado HIT/STALE/MISS)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, computed_at = entry
+            age = time.monotonic() - computed_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                return value, age, HIT
+            if age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                if key not in self._inflight:
+                    task = asyncio.create_task(self._refresh(key, compute))
+                    self._refreshes.add(task)
+                    task.add_done_callback(self._refreshes.discard)
+                return value, age, STALE
+
+        value = await self._compute(key, compute)
+        return value, 0.0, MISS
+
+    def clear(self):
+        """Descarta todos los resultados guardados"""
+        self._entries.clear()
+
+    def invalidate(self, matches):
+        """Descarta los resultados cuyas claves cumplen matches, incluidos los que se están calculando"""
+        for key in [key for key in self._entries if matches(key)]:
+            del self._entries[key]
+        for key in [key for key in self._inflight if matches(key)]:
+            del self._inflight[key]
+
+    def headers(self, age: float, state: str) -> dict:
+        """Cabeceras que indican al cliente la frescura del resultado"""
+        return {
+            "Age": str(int(age)),
+            "Cache-Control": f"private, max-age={max(0, int(self.ttl - age))}",
+            "X-Cache": state
+        }
+
+statistics_cache = ResultCache(
+    STATISTICS_CACHE_TTL_SECONDS,
+    STATISTICS_CACHE_STALE_SECONDS,
+    STATISTICS_CACHE_MAX_ENTRIES
+)
+
+def statistics_key_users(key: tuple) -> set:
+    """Usuarios de los que depende una clave de statistics_cache (ver routes/statistics_route.py)"""
+    kind = key[0]
+    if kind in ("user", "activity"):
+        return {str(key[1])}
+    if kind == "rollups":
+        return {str(user_id) for user_id in key[1]}
+    if kind == "completion-times" and key[1] == "user":
+        return {str(key[2])}
+    return set()
+
+def invalidate_user_statistics(user_ids):
+    """Descarta los resultados guardados de los usuarios cuyas tareas acaban de cambiar"""
+    user_ids = {str(user_id) for user_id in user_ids}
+    if user_ids:
+        statistics_cache.invalidate(lambda key: not statistics_key_users(key).isdisjoint(user_ids))
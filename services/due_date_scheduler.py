@@ -0,0 +1,243 @@
+"""Planificador de vencimientos de tareas.
+
+Mantiene en un montículo (heap) ordenado por instante de disparo los avisos de
+las tareas que vencen pronto. Los avisos se cargan por ventanas con consultas
+por rango sobre el índice de due_date, así que en memoria solo están las
+tareas de la ventana actual. Al dispararse, las tareas vencidas se marcan con
+overdue en lotes y se registran los eventos task.due_soon y task.overdue.
+
+Cada proceso de la API ejecuta su propio planificador: las escrituras filtran
+por el estado esperado y los eventos tienen un índice único, así que disparar
+el mismo aviso en dos procesos no tiene efecto.
+"""
+from database.database import collection_tasks, collection_task_due_events
+from models.model_task import COMPLETED_STATUSES
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError
+import asyncio
+import heapq
+import logging
+import os
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DUE_SOON_HOURS = int(os.getenv("DUE_SOON_HOURS", "24"))
+DUE_SCHEDULER_WINDOW_MINUTES = int(os.getenv("DUE_SCHEDULER_WINDOW_MINUTES", "10"))
+DUE_BATCH_SIZE = 500
+MAX_IDLE_SECONDS = 60
+DUE_SOON = "task.due_soon"
+OVERDUE = "task.overdue"
+DUE_PROJECTION = {"_id": 0, "id": 1, "due_date": 1, "status": 1, "board_id": 1, "assigned_to": 1, "created_by": 1}
+DUPLICATE_KEY_ERROR = 11000
+
+def open_filter() -> dict:
+    return {"status": {"$nin": COMPLETED_STATUSES}}
+
+def due_date_offset(kind: str) -> timedelta:
+    """Antelación con la que se dispara cada tipo de aviso respecto al vencimiento"""
+    return timedelta(hours=DUE_SOON_HOURS) if kind == DUE_SOON else timedelta(0)
+
+def fire_moment(kind: str, due_date: datetime) -> datetime:
+    return due_date - due_date_offset(kind)
+
+async def emit_due_events(kind: str, tasks: list, now: datetime):
+    """Registra un evento por tarea; los duplicados de otro proceso se descartan"""
+    if not tasks:
+        return
+    events = [
+        {
+            "type": kind,
+            "task_id": task["id"],
+            "board_id": task.get("board_id"),
+            "users": sorted({task.get("assigned_to"), task.get("created_by")} - {None}),
+            "due_date": task["due_date"],
+            "created_at": now
+        }
+        for task in tasks
+    ]
+    try:
+        await collection_task_due_events.insert_many(events, ordered=False)
+    except BulkWriteError as e:
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+            raise
+    logger.info(f"Emitted {len(events)} {kind} events")
+
+async def mark_overdue(task_ids: list, now: datetime) -> int:
+    """Marca como vencidas en una sola escritura las tareas abiertas del lote que siguen sin marcar"""
+    query = {
+        "id": {"$in": task_ids},
+        "due_date": {"$lte": now},
+        "overdue": {"$ne": True},
+        **open_filter()
+    }
+    tasks = await collection_tasks.find(query, DUE_PROJECTION).to_list(None)
+    if not tasks:
+        return 0
+    query["id"] = {"$in": [task["id"] for task in tasks]}
+    # overdue se deriva de due_date: no cambia sync_seq, los clientes pueden calcularlo
+    await collection_tasks.update_many(query, {"$set": {"overdue": True}})
+    await emit_due_events(OVERDUE, tasks, now)
+    return len(tasks)
+
+class DueDateScheduler:
+    def __init__(self):
+        self.heap = []  # (instante de disparo, tipo, id de la tarea, vencimiento)
+        self.due_dates = {}  # id -> vencimiento de las tareas con avisos en el montículo
+        self.horizon = None  # los avisos anteriores a este instante ya están cargados
+        self.wakeup = asyncio.Event()
+
+    def _push(self, kind: str, task_id: int, due_date: datetime):
+        heapq.heappush(self.heap, (fire_moment(kind, due_date), kind, task_id, due_date))
+
+    def track(self, task: dict, now: datetime = None):
+        """Actualiza los avisos de una tarea tras una escritura; None o una tarea cerrada los cancela"""
+        if self.horizon is None or not task or task.get("id") is None:
+            return
+        task_id = task["id"]
+        due_date = task.get("due_date")
+        if due_date is None or task.get("status") in COMPLETED_STATUSES:
+            # Los avisos encolados se descartan al salir porque ya no están en due_dates
+            self.due_dates.pop(task_id, None)
+            return
+        if self.due_dates.get(task_id) == due_date:
+            return
+        self.due_dates.pop(task_id, None)
+        now = now or datetime.utcnow()
+        kinds = [kind for kind in (DUE_SOON, OVERDUE) if fire_moment(kind, due_date) < self.horizon]
+        if due_date <= now:
+            # Ya vencida: solo falta marcarla
+            kinds = [OVERDUE]
+        if not kinds:
+            return
+        self.due_dates[task_id] = due_date
+        for kind in kinds:
+            self._push(kind, task_id, due_date)
+        if self.heap[0][2] == task_id:
+            # El nuevo aviso es el primero: despertar al planificador para que no duerma de más
+            self.wakeup.set()
+
+    async def _load_range(self, kind: str, start: datetime, end: datetime):
+        """Carga los avisos de un tipo cuyo instante de disparo está en [start, end)"""
+        offset = due_date_offset(kind)
+        cursor = collection_tasks.find(
+            {"due_date": {"$gte": start + offset, "$lt": end + offset}, **open_filter()},
+            DUE_PROJECTION
+        ).sort("due_date", 1).batch_size(DUE_BATCH_SIZE)
+        loaded = 0
+        async for task in cursor:
+            self.due_dates[task["id"]] = task["due_date"]
+            self._push(kind, task["id"], task["due_date"])
+            loaded += 1
+        return loaded
+
+    async def load_window(self, now: datetime):
+        """Carga la siguiente ventana de avisos, contigua a la anterior"""
+        start = self.horizon or now
+        end = now + timedelta(minutes=DUE_SCHEDULER_WINDOW_MINUTES)
+        if self.horizon is None:
+            # Al arrancar, los avisos de "vence pronto" que debieron dispararse se emiten ya
+            loaded = await self._load_range(DUE_SOON, now - timedelta(hours=DUE_SOON_HOURS), end)
+        else:
+            loaded = await self._load_range(DUE_SOON, start, end)
+        loaded += await self._load_range(OVERDUE, start, end)
+        self.horizon = end
+        if loaded:
+            logger.info(f"Loaded {loaded} due-date reminders until {end.isoformat()}")
+
+    async def catch_up(self, now: datetime):
+        """Marca las tareas que vencieron mientras ningún planificador estaba en marcha"""
+        batch = []
+        marked = 0
+        async for task in collection_tasks.find(
+            {"due_date": {"$lte": now}, "overdue": {"$ne": True}, **open_filter()},
+            {"_id": 0, "id": 1}
+        ).batch_size(DUE_BATCH_SIZE):
+            batch.append(task["id"])
+            if len(batch) == DUE_BATCH_SIZE:
+                marked += await mark_overdue(batch, now)
+                batch = []
+        if batch:
+            marked += await mark_overdue(batch, now)
+        if marked:
+            logger.info(f"Marked {marked} tasks overdue on startup")
+
+    async def fire_due(self, now: datetime):
+        """Dispara en lotes los avisos cuyo instante ya llegó"""
+        while self.heap and self.heap[0][0] <= now:
+            batches = {DUE_SOON: {}, OVERDUE: {}}
+            while self.heap and self.heap[0][0] <= now and len(batches[OVERDUE]) + len(batches[DUE_SOON]) < DUE_BATCH_SIZE:
+                _, kind, task_id, due_date = heapq.heappop(self.heap)
+                # Descartar los avisos de vencimientos que cambiaron después de encolarlos
+                if self.due_dates.get(task_id) == due_date:
+                    batches[kind][task_id] = due_date
+
+            try:
+                if batches[DUE_SOON]:
+                    tasks = await collection_tasks.find(
+                        {"id": {"$in": list(batches[DUE_SOON])}, "due_date": {"$gt": now}, **open_filter()},
+                        DUE_PROJECTION
+                    ).to_list(None)
+                    await emit_due_events(
+                        DUE_SOON,
+                        [task for task in tasks if batches[DUE_SOON].get(task["id"]) == task["due_date"]],
+                        now
+                    )
+                if batches[OVERDUE]:
+                    await mark_overdue(list(batches[OVERDUE]), now)
+            except Exception:
+                # Devolver el lote al montículo para reintentarlo en la siguiente vuelta
+                for kind, entries in batches.items():
+                    for task_id, due_date in entries.items():
+                        self._push(kind, task_id, due_date)
+                raise
+            for task_id in batches[OVERDUE]:
+                self.due_dates.pop(task_id, None)
+
+    def next_delay(self, now: datetime) -> float:
+        """Segundos hasta el próximo aviso o hasta tener que cargar la ventana siguiente"""
+        wake_at = self.horizon - timedelta(minutes=DUE_SCHEDULER_WINDOW_MINUTES) / 2
+        if self.heap:
+            wake_at = min(wake_at, self.heap[0][0])
+        return min(MAX_IDLE_SECONDS, max(0.0, (wake_at - now).total_seconds()))
+
+due_date_scheduler = DueDateScheduler()
+
+def schedule_task(task: dict):
+    """Avisa al planificador de una tarea creada, actualizada o eliminada"""
+    due_date_scheduler.track(task)
+
+def unschedule_task(task_id: int):
+    due_date_scheduler.track({"id": task_id})
+
+async def run_due_date_scheduler():
+    """Marca las tareas vencidas y emite los avisos a su hora, cargando los vencimientos por ventanas"""
+    scheduler = due_date_scheduler
+    try:
+        # La primera ventana empieza donde termina la recuperación para no dejar huecos
+        now = datetime.utcnow()
+        await scheduler.catch_up(now)
+        await scheduler.load_window(now)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Due-date catch-up failed: {str(e)}")
+    while True:
+        # Limpiar antes de procesar para no perder los avisos encolados mientras tanto
+        scheduler.wakeup.clear()
+        delay = MAX_IDLE_SECONDS
+        try:
+            now = datetime.utcnow()
+            if scheduler.horizon is None or now + timedelta(minutes=DUE_SCHEDULER_WINDOW_MINUTES) / 2 >= scheduler.horizon:
+                await scheduler.load_window(now)
+            await scheduler.fire_due(now)
+            delay = scheduler.next_delay(datetime.utcnow())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Due-date scheduler failed: {str(e)}")
+        try:
+            await asyncio.wait_for(scheduler.wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
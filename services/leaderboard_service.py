@@ -0,0 +1,144 @@
+from datetime import datetime
+from bisect import bisect_left, insort
+from database.database import get_database
+from services.rollup_service import RollupService, bucket_start, next_bucket
+import asyncio
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_WINDOWS = ["week", "month"]
+
+class WindowLeaderboard:
+    """Clasificación de tareas completadas por usuario en el periodo actual.
+
+    Guarda la puntuación de cada usuario y una lista ordenada de (-puntuación, usuario),
+    así que el top N son los N primeros elementos. Al empezar un periodo nuevo la
+    clasificación se vacía sin volver a leer las tareas.
+    """
+
+    def __init__(self, granularity: str):
+        self.granularity = granularity
+        self.bucket = None
+        self.scores = {}
+        self._ranking = []
+
+    def rotate(self, now: datetime):
+        """Empieza un periodo vacío si now ya no pertenece al periodo actual"""
+        bucket = bucket_start(now, self.granularity)
+        if self.bucket is None or bucket > self.bucket:
+            if self.bucket is not None:
+                logger.info(f"Rotating {self.granularity} leaderboard to {bucket.date()}")
+            self.load(bucket, {})
+
+    def load(self, bucket: datetime, scores: dict):
+        """Sustituye la clasificación completa, por ejemplo al sembrarla desde los resúmenes"""
+        self.bucket = bucket
+        self.scores = {user_id: score for user_id, score in scores.items() if score > 0}
+        self._ranking = sorted((-score, user_id) for user_id, score in self.scores.items())
+
+    def add(self, user_id: int, delta: int):
+        """Suma delta a la puntuación de un usuario y lo recoloca en la clasificación"""
+        old = self.scores.get(user_id, 0)
+        if old:
+            index = bisect_left(self._ranking, (-old, user_id))
+            del self._ranking[index]
+        new = old + delta
+        if new > 0:
+            self.scores[user_id] = new
+            insort(self._ranking, (-new, user_id))
+        else:
+            self.scores.pop(user_id, None)
+
+    def top(self, limit: int) -> list:
+        """Los limit primeros usuarios como pares (usuario, puntuación)"""
+        return [(user_id, -score) for score, user_id in self._ranking[:limit]]
+
+leaderboards = {granularity: WindowLeaderboard(granularity) for granularity in LEADERBOARD_WINDOWS}
+
+class LeaderboardService:
+    @staticmethod
+    async def seed_leaderboards():
+        """Siembra las clasificaciones con una sola agregación sobre los resúmenes por periodo"""
+        db = await get_database()
+        now = datetime.utcnow()
+        buckets = {granularity: bucket_start(now, granularity) for granularity in LEADERBOARD_WINDOWS}
+        pipeline = [
+            {"$match": {
+                "$or": [
+                    {"granularity": granularity, "bucket": bucket}
+                    for granularity, bucket in buckets.items()
+                ],
+                "completed": {"$gt": 0}
+            }},
+            {"$project": {"_id": 0, "user_id": 1, "granularity": 1, "completed": 1}}
+        ]
+        scores = {granularity: {} for granularity in LEADERBOARD_WINDOWS}
+        async for rollup in db.statistics_rollups.aggregate(pipeline):
+            scores[rollup["granularity"]][rollup["user_id"]] = rollup["completed"]
+
+        for granularity, leaderboard in leaderboards.items():
+            leaderboard.load(buckets[granularity], scores[granularity])
+        logger.info(f"Seeded leaderboards: {', '.join(f'{g}={len(s)} users' for g, s in scores.items())}")
+
+    @staticmethod
+    def apply_task_change(before: dict, before_users: set, after: dict, after_users: set):
+        """Actualiza las clasificaciones con las tareas completadas en el periodo actual"""
+        before_completed = RollupService.completion_moment(before) if before else None
+        after_completed = RollupService.completion_moment(after) if after else None
+        if before_completed is None and after_completed is None:
+            return
+
+        now = datetime.utcnow()
+        for granularity, leaderboard in leaderboards.items():
+            leaderboard.rotate(now)
+            deltas = {}
+            if after_completed is not None and bucket_start(after_completed, granularity) == leaderboard.bucket:
+                for user_id in after_users:
+                    deltas[user_id] = deltas.get(user_id, 0) + 1
+            if before_completed is not None and bucket_start(before_completed, granularity) == leaderboard.bucket:
+                for user_id in before_users:
+                    deltas[user_id] = deltas.get(user_id, 0) - 1
+            for user_id, delta in deltas.items():
+                if delta:
+                    leaderboard.add(user_id, delta)
+
+    @staticmethod
+    async def get_leaderboard(window: str, limit: int) -> dict:
+        """Top de usuarios por tareas completadas en la semana o el mes actual"""
+        if window not in leaderboards:
+            raise ValueError(f"Periodo no válido: {window}")
+        leaderboard = leaderboards[window]
+        leaderboard.rotate(datetime.utcnow())
+        top = leaderboard.top(limit)
+
+        db = await get_database()
+        usernames = {}
+        if top:
+            async for user in db.users.find(
+                {"id": {"$in": [user_id for user_id, _ in top]}},
+                {"id": 1, "username": 1}
+            ):
+                usernames[user["id"]] = user.get("username")
+
+        return {
+            "window": window,
+            "start": leaderboard.bucket,
+            "end": next_bucket(leaderboard.bucket, window),
+            "entries": [
+                {"rank": rank, "user_id": user_id, "username": usernames.get(user_id), "completed": score}
+                for rank, (user_id, score) in enumerate(top, start=1)
+            ]
+        }
+
+    @staticmethod
+    async def run_leaderboard_refresher(interval_seconds: int):
+        """Vuelve a sembrar periódicamente para recoger las escrituras de otros procesos de la API"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await LeaderboardService.seed_leaderboards()
+            except Exception as e:
+                logger.error(f"Error refreshing leaderboards: {str(e)}")
@@ -0,0 +1,165 @@
+"""Bandeja de salida (outbox) de los eventos de tareas para los webhooks.
+
+Los eventos se añaden a pending_events en la misma escritura que cambia la
+tarea, así que un evento existe si y solo si el cambio se guardó, sin
+transacciones y sin llamar a terceros desde la petición. El relevo copia los
+eventos pendientes a webhook_outbox, una entrega por evento y webhook
+suscrito, y después los quita de la tarea. Cada entrega tiene un _id
+determinista, por lo que repetir un relevo interrumpido no duplica entregas.
+"""
+from database.database import collection_tasks, collection_webhooks, collection_webhook_outbox
+from models.model_board import DEFAULT_BOARD_ID
+from models.model_webhook import TASK_ASSIGNED, TASK_MOVED
+from bson import ObjectId
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RELAY_BATCH_SIZE = 200
+DUPLICATE_KEY_ERROR = 11000
+# Campos internos de la bandeja de salida que no se devuelven a los clientes
+OUTBOX_PROJECTION = {"pending_events": 0, "outbox_pending": 0}
+
+def strip_outbox(task: dict) -> dict:
+    """Quita de una tarea leída entera los campos internos de la bandeja de salida"""
+    if task:
+        for field in OUTBOX_PROJECTION:
+            task.pop(field, None)
+    return task
+
+def task_events(before: dict, after: dict, now: datetime, actor: int = None) -> list:
+    """Eventos que produce una escritura; after contiene solo los campos nuevos"""
+    before = before or {}
+    task_id = after.get("id", before.get("id"))
+    board_id = after.get("board_id", before.get("board_id", DEFAULT_BOARD_ID))
+    events = []
+
+    def event(kind: str, data: dict) -> dict:
+        return {
+            "id": str(ObjectId()),
+            "type": kind,
+            "task_id": task_id,
+            "board_id": board_id,
+            "actor": actor,
+            "data": data,
+            "occurred_at": now
+        }
+
+    if "assigned_to" in after and after["assigned_to"] is not None and after["assigned_to"] != before.get("assigned_to"):
+        events.append(event(TASK_ASSIGNED, {
+            "title": after.get("title", before.get("title")),
+            "from_user": before.get("assigned_to"),
+            "to_user": after["assigned_to"]
+        }))
+    if "column_id" in after and before and after["column_id"] != before.get("column_id"):
+        events.append(event(TASK_MOVED, {
+            "title": after.get("title", before.get("title")),
+            "from_column": before.get("column_id"),
+            "to_column": after["column_id"]
+        }))
+    return events
+
+def outbox_update(before: dict, after: dict, now: datetime, actor: int = None) -> dict:
+    """Operadores que hay que añadir a la actualización de la tarea para guardar sus eventos"""
+    events = task_events(before, after, now, actor)
+    if not events:
+        return {}
+    return {
+        "$push": {"pending_events": {"$each": events}},
+        "$set": {"outbox_pending": True}
+    }
+
+def with_outbox(update: dict, outbox: dict) -> dict:
+    """Combina una actualización con los operadores de la bandeja de salida"""
+    if not outbox:
+        return update
+    combined = dict(update)
+    combined["$set"] = {**update.get("$set", {}), **outbox["$set"]}
+    combined["$push"] = {**update.get("$push", {}), **outbox["$push"]}
+    return combined
+
+async def subscribed_webhooks() -> list:
+    return await collection_webhooks.find(
+        {"active": True},
+        {"_id": 0, "id": 1, "url": 1, "events": 1, "board_id": 1}
+    ).to_list(None)
+
+def deliveries_for(event: dict, webhooks: list, now: datetime) -> list:
+    """Una entrega por cada webhook suscrito al tipo de evento y a su tablero"""
+    return [
+        {
+            "_id": f"{event['id']}:{webhook['id']}",
+            "event_id": event["id"],
+            "event_type": event["type"],
+            "webhook_id": webhook["id"],
+            "url": webhook["url"],
+            "payload": {
+                "id": event["id"],
+                "type": event["type"],
+                "task_id": event["task_id"],
+                "board_id": event["board_id"],
+                "actor": event.get("actor"),
+                "data": event["data"],
+                "occurred_at": event["occurred_at"].isoformat()
+            },
+            "attempts": 0,
+            "next_attempt_at": now,
+            "lease_owner": None,
+            "lease_until": None,
+            "last_error": None,
+            "created_at": now
+        }
+        for webhook in webhooks
+        if event["type"] in webhook["events"]
+        and webhook.get("board_id") in (None, event["board_id"])
+    ]
+
+async def insert_deliveries(deliveries: list):
+    if not deliveries:
+        return
+    try:
+        await collection_webhook_outbox.insert_many(deliveries, ordered=False)
+    except BulkWriteError as e:
+        # Entregas ya copiadas por un relevo anterior o por otro proceso
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+            raise
+
+async def relay_events(events: list, webhooks: list = None):
+    """Copia a la bandeja de salida eventos que ya no están en una tarea, como los de una tarea eliminada"""
+    if not events:
+        return
+    webhooks = webhooks if webhooks is not None else await subscribed_webhooks()
+    now = datetime.utcnow()
+    await insert_deliveries([delivery for event in events for delivery in deliveries_for(event, webhooks, now)])
+
+async def relay_pending_events() -> int:
+    """Pasa un lote de eventos de las tareas a la bandeja de salida y devuelve cuántos movió"""
+    tasks = await collection_tasks.find(
+        {"outbox_pending": True},
+        {"_id": 1, "pending_events": 1}
+    ).limit(RELAY_BATCH_SIZE).to_list(None)
+    if not tasks:
+        return 0
+
+    webhooks = await subscribed_webhooks()
+    events = [event for task in tasks for event in task.get("pending_events", [])]
+    await relay_events(events, webhooks)
+
+    # Quitar solo los eventos copiados: una escritura concurrente puede haber añadido otros
+    await collection_tasks.bulk_write([
+        UpdateOne(
+            {"_id": task["_id"]},
+            {"$pull": {"pending_events": {"id": {"$in": [event["id"] for event in task.get("pending_events", [])]}}}}
+        )
+        for task in tasks
+    ], ordered=False)
+    await collection_tasks.update_many(
+        {"_id": {"$in": [task["_id"] for task in tasks]}, "pending_events.0": {"$exists": False}},
+        {"$unset": {"outbox_pending": ""}}
+    )
+    return len(events)
@@ -0,0 +1,12 @@
+"""Hash de contraseñas sin dependencias de la base de datos.
+
+Los procesos del pool importan este módulo para hashear lotes de contraseñas,
+así que no debe importar el cliente de MongoDB.
+"""
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def hash_passwords(passwords: list) -> list:
+    """Hashea un lote de contraseñas; se ejecuta en el pool de procesos"""
+    return [pwd_context.hash(password) for password in passwords]
@@ -0,0 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import asyncio
+import logging
+import os
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+_pool = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Devuelve el pool de procesos, creándolo la primera vez que se usa"""
+    global _pool
+    if _pool is None:
+        # spawn evita heredar el bucle de eventos y los hilos del cliente de MongoDB
+        _pool = ProcessPoolExecutor(
+            max_workers=PROCESS_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"Started process pool with {PROCESS_POOL_WORKERS} workers")
+    return _pool
+
+async def run_in_process(func, *args):
+    """Ejecuta una función pura en el pool de procesos sin bloquear el bucle de eventos.
+
+    La función y sus argumentos deben poder serializarse con pickle, así que se
+    pasan datos en columnas (listas o arrays) en lugar de documentos sueltos.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), func, *args)
+
+def shutdown_process_pool():
+    """Detiene el pool de procesos si se llegó a crear"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+        logger.info("Process pool stopped")
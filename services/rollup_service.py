@@ -0,0 +1,202 @@
+from datetime import datetime, timedelta, timezone
+from database.database import get_database
+from models.model_task import COMPLETED_STATUSES
+from pymongo import UpdateOne
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ["day", "week", "month"]
+MAX_SERIES_POINTS = 1000
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    """Inicio del periodo al que pertenece el instante (las semanas empiezan en lunes)"""
+    day = datetime(moment.year, moment.month, moment.day)
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Granularidad no válida: {granularity}")
+
+def to_naive_utc(moment: datetime) -> datetime:
+    """Normaliza un instante a UTC sin zona horaria, como se guarda en MongoDB"""
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def next_bucket(bucket: datetime, granularity: str) -> datetime:
+    """Inicio del periodo siguiente"""
+    if granularity == "day":
+        return bucket + timedelta(days=1)
+    if granularity == "week":
+        return bucket + timedelta(weeks=1)
+    if bucket.month == 12:
+        return bucket.replace(year=bucket.year + 1, month=1)
+    return bucket.replace(month=bucket.month + 1)
+
+class RollupService:
+    @staticmethod
+    def completion_moment(task: dict):
+        """Instante en que se completó la tarea, o None si no está completada"""
+        if task.get("status") not in COMPLETED_STATUSES:
+            return None
+        return task.get("completed_at") or task.get("updated_at")
+
+    @staticmethod
+    def task_contribution(task: dict) -> dict:
+        """Contadores (granularidad, periodo, métrica) con los que contribuye una tarea"""
+        contribution = {}
+        if not task:
+            return contribution
+        events = [("created", task.get("created_at")), ("completed", RollupService.completion_moment(task))]
+        for metric, moment in events:
+            if moment is None:
+                continue
+            for granularity in GRANULARITIES:
+                key = (granularity, bucket_start(moment, granularity), metric)
+                contribution[key] = contribution.get(key, 0) + 1
+        return contribution
+
+    @staticmethod
+    async def apply_task_change(before: dict, before_users: set, after: dict, after_users: set):
+        """Actualiza los resúmenes por periodo de los usuarios afectados por una escritura de tarea"""
+        db = await get_database()
+        before_contribution = RollupService.task_contribution(before)
+        after_contribution = RollupService.task_contribution(after)
+
+        updates = []
+        for user_id in before_users | after_users:
+            deltas = {}
+            if user_id in after_users:
+                for key, value in after_contribution.items():
+                    deltas[key] = deltas.get(key, 0) + value
+            if user_id in before_users:
+                for key, value in before_contribution.items():
+                    deltas[key] = deltas.get(key, 0) - value
+
+            by_bucket = {}
+            for (granularity, bucket, metric), value in deltas.items():
+                if value:
+                    by_bucket.setdefault((granularity, bucket), {})[metric] = value
+            for (granularity, bucket), increments in by_bucket.items():
+                updates.append(UpdateOne(
+                    {"user_id": user_id, "granularity": granularity, "bucket": bucket},
+                    # updated_at permite a backfill_rollups distinguir los periodos que siguen vivos
+                    {"$inc": increments, "$max": {"updated_at": datetime.utcnow()}},
+                    upsert=True
+                ))
+
+        if updates:
+            await db.statistics_rollups.bulk_write(updates, ordered=False)
+
+    @staticmethod
+    async def backfill_rollups() -> dict:
+        """Reconstruye todos los resúmenes por periodo desde las tareas con $dateTrunc.
+
+        Los periodos se reemplazan uno a uno con $merge, sin vaciar antes la
+        colección, así que las lecturas nunca ven series vacías. Al terminar se
+        borran los periodos que la reconstrucción no produjo y que nadie ha
+        actualizado desde que empezó.
+        """
+        db = await get_database()
+        logger.info("Backfilling productivity rollups")
+        started = datetime.utcnow()
+        completed_at = {"$cond": [
+            {"$in": ["$status", COMPLETED_STATUSES]},
+            {"$ifNull": ["$completed_at", "$updated_at"]},
+            None
+        ]}
+        pipeline = [
+            {"$unionWith": {"coll": "tasks_archive"}},
+            {"$project": {
+                "participant": {"$setDifference": [
+                    {"$setUnion": [["$assigned_to"], ["$created_by"]]},
+                    [None]
+                ]},
+                "events": [
+                    {"metric": "created", "at": "$created_at"},
+                    {"metric": "completed", "at": completed_at}
+                ]
+            }},
+            {"$unwind": "$participant"},
+            {"$unwind": "$events"},
+            {"$match": {"events.at": {"$type": "date"}}},
+            {"$addFields": {"granularity": GRANULARITIES}},
+            {"$unwind": "$granularity"},
+            {"$group": {
+                "_id": {
+                    "user_id": "$participant",
+                    "granularity": "$granularity",
+                    "bucket": {"$dateTrunc": {
+                        "date": "$events.at",
+                        "unit": "$granularity",
+                        "startOfWeek": "monday"
+                    }}
+                },
+                "created": {"$sum": {"$cond": [{"$eq": ["$events.metric", "created"]}, 1, 0]}},
+                "completed": {"$sum": {"$cond": [{"$eq": ["$events.metric", "completed"]}, 1, 0]}}
+            }},
+            {"$project": {
+                "_id": 0,
+                "user_id": "$_id.user_id",
+                "granularity": "$_id.granularity",
+                "bucket": "$_id.bucket",
+                "created": 1,
+                "completed": 1,
+                "backfilled_at": {"$literal": started}
+            }},
+            {"$merge": {
+                "into": "statistics_rollups",
+                "on": ["user_id", "granularity", "bucket"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ]
+        await db.tasks.aggregate(pipeline, allowDiskUse=True).to_list(None)
+        # Periodos de tareas que ya no existen
+        await db.statistics_rollups.delete_many({
+            "$and": [
+                {"$or": [{"backfilled_at": {"$exists": False}}, {"backfilled_at": {"$lt": started}}]},
+                {"$or": [{"updated_at": {"$exists": False}}, {"updated_at": {"$lt": started}}]}
+            ]
+        })
+        buckets = await db.statistics_rollups.count_documents({})
+        logger.info(f"Backfilled {buckets} rollup buckets")
+        return {"buckets": buckets}
+
+    @staticmethod
+    async def get_series(user_ids: list, granularity: str, start: datetime, end: datetime) -> list:
+        """Serie temporal de tareas creadas y completadas leyendo solo los resúmenes"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularidad no válida: {granularity}")
+        start, end = to_naive_utc(start), to_naive_utc(end)
+        if end < start:
+            raise ValueError("La fecha final no puede ser anterior a la inicial")
+
+        buckets = []
+        bucket = bucket_start(start, granularity)
+        while bucket <= end:
+            buckets.append(bucket)
+            if len(buckets) > MAX_SERIES_POINTS:
+                raise ValueError(f"El rango no puede tener más de {MAX_SERIES_POINTS} periodos")
+            bucket = next_bucket(bucket, granularity)
+
+        db = await get_database()
+        totals = {bucket: {"created": 0, "completed": 0} for bucket in buckets}
+        async for rollup in db.statistics_rollups.find(
+            {
+                "user_id": {"$in": user_ids},
+                "granularity": granularity,
+                "bucket": {"$gte": buckets[0], "$lte": buckets[-1]}
+            },
+            {"bucket": 1, "created": 1, "completed": 1}
+        ):
+            point = totals[rollup["bucket"]]
+            point["created"] += rollup.get("created", 0)
+            point["completed"] += rollup.get("completed", 0)
+
+        return [{"bucket": bucket, **totals[bucket]} for bucket in buckets]
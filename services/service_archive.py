@@ -0,0 +1,150 @@
+from database.database import collection_tasks, collection_tasks_archive
+from models.model_task import COMPLETED_STATUSES
+from models.model_board import DEFAULT_BOARD_ID
+from datetime import datetime, timedelta
+from pymongo import ReplaceOne
+from collections import Counter
+import asyncio
+import logging
+from services.service_sync import record_tombstones
+from services.service_kanban import increment_column_count, invalidate_board_cache
+from services.typeahead_service import unindex_task
+from services.service_calendar import touch_calendars
+from services.outbox_service import relay_events
+from services.service_webhook import notify_outbox
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def archivable_filter(cutoff: datetime) -> dict:
+    """Filtro de las tareas completadas antes de la fecha de corte"""
+    return {
+        "status": {"$in": COMPLETED_STATUSES},
+        "$or": [
+            {"completed_at": {"$lt": cutoff}},
+            {"completed_at": None, "updated_at": {"$lt": cutoff}}
+        ]
+    }
+
+ARCHIVE_RECOVERY_SECONDS = 300
+
+async def finish_archived(tasks: list):
+    """Aplica al resto del sistema el archivado de tareas ya borradas y lo marca como terminado"""
+    if not tasks:
+        return
+    # Mantener los contadores de columnas, la caché de tableros y la sincronización.
+    # Si el proceso cae a mitad se repite todo: las lápidas duplicadas no afectan a
+    # los clientes y la reconciliación periódica corrige los contadores
+    for column_id, count in Counter(task.get("column_id") for task in tasks).items():
+        await increment_column_count(column_id, -count)
+    for board_id in {task.get("board_id", DEFAULT_BOARD_ID) for task in tasks}:
+        invalidate_board_cache(board_id)
+    await record_tombstones("task", [(task["id"], task.get("board_id", DEFAULT_BOARD_ID)) for task in tasks])
+    for task in tasks:
+        unindex_task(task["id"])
+    # Los eventos que el relevo aún no copió se perderían con la tarea borrada
+    events = [event for task in tasks for event in task.get("pending_events", [])]
+    if events:
+        await relay_events(events)
+        notify_outbox()
+    # Las tareas archivadas desaparecen de los feeds de calendario
+    await touch_calendars({
+        user_id
+        for task in tasks if task.get("due_date") is not None
+        for user_id in (task.get("assigned_to"), task.get("created_by")) if user_id is not None
+    })
+    await collection_tasks_archive.update_many(
+        {"_id": {"$in": [task["_id"] for task in tasks]}},
+        {"$unset": {"archive_pending": "", "pending_events": "", "outbox_pending": ""}}
+    )
+
+async def recover_archive_batch(batch_size: int) -> int:
+    """Termina un lote de archivados que un proceso dejó a medias y devuelve cuántas copias revisó"""
+    # Solo copias antiguas, para no interferir con un lote que otro proceso está archivando
+    stale = datetime.utcnow() - timedelta(seconds=ARCHIVE_RECOVERY_SECONDS)
+    pending = await collection_tasks_archive.find(
+        {"archive_pending": True, "archived_at": {"$lt": stale}}
+    ).to_list(length=batch_size)
+    if not pending:
+        return 0
+
+    live = await collection_tasks.find(
+        {"_id": {"$in": [task["_id"] for task in pending]}}, {"_id": 1}
+    ).to_list(None)
+    live_ids = {doc["_id"] for doc in live}
+    # Copias de tareas que no se llegaron a borrar: el siguiente lote las vuelve a copiar si procede
+    if live_ids:
+        await collection_tasks_archive.delete_many({"_id": {"$in": list(live_ids)}, "archive_pending": True})
+    recovered = [task for task in pending if task["_id"] not in live_ids]
+    await finish_archived(recovered)
+    if recovered:
+        logger.info(f"Finished {len(recovered)} interrupted task archivals")
+    return len(pending)
+
+async def archive_batch(cutoff: datetime, batch_size: int) -> int:
+    """Mueve un lote de tareas completadas a la colección de archivo y devuelve cuántas se movieron"""
+    tasks = await collection_tasks.find(archivable_filter(cutoff)).sort("_id", 1).to_list(length=batch_size)
+    if not tasks:
+        return 0
+
+    # Copiar primero al archivo: la copia es idempotente y permite reanudar tras un fallo.
+    # archive_pending indica que faltan los efectos del archivado en el resto del sistema
+    archived_at = datetime.utcnow()
+    await collection_tasks_archive.bulk_write(
+        [
+            ReplaceOne({"_id": task["_id"]}, {**task, "archived_at": archived_at, "archive_pending": True}, upsert=True)
+            for task in tasks
+        ],
+        ordered=False
+    )
+
+    # Borrar solo las tareas que no cambiaron desde que se copiaron
+    result = await collection_tasks.delete_many({
+        "$or": [{"_id": task["_id"], "sync_seq": task.get("sync_seq")} for task in tasks]
+    })
+    if result.deleted_count < len(tasks):
+        remaining = await collection_tasks.find(
+            {"_id": {"$in": [task["_id"] for task in tasks]}}, {"_id": 1}
+        ).to_list(None)
+        remaining_ids = {doc["_id"] for doc in remaining}
+        await collection_tasks_archive.delete_many({"_id": {"$in": list(remaining_ids)}})
+        tasks = [task for task in tasks if task["_id"] not in remaining_ids]
+
+    await finish_archived(tasks)
+    return len(tasks)
+
+async def archive_completed_tasks(older_than_days: int, batch_size: int = 500, max_batches: int = None):
+    """Archiva por lotes las tareas completadas hace más de older_than_days días"""
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        logger.info(f"Archiving tasks completed before {cutoff.isoformat()}")
+        # Terminar primero lo que quedó a medias en una ejecución anterior
+        while await recover_archive_batch(batch_size):
+            await asyncio.sleep(0)
+        archived = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            moved = await archive_batch(cutoff, batch_size)
+            if not moved:
+                break
+            archived += moved
+            batches += 1
+            # Ceder el bucle de eventos entre lotes
+            await asyncio.sleep(0)
+        logger.info(f"Archived {archived} tasks")
+        return {"archived": archived}
+    except Exception as e:
+        logger.error(f"Error archiving tasks: {str(e)}")
+        raise
+
+async def run_task_archiver(interval_seconds: int, older_than_days: int):
+    """Ejecuta el archivado de tareas completadas de forma periódica"""
+    while True:
+        try:
+            await archive_completed_tasks(older_than_days)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Task archiving failed: {str(e)}")
+        await asyncio.sleep(interval_seconds)
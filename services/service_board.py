@@ -0,0 +1,155 @@
+from database.database import collection_boards, collection_kanban_columns
+from models.model_board import BoardCreate
+from datetime import datetime
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def serialize_doc(doc):
+    if doc:
+        doc["_id"] = str(doc["_id"])
+    return doc
+
+def can_access_board(board: dict, user_id: int, user_role: str) -> bool:
+    """Indica si el usuario puede ver el tablero"""
+    return (
+        user_role == "admin"
+        or board.get("is_public", False)
+        or board["owner_id"] == user_id
+        or user_id in board.get("members", [])
+    )
+
+def board_access_filter(user_id: int, user_role: str) -> dict:
+    """Filtro de los tableros que el usuario puede ver, equivalente a can_access_board"""
+    if user_role == "admin":
+        return {}
+    return {
+        "$or": [
+            {"is_public": True},
+            {"owner_id": user_id},
+            {"members": user_id}
+        ]
+    }
+
+async def accessible_board_ids(user_id: int, user_role: str) -> list:
+    """Ids de los tableros que el usuario puede ver"""
+    boards = await collection_boards.find(board_access_filter(user_id, user_role), {"id": 1}).to_list(None)
+    return [board["id"] for board in boards]
+
+async def get_next_board_id():
+    try:
+        last_board = await collection_boards.find_one(sort=[("id", -1)])
+        if last_board:
+            return last_board["id"] + 1
+        return 1
+    except Exception as e:
+        logger.error(f"Error getting next board id: {str(e)}")
+        raise
+
+async def check_board_access(board_id: int, user_id: int, user_role: str):
+    """Verifica que el tablero existe y que el usuario es miembro"""
+    board = await collection_boards.find_one({"id": board_id})
+    if not board:
+        raise ValueError(f"Tablero con id {board_id} no encontrado")
+    if not can_access_board(board, user_id, user_role):
+        raise PermissionError("No tienes permiso para acceder a este tablero")
+    return board
+
+async def get_boards(user_id: int, user_role: str):
+    try:
+        logger.info("Fetching boards")
+        boards = await collection_boards.find(board_access_filter(user_id, user_role)).sort("id", 1).to_list(length=100)
+        logger.info(f"Found {len(boards)} boards")
+        return [serialize_doc(board) for board in boards]
+    except Exception as e:
+        logger.error(f"Error fetching boards: {str(e)}")
+        raise
+
+async def get_board(board_id: int, user_id: int, user_role: str):
+    try:
+        logger.info(f"Fetching board with id: {board_id}")
+        board = await check_board_access(board_id, user_id, user_role)
+        return serialize_doc(board)
+    except (ValueError, PermissionError) as e:
+        logger.error(f"Validation error fetching board: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching board: {str(e)}")
+        raise
+
+async def create_board(board: BoardCreate, current_user_id: int):
+    try:
+        board_dict = board.model_dump()
+        board_dict["id"] = await get_next_board_id()
+        board_dict["owner_id"] = current_user_id
+        if current_user_id not in board_dict["members"]:
+            board_dict["members"].append(current_user_id)
+        current_time = datetime.now()
+        board_dict["created_at"] = current_time
+        board_dict["updated_at"] = current_time
+
+        logger.info(f"Creating new board with id: {board_dict['id']}")
+        new_board = await collection_boards.insert_one(board_dict)
+
+        if new_board.inserted_id:
+            board_dict["_id"] = new_board.inserted_id
+            logger.info(f"Board created successfully with id: {board_dict['id']}")
+            return {"board": serialize_doc(board_dict), "message": "Board created successfully"}
+        raise ValueError("Error al crear el tablero")
+    except ValueError as e:
+        logger.error(f"Validation error creating board: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error creating board: {str(e)}")
+        raise
+
+async def update_board(board_id: int, board: BoardCreate, current_user_id: int, current_user_role: str):
+    try:
+        existing_board = await collection_boards.find_one({"id": board_id})
+        if not existing_board:
+            raise ValueError(f"Tablero con id {board_id} no encontrado")
+        if current_user_role != "admin" and existing_board["owner_id"] != current_user_id:
+            raise PermissionError("Solo el propietario puede actualizar el tablero")
+
+        board_dict = board.model_dump()
+        if existing_board["owner_id"] not in board_dict["members"]:
+            board_dict["members"].append(existing_board["owner_id"])
+        board_dict["updated_at"] = datetime.now()
+
+        logger.info(f"Updating board with id: {board_id}")
+        await collection_boards.update_one({"id": board_id}, {"$set": board_dict})
+        updated_board = await collection_boards.find_one({"id": board_id})
+        logger.info(f"Board updated successfully with id: {board_id}")
+        return {"board": serialize_doc(updated_board), "message": "Board updated successfully"}
+    except (ValueError, PermissionError) as e:
+        logger.error(f"Validation error updating board: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error updating board: {str(e)}")
+        raise
+
+async def delete_board(board_id: int, current_user_id: int, current_user_role: str):
+    try:
+        existing_board = await collection_boards.find_one({"id": board_id})
+        if not existing_board:
+            raise ValueError(f"Tablero con id {board_id} no encontrado")
+        if current_user_role != "admin" and existing_board["owner_id"] != current_user_id:
+            raise PermissionError("Solo el propietario puede eliminar el tablero")
+
+        # Verificar si el tablero tiene columnas
+        column = await collection_kanban_columns.find_one({"board_id": board_id}, {"_id": 1})
+        if column:
+            raise ValueError("No se puede eliminar un tablero que contiene columnas")
+
+        logger.info(f"Deleting board with id: {board_id}")
+        await collection_boards.delete_one({"id": board_id})
+        logger.info(f"Board deleted successfully with id: {board_id}")
+        return {"message": "Board deleted successfully"}
+    except (ValueError, PermissionError) as e:
+        logger.error(f"Validation error deleting board: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting board: {str(e)}")
+        raise
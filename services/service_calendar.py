@@ -0,0 +1,182 @@
+from database.database import collection_tasks, collection_users
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import logging
+import os
+import secrets
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_CALENDAR_DAYS = 366
+# El feed incluye las tareas que vencieron en los últimos días además de todas las futuras
+CALENDAR_FEED_PAST_DAYS = int(os.getenv("CALENDAR_FEED_PAST_DAYS", "90"))
+CALENDAR_FEED_BATCH_SIZE = 500
+# Campos que aparecen en el feed: cambiar cualquier otro no invalida los calendarios
+CALENDAR_FIELDS = ["title", "description", "due_date", "priority", "status", "labels", "assigned_to", "created_by"]
+CALENDAR_PROJECTION = {"_id": 0, "id": 1, "updated_at": 1, "created_at": 1, **{field: 1 for field in CALENDAR_FIELDS}}
+ICS_PRIORITIES = {"high": 1, "alta": 1, "medium": 5, "media": 5, "low": 9, "baja": 9}
+ICS_MAX_LINE_OCTETS = 75
+
+def participant_filter(user_id: int, due_range: dict) -> dict:
+    """Tareas asignadas o creadas por el usuario; cada rama usa su índice (usuario, due_date)"""
+    return {"$or": [
+        {"assigned_to": user_id, "due_date": due_range},
+        {"created_by": user_id, "due_date": due_range}
+    ]}
+
+def calendar_participants(before: dict, after: dict) -> set:
+    """Usuarios cuyo calendario cambia con una escritura de tarea"""
+    before, after = before or {}, after or {}
+    if before.get("due_date") is None and after.get("due_date") is None:
+        return set()
+    if before and after and all(before.get(field) == after.get(field) for field in CALENDAR_FIELDS):
+        return set()
+    users = {before.get("assigned_to"), before.get("created_by"), after.get("assigned_to"), after.get("created_by")}
+    return users - {None}
+
+async def touch_calendars(user_ids, moment: datetime = None):
+    """Marca como modificados los calendarios de los usuarios indicados"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    try:
+        # Solo tienen validadores los usuarios que generaron un enlace de feed
+        await collection_users.update_many(
+            {"id": {"$in": user_ids}, "calendar_token": {"$exists": True}},
+            {"$max": {"calendar_updated_at": moment or datetime.utcnow()}}
+        )
+    except Exception as e:
+        logger.error(f"Error touching calendars: {str(e)}")
+
+async def touch_task_calendars(before: dict = None, after: dict = None):
+    """Invalida los feeds de los usuarios afectados por una escritura de tarea"""
+    await touch_calendars(calendar_participants(before, after), (after or {}).get("updated_at"))
+
+async def get_calendar_tasks(user_id: int, start: datetime, end: datetime) -> list:
+    """Tareas del usuario que vencen en [start, end), ordenadas por fecha de vencimiento"""
+    if end <= start:
+        raise ValueError("La fecha final debe ser posterior a la inicial")
+    if end - start > timedelta(days=MAX_CALENDAR_DAYS):
+        raise ValueError(f"El rango no puede tener más de {MAX_CALENDAR_DAYS} días")
+    logger.info(f"Fetching calendar for user {user_id} from {start.isoformat()} to {end.isoformat()}")
+    return await collection_tasks.find(
+        participant_filter(user_id, {"$gte": start, "$lt": end}),
+        {"_id": 0}
+    ).sort("due_date", 1).to_list(None)
+
+async def create_calendar_token(user_id: int) -> str:
+    """Genera un token nuevo para el feed del usuario; el anterior deja de ser válido"""
+    token = secrets.token_urlsafe(32)
+    result = await collection_users.update_one(
+        {"id": user_id},
+        {"$set": {"calendar_token": token, "calendar_updated_at": datetime.utcnow()}}
+    )
+    if not result.matched_count:
+        raise ValueError(f"Usuario con id {user_id} no encontrado")
+    logger.info(f"Created calendar feed token for user {user_id}")
+    return token
+
+async def get_feed_user(token: str) -> dict:
+    """Usuario dueño de un token de feed; None si el token no existe o el usuario está inactivo"""
+    user = await collection_users.find_one(
+        {"calendar_token": token},
+        {"_id": 0, "id": 1, "username": 1, "is_active": 1, "calendar_updated_at": 1}
+    )
+    if not user or not user.get("is_active", True):
+        return None
+    return user
+
+def feed_validators(user: dict) -> dict:
+    """ETag y Last-Modified del feed, derivados solo del documento del usuario"""
+    updated_at = (user.get("calendar_updated_at") or datetime(1970, 1, 1)).replace(tzinfo=timezone.utc)
+    return {
+        "ETag": f'W/"{user["id"]}-{int(updated_at.timestamp() * 1000)}"',
+        "Last-Modified": format_datetime(updated_at, usegmt=True)
+    }
+
+def feed_not_modified(validators: dict, if_none_match: str = None, if_modified_since: str = None) -> bool:
+    """Indica si el cliente ya tiene la versión actual del feed"""
+    if if_none_match is not None:
+        # If-None-Match tiene prioridad sobre If-Modified-Since
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or validators["ETag"] in tags
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return parsedate_to_datetime(validators["Last-Modified"]) <= since
+    return False
+
+def ics_escape(text: str) -> str:
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+def ics_timestamp(moment: datetime) -> str:
+    return moment.strftime("%Y%m%dT%H%M%SZ")
+
+def ics_line(name: str, value: str) -> str:
+    """Línea de contenido plegada a 75 octetos como exige RFC 5545"""
+    line = f"{name}:{value}"
+    if len(line.encode("utf-8")) <= ICS_MAX_LINE_OCTETS:
+        return line + "\r\n"
+    parts = []
+    current = ""
+    limit = ICS_MAX_LINE_OCTETS
+    for char in line:
+        if len((current + char).encode("utf-8")) > limit:
+            parts.append(current)
+            current = ""
+            # Las líneas de continuación empiezan con un espacio
+            limit = ICS_MAX_LINE_OCTETS - 1
+        current += char
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+def ics_event(task: dict, stamp: datetime) -> str:
+    """VEVENT de una tarea; sin DTEND el evento dura cero minutos y se muestra en su vencimiento"""
+    lines = [
+        "BEGIN:VEVENT\r\n",
+        ics_line("UID", f"task-{task['id']}@seekanban"),
+        ics_line("DTSTAMP", ics_timestamp(stamp)),
+        ics_line("DTSTART", ics_timestamp(task["due_date"])),
+        ics_line("SUMMARY", ics_escape(task.get("title") or ""))
+    ]
+    if task.get("description"):
+        lines.append(ics_line("DESCRIPTION", ics_escape(task["description"])))
+    if task.get("priority") in ICS_PRIORITIES:
+        lines.append(ics_line("PRIORITY", str(ICS_PRIORITIES[task["priority"]])))
+    if task.get("labels"):
+        lines.append(ics_line("CATEGORIES", ",".join(ics_escape(label) for label in task["labels"])))
+    if task.get("status"):
+        lines.append(ics_line("X-SEEKANBAN-STATUS", ics_escape(task["status"])))
+    if task.get("updated_at"):
+        lines.append(ics_line("LAST-MODIFIED", ics_timestamp(task["updated_at"])))
+    lines.append("END:VEVENT\r\n")
+    return "".join(lines)
+
+async def stream_calendar_feed(user: dict):
+    """Genera el feed iCalendar del usuario leyendo las tareas directamente del cursor"""
+    stamp = user.get("calendar_updated_at") or datetime.utcnow()
+    yield (
+        "BEGIN:VCALENDAR\r\n"
+        "VERSION:2.0\r\n"
+        "PRODID:-//Seekanban//Tareas//ES\r\n"
+        "CALSCALE:GREGORIAN\r\n"
+        "METHOD:PUBLISH\r\n"
+        + ics_line("X-WR-CALNAME", ics_escape(f"Tareas de {user.get('username')}"))
+    )
+    since = datetime.utcnow() - timedelta(days=CALENDAR_FEED_PAST_DAYS)
+    cursor = collection_tasks.find(
+        participant_filter(user["id"], {"$gte": since}),
+        CALENDAR_PROJECTION
+    ).sort("due_date", 1).batch_size(CALENDAR_FEED_BATCH_SIZE)
+    events = []
+    async for task in cursor:
+        events.append(ics_event(task, stamp))
+        if len(events) == CALENDAR_FEED_BATCH_SIZE:
+            yield "".join(events)
+            events = []
+    yield "".join(events) + "END:VCALENDAR\r\n"
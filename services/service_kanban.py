@@ -1,13 +1,38 @@
-from database.database import collection_kanban_columns, collection_tasks
+from database.database import collection_kanban_columns, collection_tasks, collection_tasks_archive, collection_sync_tombstones, collection_boards
 from models.model_kanban import KanbanColumnCreate
+from models.model_board import DEFAULT_BOARD_ID
 from datetime import datetime
+from pymongo import UpdateOne
+import asyncio
 import logging
+import os
+import time
 from models.model_user import Role
+from services.service_sync import next_sync_fields, settled_watermark, record_tombstone
+from services.service_board import check_board_access, accessible_board_ids
+from services.statistics_service import StatisticsService
+from services.transition_service import TransitionService, lifecycle_fields
+from services.service_calendar import touch_task_calendars
+from services.audit_service import record_task_change
+from services.outbox_service import OUTBOX_PROJECTION, outbox_update, with_outbox, strip_outbox
+from services.service_webhook import notify_outbox
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+BOARD_CACHE_TTL_SECONDS = float(os.getenv("BOARD_CACHE_TTL_SECONDS", "5"))
+
+# Caché de columnas por tablero: board_id -> (instante de expiración, columnas)
+_board_cache = {}
+
+def invalidate_board_cache(board_id: int = None):
+    """Descarta las columnas en caché de un tablero, o de todos si no se indica"""
+    if board_id is None:
+        _board_cache.clear()
+    else:
+        _board_cache.pop(board_id, None)
+
 def serialize_doc(doc):
     if doc:
         doc["_id"] = str(doc["_id"])
@@ -23,24 +48,132 @@ async def get_next_column_id():
         logger.error(f"Error getting next column id: {str(e)}")
         raise
 
-async def get_columns():
+async def increment_column_count(column_id: int, delta: int):
+    """Ajusta atómicamente el contador de tareas de una columna"""
+    if column_id is None:
+        return
+    await collection_kanban_columns.update_one(
+        {"id": column_id},
+        {"$inc": {"task_count": delta}}
+    )
+
+async def reserve_column_slot(column_id: int, board_id: int = None):
+    """Incrementa el contador de la columna solo si no supera su límite WIP"""
+    board_filter = {"board_id": board_id} if board_id is not None else {}
+    result = await collection_kanban_columns.update_one(
+        {
+            "id": column_id,
+            **board_filter,
+            "$or": [
+                {"wip_limit": None},
+                {"$expr": {"$lt": [{"$ifNull": ["$task_count", 0]}, "$wip_limit"]}}
+            ]
+        },
+        {"$inc": {"task_count": 1}}
+    )
+    if result.matched_count:
+        return
+    column = await collection_kanban_columns.find_one({"id": column_id, **board_filter}, {"wip_limit": 1})
+    if not column:
+        raise ValueError(f"Columna con id {column_id} no encontrada en el tablero")
+    raise ValueError(f"La columna {column_id} alcanzó su límite WIP de {column['wip_limit']} tareas")
+
+async def reconcile_column_counters(batch_size: int = 100):
+    """Recalcula los contadores de tareas de las columnas por lotes y corrige las desviaciones"""
     try:
-        logger.info("Fetching all kanban columns")
-        columns = await collection_kanban_columns.find().sort("order", 1).to_list(length=100)
+        logger.info("Reconciling kanban column counters")
+        repaired = 0
+        last_id = 0
+        while True:
+            columns = await collection_kanban_columns.find(
+                {"id": {"$gt": last_id}},
+                {"id": 1, "task_count": 1}
+            ).sort("id", 1).to_list(length=batch_size)
+            if not columns:
+                break
+            last_id = columns[-1]["id"]
+
+            column_ids = [column["id"] for column in columns]
+            counts = {
+                group["_id"]: group["count"]
+                async for group in collection_tasks.aggregate([
+                    {"$match": {"column_id": {"$in": column_ids}}},
+                    {"$group": {"_id": "$column_id", "count": {"$sum": 1}}}
+                ])
+            }
+            updates = [
+                UpdateOne({"id": column["id"]}, {"$set": {"task_count": counts.get(column["id"], 0)}})
+                for column in columns
+                if column.get("task_count") != counts.get(column["id"], 0)
+            ]
+            if updates:
+                await collection_kanban_columns.bulk_write(updates, ordered=False)
+                repaired += len(updates)
+
+        logger.info(f"Repaired {repaired} column counters")
+        return {"repaired": repaired}
+    except Exception as e:
+        logger.error(f"Error reconciling column counters: {str(e)}")
+        raise
+
+async def run_column_counter_reconciler(interval_seconds: int):
+    """Ejecuta la reconciliación de contadores de forma periódica"""
+    while True:
+        try:
+            await reconcile_column_counters()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Column counter reconciliation failed: {str(e)}")
+        await asyncio.sleep(interval_seconds)
+
+async def get_columns(board_id: int, user_id: int, user_role: str, include_archived: bool = False):
+    try:
+        await check_board_access(board_id, user_id, user_role)
+
+        cached = _board_cache.get(board_id)
+        if not include_archived and cached and cached[0] > time.monotonic():
+            logger.info(f"Serving kanban columns of board {board_id} from cache")
+            return cached[1]
+
+        logger.info(f"Fetching kanban columns of board {board_id}")
+        columns = await collection_kanban_columns.find({"board_id": board_id}).sort("order", 1).to_list(length=100)
         
-        # Obtener las tareas para cada columna
+        # Obtener las tareas del tablero en una sola consulta y repartirlas por columna
+        tasks_by_column = {column["id"]: [] for column in columns}
+        collections = [collection_tasks]
+        if include_archived:
+            collections.append(collection_tasks_archive)
+        for collection in collections:
+            async for task in collection.find({
+                "board_id": board_id,
+                "column_id": {"$in": list(tasks_by_column)}
+            }, OUTBOX_PROJECTION):
+                column_tasks = tasks_by_column[task["column_id"]]
+                if len(column_tasks) < 100:
+                    column_tasks.append(serialize_doc(task))
         for column in columns:
-            tasks = await collection_tasks.find({"column_id": column["id"]}).to_list(length=100)
-            column["tasks"] = [serialize_doc(task) for task in tasks]
+            column["tasks"] = tasks_by_column[column["id"]]
             
         logger.info(f"Found {len(columns)} columns")
-        return [serialize_doc(column) for column in columns]
+        columns = [serialize_doc(column) for column in columns]
+        if not include_archived:
+            _board_cache[board_id] = (time.monotonic() + BOARD_CACHE_TTL_SECONDS, columns)
+        return columns
+    except (ValueError, PermissionError) as e:
+        logger.error(f"Validation error fetching columns: {str(e)}")
+        raise
     except Exception as e:
         logger.error(f"Error fetching columns: {str(e)}")
         raise
 
 async def create_column(column: KanbanColumnCreate):
     try:
+        # Verificar que el tablero existe
+        board = await collection_boards.find_one({"id": column.board_id}, {"_id": 1})
+        if not board:
+            raise ValueError(f"Tablero con id {column.board_id} no encontrado")
+
         # Crear el documento de la columna
         column_dict = column.model_dump()
         column_dict["id"] = await get_next_column_id()
@@ -48,11 +181,14 @@ async def create_column(column: KanbanColumnCreate):
         column_dict["created_at"] = current_time
         column_dict["updated_at"] = current_time
         column_dict["tasks"] = []
+        column_dict["task_count"] = 0
+        column_dict.update(await next_sync_fields())
         
         logger.info(f"Creating new column with id: {column_dict['id']}")
         new_column = await collection_kanban_columns.insert_one(column_dict)
         
         if new_column.inserted_id:
+            invalidate_board_cache(column_dict["board_id"])
             created_column = await collection_kanban_columns.find_one({"_id": new_column.inserted_id})
             logger.info(f"Column created successfully with id: {created_column['id']}")
             return {"column": serialize_doc(created_column), "message": "Column created successfully"}
@@ -71,8 +207,10 @@ async def update_column(column_id: int, column: KanbanColumnCreate):
         if not existing_column:
             raise ValueError(f"Columna con id {column_id} no encontrada")
 
-        column_dict = column.model_dump()
+        # Una columna no puede cambiar de tablero
+        column_dict = column.model_dump(exclude={"board_id"})
         column_dict["updated_at"] = datetime.now()
+        column_dict.update(await next_sync_fields())
         
         logger.info(f"Updating column with id: {column_id}")
         updated_column = await collection_kanban_columns.update_one(
@@ -81,6 +219,7 @@ async def update_column(column_id: int, column: KanbanColumnCreate):
         )
         
         if updated_column.modified_count:
+            invalidate_board_cache(existing_column.get("board_id"))
             column = await collection_kanban_columns.find_one({"id": column_id})
             logger.info(f"Column updated successfully with id: {column_id}")
             return {"column": serialize_doc(column), "message": "Column updated successfully"}
@@ -100,13 +239,14 @@ async def delete_column(column_id: int):
             raise ValueError(f"Columna con id {column_id} no encontrada")
 
         # Verificar si hay tareas en la columna
-        tasks_count = await collection_tasks.count_documents({"column_id": column_id})
-        if tasks_count > 0:
+        if column.get("task_count", 0) > 0:
             raise ValueError("No se puede eliminar una columna que contiene tareas")
 
         logger.info(f"Deleting column with id: {column_id}")
         deleted_column = await collection_kanban_columns.delete_one({"id": column_id})
         if deleted_column.deleted_count:
+            invalidate_board_cache(column.get("board_id"))
+            await record_tombstone("column", column_id, column.get("board_id"))
             logger.info(f"Column deleted successfully with id: {column_id}")
             return {"message": "Column deleted successfully"}
         raise ValueError("Error al eliminar la columna")
@@ -117,33 +257,175 @@ async def delete_column(column_id: int):
         logger.error(f"Error deleting column: {str(e)}")
         raise
 
-async def move_task(task_id: int, new_column_id: int):
+async def move_task(task_id: int, new_column_id: int, moved_by: int, user_role: str):
     try:
-        # Verificar que la tarea existe
+        # Verificar que la tarea existe y que el usuario es miembro de su tablero
         task = await collection_tasks.find_one({"id": task_id})
         if not task:
             raise ValueError(f"Tarea con id {task_id} no encontrada")
+        board_id = task.get("board_id", DEFAULT_BOARD_ID)
+        await check_board_access(board_id, moved_by, user_role)
+
+        if task.get("column_id") == new_column_id:
+            raise ValueError(f"La tarea {task_id} ya está en la columna {new_column_id}")
 
-        # Verificar que la nueva columna existe
-        new_column = await collection_kanban_columns.find_one({"id": new_column_id})
-        if not new_column:
-            raise ValueError(f"Columna con id {new_column_id} no encontrada")
+        # Verificar que la nueva columna existe en el tablero y respetar su límite WIP
+        await reserve_column_slot(new_column_id, board_id)
 
         # Actualizar la tarea con la nueva columna
         logger.info(f"Moving task {task_id} to column {new_column_id}")
+        now = datetime.utcnow()
+        outbox = outbox_update(task, {"column_id": new_column_id}, now, moved_by)
         updated_task = await collection_tasks.update_one(
-            {"id": task_id},
-            {"$set": {"column_id": new_column_id}}
+            {"id": task_id, "column_id": task.get("column_id")},
+            with_outbox({"$set": {
+                "column_id": new_column_id,
+                "updated_at": now,
+                **await next_sync_fields(),
+                **lifecycle_fields(task, {"column_id": new_column_id}, now)
+            }}, outbox)
         )
         
         if updated_task.modified_count:
-            task = await collection_tasks.find_one({"id": task_id})
+            if outbox:
+                notify_outbox()
+            await increment_column_count(task.get("column_id"), -1)
+            invalidate_board_cache(board_id)
+            moved_task = await collection_tasks.find_one({"id": task_id})
+            await StatisticsService.on_task_change(task, moved_task)
+            await TransitionService.record_transition(task, moved_task)
+            await touch_task_calendars(task, moved_task)
+            await record_task_change("move", task, moved_task, moved_by)
+            task = moved_task
             logger.info(f"Task moved successfully to column {new_column_id}")
-            return {"task": serialize_doc(task), "message": "Task moved successfully"}
+            return {"task": serialize_doc(strip_outbox(task)), "message": "Task moved successfully"}
+        await increment_column_count(new_column_id, -1)
         raise ValueError("Error al mover la tarea")
-    except ValueError as e:
+    except (ValueError, PermissionError) as e:
         logger.error(f"Validation error moving task: {str(e)}")
         raise
     except Exception as e:
         logger.error(f"Error moving task: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
+
+async def get_changes(since: int, user_id: int, user_role: str, limit: int = 500, board_id: int = None):
+    """Obtiene las tareas y columnas modificadas o eliminadas después de la marca de agua"""
+    try:
+        logger.info(f"Fetching kanban changes since {since}")
+        seq_filter = {"sync_seq": {"$gt": since}}
+        tombstone_filter = {"seq": {"$gt": since}}
+        if board_id is not None:
+            await check_board_access(board_id, user_id, user_role)
+            seq_filter["board_id"] = board_id
+            tombstone_filter["board_id"] = board_id
+        elif user_role != "admin":
+            # Sin tablero, solo los cambios de los tableros que el usuario puede ver
+            board_ids = await accessible_board_ids(user_id, user_role)
+            if DEFAULT_BOARD_ID in board_ids:
+                # Los documentos anteriores a los tableros no tienen board_id
+                board_ids.append(None)
+            seq_filter["board_id"] = {"$in": board_ids}
+            tombstone_filter["board_id"] = {"$in": board_ids}
+
+        task_filter = dict(seq_filter)
+        if user_role != "admin":
+            task_filter["$or"] = [
+                {"assigned_to": user_id},
+                {"created_by": user_id}
+            ]
+            # Eliminaciones de todos más las tareas en las que el usuario dejó de participar
+            tombstone_filter["$or"] = [
+                {"user_ids": {"$exists": False}},
+                {"user_ids": user_id}
+            ]
+        else:
+            # Los admins ven todas las tareas: dejar de participar no les quita ninguna
+            tombstone_filter["user_ids"] = {"$exists": False}
+
+        columns = await collection_kanban_columns.find(
+            seq_filter, {"tasks": 0}
+        ).sort("sync_seq", 1).to_list(length=limit)
+        tasks = await collection_tasks.find(task_filter, OUTBOX_PROJECTION).sort("sync_seq", 1).to_list(length=limit)
+        tombstones = await collection_sync_tombstones.find(
+            tombstone_filter
+        ).sort("seq", 1).to_list(length=limit)
+
+        # Si alguna consulta llegó al límite, la marca de agua no puede pasar del
+        # menor de los máximos para no saltarse cambios en las demás
+        has_more = False
+        watermark = None
+        for docs, field in ((columns, "sync_seq"), (tasks, "sync_seq"), (tombstones, "seq")):
+            if len(docs) == limit:
+                has_more = True
+                last_seq = docs[-1][field]
+                watermark = last_seq if watermark is None else min(watermark, last_seq)
+        if watermark is None:
+            watermark = max(
+                [since]
+                + [doc["sync_seq"] for doc in columns]
+                + [doc["sync_seq"] for doc in tasks]
+                + [doc["seq"] for doc in tombstones]
+            )
+        else:
+            columns = [doc for doc in columns if doc["sync_seq"] <= watermark]
+            tasks = [doc for doc in tasks if doc["sync_seq"] <= watermark]
+            tombstones = [doc for doc in tombstones if doc["seq"] <= watermark]
+
+        # No avanzar la marca de agua por encima de escrituras que aún se pueden estar guardando
+        watermark = settled_watermark(
+            since,
+            watermark,
+            [(doc["sync_seq"], doc.get("sync_at")) for doc in columns + tasks]
+            + [(doc["seq"], doc.get("sync_at")) for doc in tombstones]
+        )
+
+        # Una tarea que el usuario dejó de ver y volvió a recibir llega solo como tarea
+        returned_tasks = {task["id"] for task in tasks}
+        tombstones = [
+            doc for doc in tombstones
+            if not (doc["kind"] == "task" and doc.get("user_ids") and doc["entity_id"] in returned_tasks)
+        ]
+
+        logger.info(f"Found {len(columns)} columns, {len(tasks)} tasks and {len(tombstones)} deletions")
+        return {
+            "columns": [serialize_doc(column) for column in columns],
+            "tasks": [serialize_doc(task) for task in tasks],
+            "deleted": {
+                "columns": [t["entity_id"] for t in tombstones if t["kind"] == "column"],
+                "tasks": [t["entity_id"] for t in tombstones if t["kind"] == "task"]
+            },
+            "watermark": watermark,
+            "has_more": has_more
+        }
+    except (ValueError, PermissionError) as e:
+        logger.error(f"Validation error fetching kanban changes: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching kanban changes: {str(e)}")
+        raise
+
+async def get_cfd(board_id: int, start: datetime, end: datetime, user_id: int, user_role: str):
+    """Obtiene el diagrama de flujo acumulado de un tablero"""
+    try:
+        await check_board_access(board_id, user_id, user_role)
+        logger.info(f"Fetching cumulative flow for board {board_id}")
+        return await TransitionService.get_cfd(board_id, start, end)
+    except (ValueError, PermissionError) as e:
+        logger.error(f"Validation error fetching cumulative flow: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching cumulative flow: {str(e)}")
+        raise
+
+async def get_dwell_times(board_id: int, start: datetime, end: datetime, user_id: int, user_role: str):
+    """Obtiene los percentiles del tiempo de permanencia por columna de un tablero"""
+    try:
+        await check_board_access(board_id, user_id, user_role)
+        logger.info(f"Fetching dwell times for board {board_id}")
+        return await TransitionService.get_dwell_times(board_id, start, end)
+    except (ValueError, PermissionError) as e:
+        logger.error(f"Validation error fetching dwell times: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching dwell times: {str(e)}")
+        raise
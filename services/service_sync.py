@@ -0,0 +1,90 @@
+from database.database import collection_sync_tombstones, get_next_sequence
+from datetime import datetime, timedelta
+import logging
+import os
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SYNC_COUNTER = "sync_seq"
+# Tiempo máximo entre reservar una secuencia y que la escritura que la usa se guarde
+SYNC_SETTLE_SECONDS = float(os.getenv("SYNC_SETTLE_SECONDS", "10"))
+
+async def next_sync_seq() -> int:
+    """Obtiene el siguiente número de secuencia de sincronización"""
+    try:
+        return await get_next_sequence(SYNC_COUNTER)
+    except Exception as e:
+        logger.error(f"Error getting next sync sequence: {str(e)}")
+        raise
+
+async def next_sync_fields() -> dict:
+    """Secuencia de sincronización junto con el instante en que se reservó"""
+    return {"sync_seq": await next_sync_seq(), "sync_at": datetime.utcnow()}
+
+def settled_watermark(since: int, watermark: int, changes: list) -> int:
+    """Limita la marca de agua a las secuencias que ya no pueden tener escrituras anteriores pendientes.
+
+    Las secuencias se reservan antes de escribir, así que una escritura con la
+    secuencia N+1 puede guardarse antes que la de N. changes son pares
+    (secuencia, instante de reserva) de lo devuelto al cliente: la marca de agua
+    no pasa de lo anterior al primer cambio reservado hace menos de
+    SYNC_SETTLE_SECONDS. Ese cambio se devuelve igualmente y se repite en la
+    siguiente sincronización.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    unsettled = [seq for seq, sync_at in changes if sync_at is not None and sync_at > cutoff]
+    if not unsettled:
+        return watermark
+    first_unsettled = min(unsettled)
+    return min(watermark, max([since] + [seq for seq, _ in changes if seq < first_unsettled]))
+
+async def record_tombstone(kind: str, entity_id: int, board_id: int = None, user_ids: list = None):
+    """Registra la eliminación de una tarea o columna para los clientes que sincronizan.
+
+    Con user_ids la eliminación solo va a los clientes de esos usuarios, por
+    ejemplo cuando dejan de participar en una tarea que sigue existiendo.
+    """
+    try:
+        seq = await next_sync_seq()
+        deleted_at = datetime.utcnow()
+        tombstone = {
+            "kind": kind,
+            "entity_id": entity_id,
+            "board_id": board_id,
+            "seq": seq,
+            "sync_at": deleted_at,
+            "deleted_at": deleted_at
+        }
+        if user_ids:
+            tombstone["user_ids"] = list(user_ids)
+        await collection_sync_tombstones.insert_one(tombstone)
+        return seq
+    except Exception as e:
+        logger.error(f"Error recording tombstone for {kind} {entity_id}: {str(e)}")
+        raise
+
+async def record_tombstones(kind: str, entities: list):
+    """Registra en lote la eliminación de varias entidades dadas como pares (id, board_id)"""
+    if not entities:
+        return None
+    try:
+        last_seq = await get_next_sequence(SYNC_COUNTER, len(entities))
+        first_seq = last_seq - len(entities) + 1
+        deleted_at = datetime.utcnow()
+        await collection_sync_tombstones.insert_many([
+            {
+                "kind": kind,
+                "entity_id": entity_id,
+                "board_id": board_id,
+                "seq": first_seq + i,
+                "sync_at": deleted_at,
+                "deleted_at": deleted_at
+            }
+            for i, (entity_id, board_id) in enumerate(entities)
+        ])
+        return last_seq
+    except Exception as e:
+        logger.error(f"Error recording {len(entities)} {kind} tombstones: {str(e)}")
+        raise
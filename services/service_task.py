@@ -1,9 +1,22 @@
-from database.database import collection_tasks, collection_users
-from models.model_task import TaskCreate, Task
+from database.database import collection_tasks, collection_tasks_archive, collection_users, collection_kanban_columns
+from models.model_task import TaskCreate, TaskUpdate, Task
+from models.model_board import DEFAULT_BOARD_ID
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
 import logging
 from models.model_user import Role
+from services.service_sync import next_sync_fields, record_tombstone
+from services.service_kanban import increment_column_count, reserve_column_slot, invalidate_board_cache
+from services.service_board import check_board_access
+from services.statistics_service import StatisticsService
+from services.transition_service import TransitionService, lifecycle_fields
+from services.typeahead_service import index_task, unindex_task
+from services.service_calendar import touch_task_calendars
+from services.due_date_scheduler import schedule_task, unschedule_task
+from services.audit_service import record_task_change
+from services.outbox_service import OUTBOX_PROJECTION, task_events, outbox_update, with_outbox, relay_events
+from services.service_webhook import notify_outbox
 from typing import List, Optional
 
 # Configurar logging
@@ -26,25 +39,42 @@ async def get_next_id():
         logger.error(f"Error getting next task id: {str(e)}")
         raise
 
-async def get_tasks(user_id: int, user_role: str) -> List[Task]:
+def task_filter(user_id: int, user_role: str, board_id: Optional[int] = None, labels: Optional[List[str]] = None) -> dict:
+    """Filtro de las tareas visibles para el usuario, con los filtros opcionales de tablero y etiquetas"""
+    query = {}
+    if board_id is not None:
+        query["board_id"] = board_id
+    if labels:
+        # El índice multiclave de labels resuelve la condición de tener todas las etiquetas
+        query["labels"] = {"$all": labels}
+    # Si es admin, obtiene todas las tareas
+    if user_role != "admin":
+        # Si no es admin, solo obtiene sus propias tareas
+        query["$or"] = [
+            {"assigned_to": user_id},
+            {"created_by": user_id}
+        ]
+    return query
+
+async def get_tasks(
+    user_id: int,
+    user_role: str,
+    board_id: Optional[int] = None,
+    include_archived: bool = False,
+    labels: Optional[List[str]] = None
+) -> List[Task]:
     """Obtiene todas las tareas según el rol del usuario"""
     try:
         logger.info("Fetching tasks")
-        # Si es admin, obtiene todas las tareas
-        if user_role == "admin":
-            cursor = collection_tasks.find()
-        else:
-            # Si no es admin, solo obtiene sus propias tareas
-            cursor = collection_tasks.find({
-                "$or": [
-                    {"assigned_to": user_id},
-                    {"created_by": user_id}
-                ]
-            })
+        query = task_filter(user_id, user_role, board_id, labels)
+        collections = [collection_tasks]
+        if include_archived:
+            collections.append(collection_tasks_archive)
         
         tasks = []
-        async for doc in cursor:
-            tasks.append(Task(**serialize_doc(doc)))
+        for collection in collections:
+            async for doc in collection.find(query):
+                tasks.append(Task(**serialize_doc(doc)))
         
         logger.info(f"Found {len(tasks)} tasks")
         return tasks
@@ -52,6 +82,47 @@ async def get_tasks(user_id: int, user_role: str) -> List[Task]:
         logger.error(f"Error fetching tasks: {str(e)}")
         raise
 
+def facet_counts(field: str) -> list:
+    """Etapas de un $facet que cuentan las tareas por el valor de un campo"""
+    return [
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1, "_id": 1}}
+    ]
+
+async def get_task_facets(
+    user_id: int,
+    user_role: str,
+    board_id: Optional[int] = None,
+    include_archived: bool = False,
+    labels: Optional[List[str]] = None
+) -> dict:
+    """Cuenta las tareas del filtro actual por etiqueta, prioridad, estado, columna y asignado en una consulta"""
+    try:
+        logger.info("Fetching task facets")
+        query = task_filter(user_id, user_role, board_id, labels)
+        pipeline = [{"$match": query}]
+        if include_archived:
+            pipeline.append({"$unionWith": {"coll": collection_tasks_archive.name, "pipeline": [{"$match": query}]}})
+        pipeline.append({"$facet": {
+            "total": [{"$count": "count"}],
+            "labels": [{"$unwind": "$labels"}, *facet_counts("labels")],
+            "priority": facet_counts("priority"),
+            "status": facet_counts("status"),
+            "column": facet_counts("column_id"),
+            "assignee": facet_counts("assigned_to")
+        }})
+        result = (await collection_tasks.aggregate(pipeline).to_list(length=1))[0]
+
+        total = result.pop("total")
+        facets = {
+            name: [{"value": group["_id"], "count": group["count"]} for group in groups]
+            for name, groups in result.items()
+        }
+        return {"total": total[0]["count"] if total else 0, **facets}
+    except Exception as e:
+        logger.error(f"Error fetching task facets: {str(e)}")
+        raise
+
 async def get_user_tasks(user_id: int, current_user_id: int, current_user_role: str) -> List[Task]:
     """Obtiene las tareas de un usuario específico"""
     try:
@@ -85,7 +156,25 @@ async def get_user_tasks(user_id: int, current_user_id: int, current_user_role:
         logger.error(f"Error fetching user tasks: {str(e)}")
         raise
 
-async def create_task(task: TaskCreate, current_user_id: int) -> Task:
+async def resolve_task_board(task: TaskCreate) -> int:
+    """Determina el tablero de una tarea a partir de su columna o del tablero indicado"""
+    if task.column_id is None:
+        return task.board_id if task.board_id is not None else DEFAULT_BOARD_ID
+    column = await collection_kanban_columns.find_one({"id": task.column_id}, {"board_id": 1})
+    if not column:
+        raise ValueError(f"Columna con id {task.column_id} no encontrada")
+    column_board_id = column.get("board_id", DEFAULT_BOARD_ID)
+    if task.board_id is not None and task.board_id != column_board_id:
+        raise ValueError(f"La columna {task.column_id} no pertenece al tablero {task.board_id}")
+    return column_board_id
+
+async def record_participant_removals(before: dict, after: dict):
+    """Envía una eliminación a los clientes de los usuarios que dejaron de participar en la tarea"""
+    removed = StatisticsService.task_participants(before) - StatisticsService.task_participants(after)
+    if removed:
+        await record_tombstone("task", after["id"], after.get("board_id", DEFAULT_BOARD_ID), sorted(removed))
+
+async def create_task(task: TaskCreate, current_user_id: int, current_user_role: str = "user") -> Task:
     """Crea una nueva tarea"""
     try:
         # Verificar que el usuario creador existe
@@ -99,18 +188,48 @@ async def create_task(task: TaskCreate, current_user_id: int) -> Task:
             if not user:
                 raise ValueError(f"Usuario asignado con id {assigned_id} no encontrado")
 
+        # Verificar que el creador es miembro del tablero
+        board_id = await resolve_task_board(task)
+        await check_board_access(board_id, current_user_id, current_user_role)
+
+        # La columna inicial debe respetar su límite WIP
+        if task.column_id is not None:
+            await reserve_column_slot(task.column_id, board_id)
+
         # Crear el documento de la tarea
         task_dict = task.model_dump()
+        task_dict["board_id"] = board_id
         task_dict["id"] = await get_next_id()
         task_dict["created_by"] = current_user_id
         task_dict["created_at"] = datetime.utcnow()
         task_dict["updated_at"] = datetime.utcnow()
+        task_dict.update(await next_sync_fields())
+        task_dict.update(lifecycle_fields(None, task_dict, task_dict["created_at"]))
+        # Los eventos para los webhooks se guardan en el mismo documento que la tarea
+        events = task_events(None, task_dict, task_dict["created_at"], current_user_id)
+        if events:
+            task_dict["pending_events"] = events
+            task_dict["outbox_pending"] = True
         
         logger.info(f"Creating new task with id: {task_dict['id']}")
-        result = await collection_tasks.insert_one(task_dict)
+        try:
+            result = await collection_tasks.insert_one(task_dict)
+        except Exception:
+            # Liberar el hueco reservado en la columna
+            await increment_column_count(task_dict.get("column_id"), -1)
+            raise
+        if events:
+            notify_outbox()
         
         if result.inserted_id:
+            invalidate_board_cache(board_id)
             created_task = await collection_tasks.find_one({"_id": result.inserted_id})
+            await StatisticsService.on_task_change(None, created_task)
+            await TransitionService.record_transition(None, created_task)
+            await touch_task_calendars(None, created_task)
+            await record_task_change("create", None, created_task, current_user_id)
+            index_task(created_task)
+            schedule_task(created_task)
             logger.info(f"Task created successfully with id: {created_task['id']}")
             return Task(**serialize_doc(created_task))
         raise ValueError("Error al crear la tarea")
@@ -124,7 +243,7 @@ async def create_task(task: TaskCreate, current_user_id: int) -> Task:
 async def get_task(task_id: int):
     try:
         logger.info(f"Fetching task with id: {task_id}")
-        task = await collection_tasks.find_one({"id": task_id})
+        task = await collection_tasks.find_one({"id": task_id}, OUTBOX_PROJECTION)
         if task:
             logger.info(f"Task found with id: {task_id}")
             return serialize_doc(task)
@@ -145,24 +264,132 @@ async def update_task(task_id: int, task: TaskCreate, current_user_id: int, curr
         if current_user_role != "admin" and existing_task["created_by"] != current_user_id:
             raise ValueError("No tienes permiso para actualizar esta tarea")
 
-        task_dict = task.model_dump()
+        # Verificar que el usuario sigue siendo miembro del tablero de la tarea
+        board_id = existing_task.get("board_id", DEFAULT_BOARD_ID)
+        await check_board_access(board_id, current_user_id, current_user_role)
+
+        # El tablero de una tarea se conserva al actualizarla
+        task_dict = task.model_dump(exclude={"board_id"})
+        # Un cambio de columna debe quedarse en el tablero y respetar el límite WIP
+        column_changed = task_dict.get("column_id") != existing_task.get("column_id")
+        if column_changed and task_dict.get("column_id") is not None:
+            await reserve_column_slot(task_dict["column_id"], board_id)
         task_dict["updated_at"] = datetime.utcnow()
+        task_dict.update(await next_sync_fields())
+        task_dict.update(lifecycle_fields(existing_task, task_dict, task_dict["updated_at"]))
+        outbox = outbox_update(existing_task, task_dict, task_dict["updated_at"], current_user_id)
         
-        await collection_tasks.update_one(
-            {"_id": ObjectId(task_id)},
-            {"$set": task_dict}
-        )
+        try:
+            await collection_tasks.update_one(
+                {"_id": ObjectId(task_id)},
+                with_outbox({"$set": task_dict}, outbox)
+            )
+        except Exception:
+            if column_changed:
+                await increment_column_count(task_dict.get("column_id"), -1)
+            raise
+        if outbox:
+            notify_outbox()
+        if column_changed:
+            await increment_column_count(existing_task.get("column_id"), -1)
+        invalidate_board_cache(board_id)
         
         updated_task = await collection_tasks.find_one({"_id": ObjectId(task_id)})
+        await record_participant_removals(existing_task, updated_task)
+        await StatisticsService.on_task_change(existing_task, updated_task)
+        await TransitionService.record_transition(existing_task, updated_task)
+        await touch_task_calendars(existing_task, updated_task)
+        await record_task_change("update", existing_task, updated_task, current_user_id)
+        index_task(updated_task)
+        schedule_task(updated_task)
         logger.info(f"Tarea {task_id} actualizada exitosamente")
         return Task(**serialize_doc(updated_task))
-    except ValueError as e:
+    except (ValueError, PermissionError) as e:
         logger.error(f"Error de validación: {str(e)}")
         raise
     except Exception as e:
         logger.error(f"Error al actualizar tarea: {str(e)}")
         raise
 
+async def patch_task(task_id: int, task: TaskUpdate, current_user_id: int, current_user_role: str) -> Task:
+    """Actualiza parcialmente una tarea escribiendo solo los campos que cambian"""
+    try:
+        existing_task = await collection_tasks.find_one({"id": task_id})
+        if not existing_task:
+            raise ValueError("Tarea no encontrada")
+
+        if current_user_role != "admin" and existing_task["created_by"] != current_user_id:
+            raise ValueError("No tienes permiso para actualizar esta tarea")
+
+        # Verificar que el usuario sigue siendo miembro del tablero de la tarea
+        board_id = existing_task.get("board_id", DEFAULT_BOARD_ID)
+        await check_board_access(board_id, current_user_id, current_user_role)
+
+        # Quedarse solo con los campos enviados cuyo valor es distinto del actual
+        changes = {
+            field: value
+            for field, value in task.model_dump(exclude_unset=True).items()
+            if existing_task.get(field) != value
+        }
+        if not changes:
+            logger.info(f"Tarea {task_id} sin cambios, no se escribe")
+            existing_task.pop("_id")
+            return Task(**existing_task)
+
+        if "assigned_to" in changes and changes["assigned_to"] is not None:
+            user = await collection_users.find_one({"id": changes["assigned_to"]}, {"_id": 1})
+            if not user:
+                raise ValueError(f"Usuario asignado con id {changes['assigned_to']} no encontrado")
+
+        # Un cambio de columna debe quedarse en el tablero y respetar el límite WIP
+        if changes.get("column_id") is not None:
+            await reserve_column_slot(changes["column_id"], board_id)
+
+        changes["updated_at"] = datetime.utcnow()
+        changes.update(await next_sync_fields())
+        changes.update(lifecycle_fields(existing_task, changes, changes["updated_at"]))
+        outbox = outbox_update(existing_task, changes, changes["updated_at"], current_user_id)
+        try:
+            updated_task = await collection_tasks.find_one_and_update(
+                {"id": task_id},
+                with_outbox({"$set": changes}, outbox),
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception:
+            if changes.get("column_id") is not None:
+                await increment_column_count(changes["column_id"], -1)
+            raise
+        if not updated_task:
+            # La tarea se eliminó o archivó entre la lectura y la escritura
+            if changes.get("column_id") is not None:
+                await increment_column_count(changes["column_id"], -1)
+            raise ValueError("Tarea no encontrada")
+        if outbox:
+            notify_outbox()
+        if "column_id" in changes:
+            await increment_column_count(existing_task.get("column_id"), -1)
+        invalidate_board_cache(board_id)
+        if "assigned_to" in changes:
+            await record_participant_removals(existing_task, updated_task)
+        await StatisticsService.on_task_change(existing_task, updated_task)
+        await TransitionService.record_transition(existing_task, updated_task)
+        await touch_task_calendars(existing_task, updated_task)
+        await record_task_change("update", existing_task, updated_task, current_user_id)
+        if {"title", "assigned_to"} & changes.keys():
+            index_task(updated_task)
+        if {"due_date", "status"} & changes.keys():
+            schedule_task(updated_task)
+
+        logger.info(f"Tarea {task_id} actualizada parcialmente: {', '.join(changes)}")
+        updated_task.pop("_id")
+        return Task(**updated_task)
+    except (ValueError, PermissionError) as e:
+        logger.error(f"Error de validación: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error al actualizar parcialmente la tarea: {str(e)}")
+        raise
+
 async def delete_task(task_id: int, current_user_id: int, current_user_role: str) -> bool:
     """Elimina una tarea"""
     try:
@@ -175,6 +402,19 @@ async def delete_task(task_id: int, current_user_id: int, current_user_role: str
             raise ValueError("No tienes permiso para eliminar esta tarea")
 
         result = await collection_tasks.delete_one({"_id": ObjectId(task_id)})
+        if result.deleted_count:
+            board_id = existing_task.get("board_id", DEFAULT_BOARD_ID)
+            await increment_column_count(existing_task.get("column_id"), -1)
+            invalidate_board_cache(board_id)
+            await record_tombstone("task", existing_task["id"], board_id)
+            await StatisticsService.on_task_change(existing_task, None)
+            await TransitionService.record_transition(existing_task, None)
+            await touch_task_calendars(existing_task, None)
+            await record_task_change("delete", existing_task, None, current_user_id)
+            unindex_task(existing_task["id"])
+            unschedule_task(existing_task["id"])
+            # Los eventos que el relevo aún no había copiado se pasan directamente a la bandeja
+            await relay_events(existing_task.get("pending_events"))
         logger.info(f"Tarea {task_id} eliminada exitosamente")
         return result.deleted_count > 0
     except ValueError as e:
@@ -195,20 +435,42 @@ async def move_task(task_id: int, new_column_id: int, current_user_id: int, curr
         if current_user_role != "admin" and existing_task["created_by"] != current_user_id:
             raise ValueError("No tienes permiso para mover esta tarea")
 
+        # Verificar que el usuario sigue siendo miembro del tablero de la tarea
+        board_id = existing_task.get("board_id", DEFAULT_BOARD_ID)
+        await check_board_access(board_id, current_user_id, current_user_role)
+
+        if existing_task.get("column_id") == new_column_id:
+            return Task(**serialize_doc(existing_task))
+
+        # La columna destino debe pertenecer al mismo tablero y respetar su límite WIP
+        await reserve_column_slot(new_column_id, board_id)
+
+        now = datetime.utcnow()
+        outbox = outbox_update(existing_task, {"column_id": new_column_id}, now, current_user_id)
         await collection_tasks.update_one(
             {"_id": ObjectId(task_id)},
-            {
+            with_outbox({
                 "$set": {
                     "column_id": new_column_id,
-                    "updated_at": datetime.utcnow()
+                    "updated_at": now,
+                    **await next_sync_fields(),
+                    **lifecycle_fields(existing_task, {"column_id": new_column_id}, now)
                 }
-            }
+            }, outbox)
         )
+        if outbox:
+            notify_outbox()
+        await increment_column_count(existing_task.get("column_id"), -1)
+        invalidate_board_cache(board_id)
         
         updated_task = await collection_tasks.find_one({"_id": ObjectId(task_id)})
+        await StatisticsService.on_task_change(existing_task, updated_task)
+        await TransitionService.record_transition(existing_task, updated_task)
+        await touch_task_calendars(existing_task, updated_task)
+        await record_task_change("move", existing_task, updated_task, current_user_id)
         logger.info(f"Tarea {task_id} movida a la columna {new_column_id}")
         return Task(**serialize_doc(updated_task))
-    except ValueError as e:
+    except (ValueError, PermissionError) as e:
         logger.error(f"Error de validación: {str(e)}")
         raise
     except Exception as e:
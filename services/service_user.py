@@ -1,33 +1,74 @@
-from database.database import collection_users, collection_tasks
+from database.database import collection_users, collection_tasks, get_next_sequence
 from models.model_user import UserCreate
 from datetime import datetime
 from bson import ObjectId
+from pydantic import ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+import asyncio
+import csv
+import json
 import logging
-from services.service_auth import get_password_hash
+import os
+from services.password_hashing import hash_passwords
+from services.process_pool import PROCESS_POOL_WORKERS, run_in_process
+from services.service_user_cascade import create_cascade_job, activate_cascade_job, cancel_cascade_job
+from services.typeahead_service import index_user, unindex_user
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def get_next_id():
-    try:
-        last_user = await collection_users.find_one(sort=[("id", -1)])
-        if last_user:
-            return last_user["id"] + 1
-        return 1
-    except Exception as e:
-        logger.error(f"Error getting next id: {str(e)}")
-        raise
+USERS_COUNTER = "users"
+USER_IMPORT_BATCH_SIZE = int(os.getenv("USER_IMPORT_BATCH_SIZE", "500"))
+IMPORT_FORMATS = ["csv", "ndjson"]
+USER_TASKS_PAGE_SIZE = 20
+# Campos que nunca salen en el detalle del usuario
+HIDDEN_USER_FIELDS = {"password": 0, "email_key": 0, "username_key": 0}
+# Resumen ligero de las tareas que se incluye en el detalle del usuario
+TASK_SUMMARY_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "title": 1,
+    "status": 1,
+    "priority": 1,
+    "due_date": 1,
+    "column_id": 1,
+    "board_id": 1,
+    "assigned_to": 1,
+    "created_by": 1,
+    "updated_at": 1
+}
+
+def user_keys(username: str, email: str) -> dict:
+    """Claves normalizadas sobre las que los índices únicos impiden duplicados sin distinguir mayúsculas"""
+    return {"username_key": username.strip().lower(), "email_key": email.strip().lower()}
+
+def duplicate_user_error(error: DuplicateKeyError) -> ValueError:
+    """Traduce el índice único que ha fallado al mensaje de validación correspondiente"""
+    key_pattern = (error.details or {}).get("keyPattern", {})
+    if "email_key" in key_pattern or "email_key" in str(error):
+        return ValueError("El email ya está registrado")
+    if "username_key" in key_pattern or "username_key" in str(error):
+        return ValueError("El nombre de usuario ya está en uso")
+    return ValueError("El usuario ya existe")
 
 def serialize_doc(doc):
     if doc:
         doc["_id"] = str(doc["_id"])
     return doc
 
+def serialize_user(doc):
+    """Serializa un usuario sin sus claves normalizadas, que son internas de los índices únicos"""
+    if doc:
+        doc.pop("email_key", None)
+        doc.pop("username_key", None)
+    return serialize_doc(doc)
+
 async def get_users():
     try:
         logger.info("Fetching all users")
-        users = await collection_users.find().to_list(length=100)
+        users = await collection_users.find({}, {"email_key": 0, "username_key": 0}).to_list(length=100)
         logger.info(f"Found {len(users)} users")
         return [serialize_doc(user) for user in users]
     except Exception as e:
@@ -36,35 +77,30 @@ async def get_users():
 
 async def create_user(user: UserCreate):
     try:
-        # Verificar si el email ya existe
-        existing_user = await collection_users.find_one({"email": user.email})
-        if existing_user:
-            raise ValueError("El email ya está registrado")
-
-        # Verificar si el username ya existe
-        existing_username = await collection_users.find_one({"username": user.username})
-        if existing_username:
-            raise ValueError("El nombre de usuario ya está en uso")
-
         # Crear el documento del usuario con id y fechas automáticas
         user_dict = user.model_dump()
-        user_dict["id"] = await get_next_id()
+        user_dict.update(user_keys(user.username, user.email))
+        user_dict["id"] = await get_next_sequence(USERS_COUNTER)
         
-        # Hashear la contraseña antes de guardarla
-        hashed_password = get_password_hash(user_dict["password"])
+        # Hashear la contraseña antes de guardarla, fuera del bucle de eventos
+        hashed_password = (await run_in_process(hash_passwords, [user_dict["password"]]))[0]
         user_dict["password"] = hashed_password
         
         current_time = datetime.now()
         user_dict["created_at"] = current_time
         user_dict["updated_at"] = current_time
         
+        # Los índices únicos de email_key y username_key rechazan los duplicados, también entre altas concurrentes
         logger.info(f"Creating new user: {user.username}")
-        new_user = await collection_users.insert_one(user_dict)
+        try:
+            new_user = await collection_users.insert_one(user_dict)
+        except DuplicateKeyError as e:
+            raise duplicate_user_error(e)
         
         if new_user.inserted_id:
-            created_user = await collection_users.find_one({"_id": new_user.inserted_id})
-            logger.info(f"User created successfully with id: {created_user['id']}")
-            return {"user": serialize_doc(created_user), "message": "User created successfully"}
+            index_user(user_dict)
+            logger.info(f"User created successfully with id: {user_dict['id']}")
+            return {"user": serialize_user(user_dict), "message": "User created successfully"}
         return {"message": "Failed to create user"}
     except ValueError as e:
         logger.error(f"Validation error creating user: {str(e)}")
@@ -73,63 +109,91 @@ async def create_user(user: UserCreate):
         logger.error(f"Error creating user: {str(e)}")
         raise
 
-async def get_user(user_id: int, include_tasks: bool = False):
+def user_tasks_filter(user_id: int) -> dict:
+    return {"$or": [{"assigned_to": user_id}, {"created_by": user_id}]}
+
+def task_page(tasks: list, limit: int) -> dict:
+    """Corta la página pedida y devuelve el cursor de la siguiente si hay más tareas"""
+    return {
+        "tasks": tasks[:limit],
+        "next_cursor": tasks[limit - 1]["id"] if len(tasks) > limit else None
+    }
+
+async def get_user(user_id: int, include_tasks: bool = False, task_limit: int = USER_TASKS_PAGE_SIZE):
     try:
         logger.info(f"Fetching user with id: {user_id}")
-        user = await collection_users.find_one({"id": user_id})
-        if not user:
+        pipeline = [
+            {"$match": {"id": user_id}},
+            {"$project": HIDDEN_USER_FIELDS}
+        ]
+        if include_tasks:
+            # Recuentos por estado y primera página de resúmenes en la misma consulta
+            pipeline.append({"$lookup": {
+                "from": collection_tasks.name,
+                "pipeline": [
+                    {"$match": user_tasks_filter(user_id)},
+                    {"$facet": {
+                        "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+                        "page": [
+                            {"$sort": {"id": 1}},
+                            {"$limit": task_limit + 1},
+                            {"$project": TASK_SUMMARY_PROJECTION}
+                        ]
+                    }}
+                ],
+                "as": "task_data"
+            }})
+        users = await collection_users.aggregate(pipeline).to_list(length=1)
+        if not users:
             logger.info(f"User with id {user_id} not found")
             return None
-            
+
+        user = users[0]
         if include_tasks:
-            # Obtener las tareas del usuario
-            tasks = await collection_tasks.find({
-                "$or": [
-                    {"assigned_to": user_id},
-                    {"created_by": user_id}
-                ]
-            }).to_list(length=100)
-            user["tasks"] = [serialize_doc(task) for task in tasks]
-            
+            task_data = user.pop("task_data")[0]
+            by_status = {group["_id"]: group["count"] for group in task_data["by_status"]}
+            user["task_counts"] = {"total": sum(by_status.values()), "by_status": by_status}
+            user.update(task_page(task_data["page"], task_limit))
         return serialize_doc(user)
     except Exception as e:
         logger.error(f"Error fetching user: {str(e)}")
         raise
 
-async def update_user(user_id: int, user: UserCreate):
+async def get_user_tasks(user_id: int, after: int = 0, limit: int = USER_TASKS_PAGE_SIZE):
+    """Siguiente página de resúmenes de tareas del usuario a partir del cursor"""
     try:
-        # Verificar si el usuario existe
-        existing_user = await collection_users.find_one({"id": user_id})
-        if not existing_user:
-            raise ValueError("Usuario no encontrado")
-
-        # Verificar si el nuevo email ya existe (excluyendo el usuario actual)
-        if user.email != existing_user["email"]:
-            email_exists = await collection_users.find_one({"email": user.email})
-            if email_exists:
-                raise ValueError("El email ya está registrado")
-
-        # Verificar si el nuevo username ya existe (excluyendo el usuario actual)
-        if user.username != existing_user["username"]:
-            username_exists = await collection_users.find_one({"username": user.username})
-            if username_exists:
-                raise ValueError("El nombre de usuario ya está en uso")
+        logger.info(f"Fetching tasks of user {user_id} after {after}")
+        tasks = await collection_tasks.find(
+            {**user_tasks_filter(user_id), "id": {"$gt": after}},
+            TASK_SUMMARY_PROJECTION
+        ).sort("id", 1).to_list(length=limit + 1)
+        return task_page(tasks, limit)
+    except Exception as e:
+        logger.error(f"Error fetching user tasks: {str(e)}")
+        raise
 
+async def update_user(user_id: int, user: UserCreate):
+    try:
         user_dict = user.model_dump()
+        user_dict.update(user_keys(user.username, user.email))
         user_dict["updated_at"] = datetime.now()
         
+        # Un email o username ya usados por otro usuario los rechazan los índices únicos
         logger.info(f"Updating user with id: {user_id}")
-        updated_user = await collection_users.update_one(
-            {"id": user_id},
-            {"$set": user_dict}
-        )
+        try:
+            updated_user = await collection_users.find_one_and_update(
+                {"id": user_id},
+                {"$set": user_dict},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError as e:
+            raise duplicate_user_error(e)
         
-        if updated_user.modified_count:
-            user = await collection_users.find_one({"id": user_id})
-            logger.info(f"User updated successfully: {user['username']}")
-            return {"user": serialize_doc(user), "message": "User updated successfully"}
-        logger.info(f"User with id {user_id} not found for update")
-        return {"message": "Failed to update user"}
+        if not updated_user:
+            raise ValueError("Usuario no encontrado")
+        index_user(updated_user)
+        logger.info(f"User updated successfully: {updated_user['username']}")
+        return {"user": serialize_user(updated_user), "message": "User updated successfully"}
     except ValueError as e:
         logger.error(f"Validation error updating user: {str(e)}")
         raise
@@ -137,18 +201,36 @@ async def update_user(user_id: int, user: UserCreate):
         logger.error(f"Error updating user: {str(e)}")
         raise
 
-async def delete_user(user_id: int):
+async def check_reassign_target(user_id: int, reassign_to: int = None):
+    """Verifica que el usuario al que se pasan las tareas existe, está activo y es otro"""
+    if reassign_to is None:
+        return
+    if reassign_to == user_id:
+        raise ValueError("No se pueden reasignar las tareas al mismo usuario")
+    target = await collection_users.find_one({"id": reassign_to}, {"is_active": 1})
+    if not target or not target.get("is_active", True):
+        raise ValueError(f"Usuario con id {reassign_to} no encontrado o inactivo")
+
+async def delete_user(user_id: int, reassign_to: int = None, requested_by: int = None):
     try:
-        # Verificar si el usuario existe
-        existing_user = await collection_users.find_one({"id": user_id})
-        if not existing_user:
-            raise ValueError("Usuario no encontrado")
+        await check_reassign_target(user_id, reassign_to)
 
+        if not await collection_users.find_one({"id": user_id}, {"_id": 1}):
+            logger.info(f"User with id {user_id} not found for deletion")
+            return {"message": "User not found"}
+
+        # Registrar el trabajo antes de eliminar: si el proceso cae después de borrar
+        # al usuario, el trabajador lo encuentra en espera y lo reanuda
+        job = await create_cascade_job(user_id, "delete", reassign_to, requested_by, waiting=True)
         logger.info(f"Deleting user with id: {user_id}")
         deleted_user = await collection_users.delete_one({"id": user_id})
         if deleted_user.deleted_count:
+            unindex_user(user_id)
+            # Las tareas del usuario se reasignan o liberan en segundo plano
+            await activate_cascade_job(job["id"])
             logger.info(f"User with id {user_id} deleted successfully")
-            return {"message": "User deleted successfully"}
+            return {"message": "User deleted successfully", "cascade_job_id": job["id"]}
+        await cancel_cascade_job(job["id"])
         logger.info(f"User with id {user_id} not found for deletion")
         return {"message": "User not found"}
     except ValueError as e:
@@ -158,10 +240,162 @@ async def delete_user(user_id: int):
         logger.error(f"Error deleting user: {str(e)}")
         raise
 
+async def deactivate_user(user_id: int, reassign_to: int = None, requested_by: int = None):
+    try:
+        await check_reassign_target(user_id, reassign_to)
 
+        logger.info(f"Deactivating user with id: {user_id}")
+        user = await collection_users.find_one_and_update(
+            {"id": user_id},
+            {"$set": {"is_active": False, "updated_at": datetime.now()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not user:
+            raise ValueError("Usuario no encontrado")
+        unindex_user(user_id)
+        job = await create_cascade_job(user_id, "deactivate", reassign_to, requested_by)
+        logger.info(f"User with id {user_id} deactivated successfully")
+        return {"user": serialize_user(user), "message": "User deactivated successfully", "cascade_job_id": job["id"]}
+    except ValueError as e:
+        logger.error(f"Validation error deactivating user: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error deactivating user: {str(e)}")
+        raise
 
+async def iter_lines(chunks):
+    """Divide en líneas el cuerpo de la petición a medida que llega"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer.strip():
+        yield buffer.decode("utf-8-sig").rstrip("\r")
 
+async def iter_import_rows(chunks, fmt: str):
+    """Genera (fila, datos, error) de un CSV con cabecera o de un NDJSON, una fila por línea"""
+    header = None
+    row = 0
+    async for line in iter_lines(chunks):
+        if fmt == "csv" and header is None:
+            header = [field.strip() for field in next(csv.reader([line]))]
+            continue
+        row += 1
+        if fmt == "csv":
+            values = next(csv.reader([line]))
+            if len(values) != len(header):
+                yield row, None, f"Se esperaban {len(header)} columnas y hay {len(values)}"
+                continue
+            yield row, dict(zip(header, values)), None
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row, None, f"JSON no válido: {e.msg}"
+            continue
+        if not isinstance(data, dict):
+            yield row, None, "Cada línea debe ser un objeto JSON"
+            continue
+        yield row, data, None
 
+async def hash_in_pool(passwords: list) -> list:
+    """Hashea las contraseñas repartiéndolas entre todos los procesos del pool"""
+    size = -(-len(passwords) // PROCESS_POOL_WORKERS)
+    chunks = [passwords[start:start + size] for start in range(0, len(passwords), size)]
+    hashed = await asyncio.gather(*(run_in_process(hash_passwords, chunk) for chunk in chunks))
+    return [password for chunk in hashed for password in chunk]
 
+async def insert_import_batch(batch: list) -> list:
+    """Inserta un lote de (fila, usuario, claves) y devuelve el resultado de cada fila"""
+    last_id = await get_next_sequence(USERS_COUNTER, len(batch))
+    first_id = last_id - len(batch) + 1
+    passwords = await hash_in_pool([user.password for _, user, _ in batch])
 
+    current_time = datetime.now()
+    documents = []
+    for index, ((_, user, keys), password) in enumerate(zip(batch, passwords)):
+        documents.append({
+            **user.model_dump(),
+            **keys,
+            "id": first_id + index,
+            "password": password,
+            "created_at": current_time,
+            "updated_at": current_time
+        })
 
+    errors = {}
+    try:
+        await collection_users.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") == 11000:
+                message = str(duplicate_user_error(DuplicateKeyError(error.get("errmsg", ""), 11000, error)))
+            else:
+                message = error.get("errmsg", "Error al insertar el usuario")
+            errors[error["index"]] = message
+
+    for index, document in enumerate(documents):
+        if index not in errors:
+            index_user(document)
+
+    return [
+        {"row": row, "status": "error", "error": errors[index]}
+        if index in errors else
+        {"row": row, "status": "created", "id": documents[index]["id"]}
+        for index, (row, _, _) in enumerate(batch)
+    ]
+
+async def import_users(chunks, fmt: str):
+    """Importa usuarios desde un CSV o NDJSON en streaming, por lotes"""
+    try:
+        if fmt not in IMPORT_FORMATS:
+            raise ValueError(f"Formato no soportado: {fmt}")
+
+        logger.info(f"Importing users from {fmt}")
+        results = []
+        batch = []
+        seen_emails, seen_usernames = set(), set()
+        async for row, data, error in iter_import_rows(chunks, fmt):
+            if error:
+                results.append({"row": row, "status": "error", "error": error})
+                continue
+            try:
+                user = UserCreate(**data)
+            except ValidationError as e:
+                message = "; ".join(
+                    f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in e.errors()
+                )
+                results.append({"row": row, "status": "error", "error": message})
+                continue
+
+            # Duplicados dentro del propio archivo; los de la base de datos los detectan los índices únicos
+            keys = user_keys(user.username, user.email)
+            if keys["email_key"] in seen_emails:
+                results.append({"row": row, "status": "error", "error": "El email está repetido en el archivo"})
+                continue
+            if keys["username_key"] in seen_usernames:
+                results.append({"row": row, "status": "error", "error": "El nombre de usuario está repetido en el archivo"})
+                continue
+            seen_emails.add(keys["email_key"])
+            seen_usernames.add(keys["username_key"])
+
+            batch.append((row, user, keys))
+            if len(batch) == USER_IMPORT_BATCH_SIZE:
+                results.extend(await insert_import_batch(batch))
+                batch = []
+        if batch:
+            results.extend(await insert_import_batch(batch))
+
+        results.sort(key=lambda result: result["row"])
+        created = sum(1 for result in results if result["status"] == "created")
+        logger.info(f"User import finished: {created} created, {len(results) - created} failed")
+        return {"created": created, "failed": len(results) - created, "results": results}
+    except ValueError as e:
+        logger.error(f"Validation error importing users: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error importing users: {str(e)}")
+        raise
@@ -0,0 +1,275 @@
+from database.database import collection_tasks, collection_tasks_archive, collection_users, get_database, get_next_sequence
+from models.model_task import COMPLETED_STATUSES
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, UpdateOne
+import asyncio
+import logging
+import os
+import time
+from services.service_sync import SYNC_COUNTER
+from services.service_kanban import invalidate_board_cache
+from services.typeahead_service import index_task
+from services.service_calendar import touch_calendars
+from services.audit_service import record_task_change
+from services.outbox_service import outbox_update, with_outbox
+from services.service_webhook import notify_outbox
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CASCADE_BATCH_SIZE = int(os.getenv("USER_CASCADE_BATCH_SIZE", "200"))
+# Fracción máxima del tiempo que el trabajo puede pasar escribiendo; el resto espera entre lotes
+CASCADE_MAX_DUTY_CYCLE = float(os.getenv("USER_CASCADE_MAX_DUTY_CYCLE", "0.25"))
+CASCADE_MIN_PAUSE_SECONDS = float(os.getenv("USER_CASCADE_MIN_PAUSE_SECONDS", "0.05"))
+CASCADE_LEASE_SECONDS = 60
+CASCADE_MAX_ATTEMPTS = 5
+JOBS_COUNTER = "user_cascade_jobs"
+CASCADE_ACTIONS = ["delete", "deactivate"]
+
+# Despierta al trabajador cuando se crea un trabajo nuevo
+_wakeup = asyncio.Event()
+
+def serialize_job(job: dict) -> dict:
+    if job:
+        job.pop("_id", None)
+    return job
+
+def cascade_filter(job: dict) -> dict:
+    """Tareas del usuario que el trabajo tiene que modificar"""
+    user_id = job["user_id"]
+    if job["action"] == "deactivate":
+        # Al desactivar solo se liberan las tareas asignadas que siguen abiertas
+        return {"assigned_to": user_id, "status": {"$nin": COMPLETED_STATUSES}}
+    return {"$or": [{"assigned_to": user_id}, {"created_by": user_id}]}
+
+def cascade_changes(job: dict, task: dict) -> dict:
+    """Campos a cambiar en una tarea: reasignarla o dejarla sin asignar"""
+    user_id = job["user_id"]
+    changes = {}
+    if task.get("assigned_to") == user_id:
+        changes["assigned_to"] = job.get("reassign_to")
+    if job["action"] == "delete" and task.get("created_by") == user_id:
+        # created_by es obligatorio: pasa al usuario indicado o al admin que eliminó al usuario
+        changes["created_by"] = job.get("reassign_to") or job["requested_by"]
+    return changes
+
+async def create_cascade_job(
+    user_id: int,
+    action: str,
+    reassign_to: int = None,
+    requested_by: int = None,
+    waiting: bool = False
+) -> dict:
+    """Registra un trabajo de cascada para las tareas de un usuario eliminado o desactivado.
+
+    Con waiting el trabajo queda en espera hasta activate_cascade_job, para poder
+    registrarlo antes de eliminar al usuario.
+    """
+    if action not in CASCADE_ACTIONS:
+        raise ValueError(f"Acción no válida: {action}")
+    db = await get_database()
+    now = datetime.utcnow()
+    job = {
+        "id": await get_next_sequence(JOBS_COUNTER),
+        "user_id": user_id,
+        "action": action,
+        "reassign_to": reassign_to,
+        "requested_by": requested_by,
+        "status": "waiting" if waiting else "pending",
+        "checkpoint": {collection_tasks.name: 0, collection_tasks_archive.name: 0},
+        "processed": 0,
+        "attempts": 0,
+        "lease_until": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+        "finished_at": None
+    }
+    await db.user_cascade_jobs.insert_one(job)
+    logger.info(f"Created {action} cascade job {job['id']} for user {user_id}")
+    if not waiting:
+        _wakeup.set()
+    return serialize_job(job)
+
+async def activate_cascade_job(job_id: int):
+    """Pasa a pendiente un trabajo en espera para que lo procese el trabajador"""
+    db = await get_database()
+    await db.user_cascade_jobs.update_one(
+        {"id": job_id, "status": "waiting"},
+        {"$set": {"status": "pending", "updated_at": datetime.utcnow()}}
+    )
+    _wakeup.set()
+
+async def cancel_cascade_job(job_id: int):
+    """Cancela un trabajo en espera cuya operación no llegó a aplicarse"""
+    db = await get_database()
+    await db.user_cascade_jobs.update_one(
+        {"id": job_id, "status": "waiting"},
+        {"$set": {"status": "cancelled", "updated_at": datetime.utcnow(), "finished_at": datetime.utcnow()}}
+    )
+
+async def resolve_waiting_jobs():
+    """Resuelve los trabajos en espera de una eliminación que se interrumpió a medias.
+
+    Si el usuario ya no existe, la eliminación se aplicó y el trabajo pasa a
+    pendiente; si sigue existiendo, no llegó a eliminarse y el trabajo se cancela.
+    """
+    db = await get_database()
+    stale = datetime.utcnow() - timedelta(seconds=CASCADE_LEASE_SECONDS)
+    async for job in db.user_cascade_jobs.find({"status": "waiting", "created_at": {"$lt": stale}}):
+        if await collection_users.find_one({"id": job["user_id"]}, {"_id": 1}):
+            await cancel_cascade_job(job["id"])
+        else:
+            logger.info(f"Resuming cascade job {job['id']} for deleted user {job['user_id']}")
+            await activate_cascade_job(job["id"])
+
+async def get_cascade_job(job_id: int) -> dict:
+    db = await get_database()
+    return serialize_job(await db.user_cascade_jobs.find_one({"id": job_id}))
+
+async def get_cascade_jobs(limit: int = 50) -> list:
+    db = await get_database()
+    jobs = await db.user_cascade_jobs.find().sort("id", -1).to_list(length=limit)
+    return [serialize_job(job) for job in jobs]
+
+async def claim_cascade_job() -> dict:
+    """Toma un trabajo pendiente, o uno en curso cuyo proceso dejó de renovar la concesión"""
+    db = await get_database()
+    now = datetime.utcnow()
+    return await db.user_cascade_jobs.find_one_and_update(
+        {
+            "status": {"$in": ["pending", "running"]},
+            "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]
+        },
+        {"$set": {
+            "status": "running",
+            "lease_until": now + timedelta(seconds=CASCADE_LEASE_SECONDS),
+            "updated_at": now
+        }},
+        sort=[("id", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def cascade_batch(job: dict, collection) -> int:
+    """Aplica la cascada a un lote de tareas a partir del punto de control y devuelve cuántas procesó"""
+    checkpoint = job["checkpoint"].get(collection.name, 0)
+    tasks = await collection.find(
+        {**cascade_filter(job), "id": {"$gt": checkpoint}},
+        {"_id": 1, "id": 1, "title": 1, "board_id": 1, "assigned_to": 1, "created_by": 1}
+    ).sort("id", 1).to_list(length=CASCADE_BATCH_SIZE)
+    if not tasks:
+        return 0
+
+    now = datetime.utcnow()
+    updates = []
+    # Las tareas activas necesitan una secuencia nueva para que los clientes vean el cambio
+    first_seq = None
+    if collection is collection_tasks:
+        first_seq = await get_next_sequence(SYNC_COUNTER, len(tasks)) - len(tasks) + 1
+    has_events = False
+    for index, task in enumerate(tasks):
+        changes = {**cascade_changes(job, task), "updated_at": now}
+        outbox = {}
+        if first_seq is not None:
+            changes["sync_seq"] = first_seq + index
+            changes["sync_at"] = now
+            # Las reasignaciones de tareas activas avisan a los webhooks
+            outbox = outbox_update(task, changes, now, job["requested_by"])
+            has_events = has_events or bool(outbox)
+        # El filtro hace la escritura idempotente si el lote se repite tras un fallo
+        updates.append(UpdateOne({"_id": task["_id"], **cascade_filter(job)}, with_outbox({"$set": changes}, outbox)))
+    await collection.bulk_write(updates, ordered=False)
+    if has_events:
+        notify_outbox()
+    if collection is collection_tasks:
+        for task in tasks:
+            index_task({**task, **cascade_changes(job, task)})
+    for task in tasks:
+        await record_task_change(
+            f"user_{job['action']}",
+            task,
+            {**task, **cascade_changes(job, task), "updated_at": now},
+            job["requested_by"]
+        )
+
+    # Guardar el punto de control y renovar la concesión
+    db = await get_database()
+    job["checkpoint"][collection.name] = tasks[-1]["id"]
+    await db.user_cascade_jobs.update_one(
+        {"id": job["id"]},
+        {
+            "$set": {
+                f"checkpoint.{collection.name}": tasks[-1]["id"],
+                "lease_until": datetime.utcnow() + timedelta(seconds=CASCADE_LEASE_SECONDS),
+                "updated_at": datetime.utcnow()
+            },
+            "$inc": {"processed": len(tasks)}
+        }
+    )
+    return len(tasks)
+
+async def run_cascade_job(job: dict):
+    """Procesa un trabajo por lotes, limitando la carga sobre la base de datos"""
+    db = await get_database()
+    logger.info(f"Running {job['action']} cascade job {job['id']} for user {job['user_id']}")
+    try:
+        for collection in (collection_tasks, collection_tasks_archive):
+            while True:
+                started = time.monotonic()
+                processed = await cascade_batch(job, collection)
+                if not processed:
+                    break
+                invalidate_board_cache()
+                # Esperar lo suficiente para no superar el ciclo de trabajo máximo
+                elapsed = time.monotonic() - started
+                pause = elapsed * (1 - CASCADE_MAX_DUTY_CYCLE) / CASCADE_MAX_DUTY_CYCLE
+                await asyncio.sleep(max(CASCADE_MIN_PAUSE_SECONDS, pause))
+
+        # Las estadísticas de los usuarios afectados se recalculan al volver a consultarlas
+        affected = {job["user_id"], job.get("reassign_to"), job.get("requested_by")} - {None}
+        await db.statistics.delete_many({"user_id": {"$in": list(affected)}})
+        await touch_calendars(affected)
+
+        now = datetime.utcnow()
+        await db.user_cascade_jobs.update_one(
+            {"id": job["id"]},
+            {"$set": {"status": "completed", "lease_until": None, "updated_at": now, "finished_at": now}}
+        )
+        logger.info(f"Cascade job {job['id']} completed")
+    except asyncio.CancelledError:
+        # Liberar la concesión para que el trabajo se reanude desde el punto de control
+        await db.user_cascade_jobs.update_one({"id": job["id"]}, {"$set": {"lease_until": None}})
+        raise
+    except Exception as e:
+        logger.error(f"Cascade job {job['id']} failed: {str(e)}")
+        attempts = job.get("attempts", 0) + 1
+        await db.user_cascade_jobs.update_one(
+            {"id": job["id"]},
+            {"$set": {
+                "status": "failed" if attempts >= CASCADE_MAX_ATTEMPTS else "pending",
+                "attempts": attempts,
+                "error": str(e),
+                "lease_until": None,
+                "updated_at": datetime.utcnow()
+            }}
+        )
+
+async def run_user_cascade_worker(poll_interval_seconds: int):
+    """Ejecuta los trabajos de cascada pendientes, incluidos los interrumpidos por una caída"""
+    while True:
+        try:
+            await resolve_waiting_jobs()
+            job = await claim_cascade_job()
+            if job:
+                await run_cascade_job(job)
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"User cascade worker failed: {str(e)}")
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=poll_interval_seconds)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,329 @@
+"""Suscripciones de webhooks y despachador de la bandeja de salida.
+
+El despachador reclama lotes de entregas con una concesión, así que varios
+procesos de la API pueden drenar la misma bandeja sin enviar dos veces la misma
+entrega. Los envíos usan un único cliente HTTP con conexiones reutilizables y
+un semáforo por webhook que limita las peticiones simultáneas a cada destino.
+Cada webhook se despacha en su propia tarea, así que un destino lento no
+retrasa a los demás ni al relevo de eventos.
+Los fallos se reintentan con espera exponencial y las entregas que agotan los
+intentos, o que el destino rechaza de forma definitiva, pasan a la colección
+de mensajes muertos (dead letters), desde donde se pueden reenviar.
+"""
+from database.database import (
+    collection_webhooks,
+    collection_webhook_outbox,
+    collection_webhook_dead_letters,
+    get_next_sequence
+)
+from models.model_webhook import WebhookCreate
+from services.outbox_service import relay_pending_events
+from datetime import datetime, timedelta
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+import asyncio
+import hashlib
+import hmac
+import httpx
+import json
+import logging
+import math
+import os
+import random
+import secrets
+import time
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WEBHOOKS_COUNTER = "webhooks"
+WEBHOOK_DISPATCH_BATCH_SIZE = int(os.getenv("WEBHOOK_DISPATCH_BATCH_SIZE", "100"))
+WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT = int(os.getenv("WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT", "4"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "100"))
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_BACKOFF_BASE_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_BASE_SECONDS", "5"))
+WEBHOOK_BACKOFF_MAX_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_MAX_SECONDS", "3600"))
+# La concesión cubre el peor caso de un lote entero a un solo destino: tandas de
+# WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT envíos que agotan el tiempo de espera
+WEBHOOK_LEASE_MARGIN_SECONDS = 30
+WEBHOOK_LEASE_SECONDS = (
+    math.ceil(WEBHOOK_DISPATCH_BATCH_SIZE / WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT) * WEBHOOK_TIMEOUT_SECONDS
+    + WEBHOOK_LEASE_MARGIN_SECONDS
+)
+WEBHOOK_IDLE_SECONDS = 5
+# Respuestas que indican un problema temporal del destino; el resto de 4xx no se reintenta
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+
+# Identifica las concesiones de este proceso
+_owner = secrets.token_hex(8)
+_client = None
+_semaphores = {}
+# Tareas de envío en curso por webhook; sus entregas no se reclaman hasta que terminan
+_dispatching = {}
+_wakeup = asyncio.Event()
+dispatch_metrics = {"relayed": 0, "delivered": 0, "retried": 0, "dead_lettered": 0, "in_flight": 0}
+
+def serialize_webhook(webhook: dict) -> dict:
+    if webhook:
+        webhook.pop("_id", None)
+        webhook.pop("secret", None)
+    return webhook
+
+async def create_webhook(webhook: WebhookCreate, current_user_id: int) -> dict:
+    """Registra un webhook; el secreto de firma solo se devuelve al crearlo"""
+    webhook_dict = webhook.model_dump()
+    webhook_dict["url"] = str(webhook_dict["url"])
+    webhook_dict["id"] = await get_next_sequence(WEBHOOKS_COUNTER)
+    webhook_dict["secret"] = webhook_dict.get("secret") or secrets.token_urlsafe(32)
+    webhook_dict["active"] = True
+    webhook_dict["created_by"] = current_user_id
+    webhook_dict["created_at"] = datetime.utcnow()
+    await collection_webhooks.insert_one(webhook_dict)
+    logger.info(f"Created webhook {webhook_dict['id']} for {', '.join(webhook_dict['events'])}")
+    secret = webhook_dict["secret"]
+    return {**serialize_webhook(webhook_dict), "secret": secret}
+
+async def get_webhooks() -> list:
+    webhooks = await collection_webhooks.find().sort("id", 1).to_list(None)
+    return [serialize_webhook(webhook) for webhook in webhooks]
+
+async def delete_webhook(webhook_id: int) -> bool:
+    """Elimina un webhook y descarta sus entregas pendientes"""
+    result = await collection_webhooks.delete_one({"id": webhook_id})
+    if not result.deleted_count:
+        raise ValueError(f"Webhook con id {webhook_id} no encontrado")
+    await collection_webhook_outbox.delete_many({"webhook_id": webhook_id})
+    _semaphores.pop(webhook_id, None)
+    logger.info(f"Deleted webhook {webhook_id}")
+    return True
+
+async def get_dead_letters(webhook_id: int = None, limit: int = 50) -> list:
+    query = {} if webhook_id is None else {"webhook_id": webhook_id}
+    return await collection_webhook_dead_letters.find(query).sort("dead_lettered_at", -1).to_list(length=limit)
+
+async def retry_dead_letter(delivery_id: str) -> dict:
+    """Devuelve una entrega muerta a la bandeja de salida con los intentos a cero"""
+    delivery = await collection_webhook_dead_letters.find_one({"_id": delivery_id})
+    if not delivery:
+        raise ValueError(f"Entrega {delivery_id} no encontrada")
+    if not await collection_webhooks.find_one({"id": delivery["webhook_id"]}, {"_id": 1}):
+        raise ValueError(f"El webhook {delivery['webhook_id']} ya no existe")
+    delivery.pop("dead_lettered_at", None)
+    delivery.update({
+        "attempts": 0,
+        "next_attempt_at": datetime.utcnow(),
+        "lease_owner": None,
+        "lease_until": None
+    })
+    await collection_webhook_outbox.replace_one({"_id": delivery_id}, delivery, upsert=True)
+    await collection_webhook_dead_letters.delete_one({"_id": delivery_id})
+    _wakeup.set()
+    return delivery
+
+async def get_dispatch_metrics() -> dict:
+    now = datetime.utcnow()
+    return {
+        **dispatch_metrics,
+        "pending": await collection_webhook_outbox.count_documents({}),
+        "due": await collection_webhook_outbox.count_documents({"next_attempt_at": {"$lte": now}}),
+        "dead_letters": await collection_webhook_dead_letters.estimated_document_count()
+    }
+
+def get_http_client() -> httpx.AsyncClient:
+    """Cliente HTTP compartido por todos los envíos para reutilizar las conexiones"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=WEBHOOK_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=WEBHOOK_MAX_CONNECTIONS, max_keepalive_connections=WEBHOOK_MAX_CONNECTIONS)
+        )
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def endpoint_semaphore(webhook_id: int) -> asyncio.Semaphore:
+    if webhook_id not in _semaphores:
+        _semaphores[webhook_id] = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT)
+    return _semaphores[webhook_id]
+
+def sign(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+def backoff_seconds(attempts: int, retry_after: str = None) -> float:
+    """Espera exponencial con variación aleatoria, o la que pida el destino con Retry-After"""
+    if retry_after and retry_after.isdigit():
+        return min(WEBHOOK_BACKOFF_MAX_SECONDS, float(retry_after))
+    delay = min(WEBHOOK_BACKOFF_MAX_SECONDS, WEBHOOK_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+async def send_delivery(delivery: dict, secret: str) -> tuple:
+    """Envía una entrega y devuelve (resultado, error, espera pedida por el destino)"""
+    body = json.dumps(delivery["payload"], separators=(",", ":")).encode()
+    headers = {
+        "Content-Type": "application/json",
+        "X-Webhook-Event": delivery["event_type"],
+        "X-Webhook-Delivery": delivery["_id"],
+        "X-Webhook-Signature": sign(secret, body)
+    }
+    async with endpoint_semaphore(delivery["webhook_id"]):
+        dispatch_metrics["in_flight"] += 1
+        try:
+            # El tiempo de espera de httpx es por fase; este acota la petición entera
+            async with asyncio.timeout(WEBHOOK_TIMEOUT_SECONDS):
+                response = await get_http_client().post(delivery["url"], content=body, headers=headers)
+        except httpx.HTTPError as e:
+            return "retry", f"{type(e).__name__}: {str(e)}", None
+        except TimeoutError:
+            return "retry", f"Timeout after {WEBHOOK_TIMEOUT_SECONDS:g} s", None
+        finally:
+            dispatch_metrics["in_flight"] -= 1
+    if response.is_success:
+        return "delivered", None, None
+    error = f"HTTP {response.status_code}"
+    if response.status_code >= 500 or response.status_code in RETRYABLE_STATUS_CODES:
+        return "retry", error, response.headers.get("Retry-After")
+    return "dead", error, None
+
+async def claim_deliveries(now: datetime) -> list:
+    """Reclama un lote de entregas vencidas con una concesión de este proceso.
+
+    Se omiten los webhooks que este proceso ya está despachando: sus entregas
+    esperarían al semáforo y la concesión no cubriría esa espera.
+    """
+    free = {"$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]}
+    candidates = await collection_webhook_outbox.find(
+        {"next_attempt_at": {"$lte": now}, "webhook_id": {"$nin": list(_dispatching)}, **free},
+        {"_id": 1}
+    ).sort("next_attempt_at", 1).limit(WEBHOOK_DISPATCH_BATCH_SIZE).to_list(None)
+    if not candidates:
+        return []
+    ids = [candidate["_id"] for candidate in candidates]
+    await collection_webhook_outbox.update_many(
+        {"_id": {"$in": ids}, **free},
+        {"$set": {"lease_owner": _owner, "lease_until": now + timedelta(seconds=WEBHOOK_LEASE_SECONDS)}}
+    )
+    # Otro proceso puede haberse quedado con parte del lote
+    return await collection_webhook_outbox.find({"_id": {"$in": ids}, "lease_owner": _owner}).to_list(None)
+
+async def dispatch_endpoint(webhook_id: int, secret: str, deliveries: list):
+    """Envía en paralelo las entregas de un webhook y guarda los resultados en escrituras por lotes"""
+    results = await asyncio.gather(*(send_delivery(delivery, secret) for delivery in deliveries))
+
+    finished = datetime.utcnow()
+    outbox_writes = []
+    dead_letters = []
+    for delivery, (outcome, error, retry_after) in zip(deliveries, results):
+        attempts = delivery["attempts"] + 1
+        if outcome == "retry" and attempts >= WEBHOOK_MAX_ATTEMPTS:
+            outcome = "dead"
+        if outcome == "delivered":
+            dispatch_metrics["delivered"] += 1
+            outbox_writes.append(DeleteOne({"_id": delivery["_id"], "lease_owner": _owner}))
+        elif outcome == "retry":
+            dispatch_metrics["retried"] += 1
+            outbox_writes.append(UpdateOne(
+                {"_id": delivery["_id"], "lease_owner": _owner},
+                {"$set": {
+                    "attempts": attempts,
+                    "last_error": error,
+                    "next_attempt_at": finished + timedelta(seconds=backoff_seconds(attempts, retry_after)),
+                    "lease_owner": None,
+                    "lease_until": None
+                }}
+            ))
+        else:
+            dispatch_metrics["dead_lettered"] += 1
+            logger.error(f"Dead-lettering delivery {delivery['_id']} to webhook {webhook_id}: {error}")
+            dead_letters.append({
+                **delivery,
+                "attempts": attempts,
+                "last_error": error,
+                "lease_owner": None,
+                "lease_until": None,
+                "dead_lettered_at": finished
+            })
+            outbox_writes.append(DeleteOne({"_id": delivery["_id"], "lease_owner": _owner}))
+
+    # Guardar los mensajes muertos antes de quitarlos de la bandeja para no perderlos
+    if dead_letters:
+        await collection_webhook_dead_letters.bulk_write(
+            [ReplaceOne({"_id": letter["_id"]}, letter, upsert=True) for letter in dead_letters],
+            ordered=False
+        )
+    if outbox_writes:
+        await collection_webhook_outbox.bulk_write(outbox_writes, ordered=False)
+
+def endpoint_done(webhook_id: int, task: asyncio.Task):
+    """Libera el webhook y despierta al despachador para reclamar sus siguientes entregas"""
+    _dispatching.pop(webhook_id, None)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Webhook {webhook_id} dispatch failed: {str(task.exception())}")
+    _wakeup.set()
+
+async def dispatch_batch() -> int:
+    """Reclama un lote de entregas y lanza una tarea de envío por webhook sin esperarlas"""
+    now = datetime.utcnow()
+    deliveries = await claim_deliveries(now)
+    if not deliveries:
+        return 0
+
+    webhook_ids = list({delivery["webhook_id"] for delivery in deliveries})
+    secrets_by_webhook = {
+        webhook["id"]: webhook["secret"]
+        async for webhook in collection_webhooks.find({"id": {"$in": webhook_ids}, "active": True}, {"id": 1, "secret": 1})
+    }
+    # Las entregas de webhooks eliminados o desactivados se descartan
+    orphans = [delivery for delivery in deliveries if delivery["webhook_id"] not in secrets_by_webhook]
+    if orphans:
+        await collection_webhook_outbox.delete_many({"_id": {"$in": [delivery["_id"] for delivery in orphans]}})
+
+    by_webhook = {}
+    for delivery in deliveries:
+        if delivery["webhook_id"] in secrets_by_webhook:
+            by_webhook.setdefault(delivery["webhook_id"], []).append(delivery)
+    for webhook_id, webhook_deliveries in by_webhook.items():
+        task = asyncio.create_task(dispatch_endpoint(webhook_id, secrets_by_webhook[webhook_id], webhook_deliveries))
+        _dispatching[webhook_id] = task
+        task.add_done_callback(lambda done, webhook_id=webhook_id: endpoint_done(webhook_id, done))
+    return len(deliveries)
+
+async def cancel_dispatches():
+    """Cancela los envíos en curso; sus entregas se reclaman de nuevo al vencer la concesión"""
+    tasks = list(_dispatching.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def notify_outbox():
+    """Despierta al despachador tras una escritura que generó eventos"""
+    _wakeup.set()
+
+async def run_webhook_dispatcher():
+    """Pasa los eventos de las tareas a la bandeja de salida y la drena por lotes"""
+    while True:
+        _wakeup.clear()
+        busy = False
+        try:
+            relayed = await relay_pending_events()
+            dispatch_metrics["relayed"] += relayed
+            started = time.monotonic()
+            sent = await dispatch_batch()
+            if sent:
+                logger.info(f"Claimed {sent} webhook deliveries in {time.monotonic() - started:.2f} s")
+            busy = bool(relayed or sent)
+        except asyncio.CancelledError:
+            await cancel_dispatches()
+            raise
+        except Exception as e:
+            logger.error(f"Webhook dispatcher failed: {str(e)}")
+        if busy:
+            continue
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=WEBHOOK_IDLE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
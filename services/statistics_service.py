@@ -1,65 +1,129 @@
 from datetime import datetime, timedelta
 from database.database import get_database
 from models.model_user import User
-from models.model_task import Task
+from models.model_task import Task, COMPLETED_STATUSES
 from models.model_statistics import UserStatistics
 from bson import ObjectId
+from pymongo import UpdateOne
+from services import activity_bitmap
+from services.rollup_service import RollupService
+from services.leaderboard_service import LeaderboardService
+from services.cache_service import invalidate_user_statistics
+import base64
+import asyncio
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Campos de los documentos de estadísticas que se mantienen con $inc
+COUNTER_FIELDS = ["total_tasks", "by_status", "by_priority", "completion_seconds", "completion_count"]
+# Estadísticas calculadas entre cesiones del bucle de eventos
+YIELD_EVERY_USERS = 250
+# Contadores que devuelve la agregación por usuario de org_statistics_pipeline
+GROUP_COUNTERS = ["total", "completada", "en_progreso", "pendiente", "alta", "media", "baja",
+                  "completion_seconds", "completion_count"]
+
+def empty_group(user_id: int) -> dict:
+    """Grupo de un usuario sin tareas, con la misma forma que los de la agregación"""
+    return {"_id": user_id, **{field: 0 for field in GROUP_COUNTERS}, "last_activity": None, "activity_days": []}
 
 class StatisticsService:
     @staticmethod
-    async def calculate_user_statistics(user_id: str) -> UserStatistics:
+    async def resolve_user_id(user_id: str):
+        """Obtiene el ID numérico del usuario a partir de su ID numérico o de MongoDB"""
+        if user_id.isdigit():
+            return int(user_id)
+        # Compatibilidad con identificadores de MongoDB
         db = await get_database()
-        
-        # Obtener todas las tareas del usuario
-        tasks = await db.tasks.find({"user_id": ObjectId(user_id)}).to_list(None)
-        
-        # Calcular estadísticas básicas
-        total_tasks = len(tasks)
-        completed_tasks = len([t for t in tasks if t["status"] == "completada"])
-        pending_tasks = total_tasks - completed_tasks
-        
-        # Calcular tiempo promedio de completado
-        completed_tasks_with_time = [
-            t for t in tasks 
-            if t["status"] == "completada" and t.get("completed_at") and t.get("created_at")
+        user = await db.users.find_one({"_id": ObjectId(user_id)}, {"id": 1})
+        return user["id"] if user else None
+
+    @staticmethod
+    async def user_task_filter(user_id: str) -> dict:
+        """Filtro de las tareas creadas por el usuario o asignadas a él"""
+        numeric_id = await StatisticsService.resolve_user_id(user_id)
+        return {
+            "$or": [
+                {"assigned_to": numeric_id},
+                {"created_by": numeric_id}
+            ]
+        }
+
+    @staticmethod
+    def statistics_pipeline(match: dict) -> list:
+        """Pipeline que calcula en el servidor solo los agregados de las estadísticas"""
+        is_completed_with_time = {
+            "$and": [
+                {"$in": ["$status", COMPLETED_STATUSES]},
+                {"$ne": [{"$ifNull": ["$completed_at", None]}, None]},
+                {"$ne": [{"$ifNull": ["$created_at", None]}, None]}
+            ]
+        }
+        return [
+            {"$match": match},
+            # Las tareas archivadas siguen contando para las estadísticas
+            {"$unionWith": {"coll": "tasks_archive", "pipeline": [{"$match": match}]}},
+            {"$facet": {
+                "totals": [
+                    {"$group": {
+                        "_id": None,
+                        "total": {"$sum": 1},
+                        "last_activity": {"$max": "$updated_at"},
+                        "completion_seconds": {"$sum": {"$cond": [
+                            is_completed_with_time,
+                            {"$divide": [{"$subtract": ["$completed_at", "$created_at"]}, 1000]},
+                            0
+                        ]}},
+                        "completion_count": {"$sum": {"$cond": [is_completed_with_time, 1, 0]}}
+                    }}
+                ],
+                "by_status": [
+                    {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+                ],
+                "by_priority": [
+                    {"$group": {"_id": "$priority", "count": {"$sum": 1}}}
+                ],
+                "activity_days": [
+                    {"$match": {"updated_at": {"$type": "date"}}},
+                    {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$updated_at"}}}},
+                    {"$sort": {"_id": -1}}
+                ]
+            }}
         ]
-        if completed_tasks_with_time:
-            total_time = sum(
-                (t["completed_at"] - t["created_at"]).total_seconds() 
-                for t in completed_tasks_with_time
-            )
-            average_completion_time = total_time / len(completed_tasks_with_time) / 3600  # convertir a horas
-        else:
-            average_completion_time = 0.0
-        
-        # Calcular tareas por prioridad
+
+    @staticmethod
+    def build_statistics(
+        user_id: str,
+        total_tasks: int,
+        tasks_by_status: dict,
+        tasks_by_priority: dict,
+        completion_seconds: float,
+        completion_count: int,
+        last_activity: datetime,
+        streak_days: int
+    ) -> UserStatistics:
+        """Construye las estadísticas a partir de los agregados ya calculados"""
         tasks_by_priority = {
-            "alta": len([t for t in tasks if t["priority"] == "alta"]),
-            "media": len([t for t in tasks if t["priority"] == "media"]),
-            "baja": len([t for t in tasks if t["priority"] == "baja"])
+            "alta": tasks_by_priority.get("alta", 0),
+            "media": tasks_by_priority.get("media", 0),
+            "baja": tasks_by_priority.get("baja", 0)
         }
-        
-        # Calcular tareas por estado
         tasks_by_status = {
-            "completada": len([t for t in tasks if t["status"] == "completada"]),
-            "en_progreso": len([t for t in tasks if t["status"] == "en_progreso"]),
-            "pendiente": len([t for t in tasks if t["status"] == "pendiente"])
+            # Las tareas creadas con Status.completed cuentan igual que las "completada"
+            "completada": sum(tasks_by_status.get(status, 0) for status in COMPLETED_STATUSES),
+            "en_progreso": tasks_by_status.get("en_progreso", 0),
+            "pendiente": tasks_by_status.get("pendiente", 0)
         }
-        
-        # Calcular última actividad
-        last_activity = max((t["updated_at"] for t in tasks), default=datetime.now())
-        
-        # Calcular racha de días
-        today = datetime.now().date()
-        streak_days = 0
-        current_date = today
-        while True:
-            has_activity = any(t["updated_at"].date() == current_date for t in tasks)
-            if not has_activity:
-                break
-            streak_days += 1
-            current_date -= timedelta(days=1)
-        
+        completed_tasks = tasks_by_status["completada"]
+        pending_tasks = total_tasks - completed_tasks
+
+        if completion_count:
+            average_completion_time = completion_seconds / completion_count / 3600  # convertir a horas
+        else:
+            average_completion_time = 0.0
+
         # Calcular puntuación de productividad (0-100)
         if total_tasks > 0:
             completion_rate = completed_tasks / total_tasks
@@ -67,7 +131,7 @@ class StatisticsService:
             productivity_score = (completion_rate * 0.6 + priority_score * 0.4) * 100
         else:
             productivity_score = 0.0
-        
+
         return UserStatistics(
             user_id=user_id,
             total_tasks=total_tasks,
@@ -76,7 +140,336 @@ class StatisticsService:
             average_completion_time=average_completion_time,
             tasks_by_priority=tasks_by_priority,
             tasks_by_status=tasks_by_status,
-            last_activity=last_activity,
+            last_activity=last_activity or datetime.now(),
             streak_days=streak_days,
             productivity_score=productivity_score
-        ) 
\ No newline at end of file
+        )
+
+    @staticmethod
+    def streak_from_days(activity_days: list) -> int:
+        """Cuenta los días consecutivos con actividad hasta hoy a partir de fechas YYYY-MM-DD"""
+        days = set(activity_days)
+        streak_days = 0
+        current_date = datetime.now().date()
+        while current_date.isoformat() in days:
+            streak_days += 1
+            current_date -= timedelta(days=1)
+        return streak_days
+
+    @staticmethod
+    def statistics_from_facets(user_id: str, facets: dict) -> UserStatistics:
+        """Convierte el resultado del $facet en estadísticas de usuario"""
+        totals = facets["totals"][0] if facets["totals"] else {}
+        return StatisticsService.build_statistics(
+            user_id=user_id,
+            total_tasks=totals.get("total", 0),
+            tasks_by_status={group["_id"]: group["count"] for group in facets["by_status"]},
+            tasks_by_priority={group["_id"]: group["count"] for group in facets["by_priority"]},
+            completion_seconds=totals.get("completion_seconds", 0),
+            completion_count=totals.get("completion_count", 0),
+            last_activity=totals.get("last_activity"),
+            streak_days=StatisticsService.streak_from_days([day["_id"] for day in facets["activity_days"]])
+        )
+
+    @staticmethod
+    async def calculate_user_statistics(user_id: str) -> UserStatistics:
+        db = await get_database()
+
+        # Calcular todos los agregados en una sola consulta
+        match = await StatisticsService.user_task_filter(user_id)
+        result = await db.tasks.aggregate(StatisticsService.statistics_pipeline(match)).to_list(1)
+        return StatisticsService.statistics_from_facets(user_id, result[0])
+
+    @staticmethod
+    def org_statistics_pipeline(user_ids: list) -> list:
+        """Pipeline que agrupa por usuario, en una sola pasada, las tareas de una página de usuarios"""
+        match = {
+            "$or": [
+                {"assigned_to": {"$in": user_ids}},
+                {"created_by": {"$in": user_ids}}
+            ]
+        }
+        is_completed_with_time = {
+            "$and": [
+                {"$in": ["$status", COMPLETED_STATUSES]},
+                {"$ne": [{"$ifNull": ["$completed_at", None]}, None]},
+                {"$ne": [{"$ifNull": ["$created_at", None]}, None]}
+            ]
+        }
+
+        def count_if(field: str, value: str) -> dict:
+            return {"$sum": {"$cond": [{"$eq": [f"${field}", value]}, 1, 0]}}
+
+        return [
+            {"$match": match},
+            {"$unionWith": {"coll": "tasks_archive", "pipeline": [{"$match": match}]}},
+            # Cada tarea cuenta una vez para su creador y otra para su asignado, si son distintos
+            {"$project": {
+                "status": 1,
+                "priority": 1,
+                "updated_at": 1,
+                "completed_at": 1,
+                "created_at": 1,
+                "participant": {"$setIntersection": [
+                    {"$setUnion": [["$assigned_to"], ["$created_by"]]},
+                    user_ids
+                ]}
+            }},
+            {"$unwind": "$participant"},
+            {"$group": {
+                "_id": "$participant",
+                "total": {"$sum": 1},
+                "last_activity": {"$max": "$updated_at"},
+                "completion_seconds": {"$sum": {"$cond": [
+                    is_completed_with_time,
+                    {"$divide": [{"$subtract": ["$completed_at", "$created_at"]}, 1000]},
+                    0
+                ]}},
+                "completion_count": {"$sum": {"$cond": [is_completed_with_time, 1, 0]}},
+                "completada": {"$sum": {"$cond": [{"$in": ["$status", COMPLETED_STATUSES]}, 1, 0]}},
+                "en_progreso": count_if("status", "en_progreso"),
+                "pendiente": count_if("status", "pendiente"),
+                "alta": count_if("priority", "alta"),
+                "media": count_if("priority", "media"),
+                "baja": count_if("priority", "baja"),
+                "activity_days": {"$addToSet": {"$cond": [
+                    {"$eq": [{"$type": "$updated_at"}, "date"]},
+                    {"$dateToString": {"format": "%Y-%m-%d", "date": "$updated_at"}},
+                    None
+                ]}}
+            }},
+            {"$sort": {"_id": 1}}
+        ]
+
+    @staticmethod
+    async def get_org_user_page(after: int, limit: int) -> list:
+        """Obtiene los IDs de una página de usuarios ordenados por ID"""
+        db = await get_database()
+        users = await db.users.find({"id": {"$gt": after}}, {"id": 1}).sort("id", 1).to_list(length=limit)
+        return [user["id"] for user in users]
+
+    @staticmethod
+    def statistics_from_group(group: dict) -> UserStatistics:
+        """Convierte el grupo de un usuario de la agregación de la organización en estadísticas"""
+        return StatisticsService.build_statistics(
+            user_id=str(group["_id"]),
+            total_tasks=group["total"],
+            tasks_by_status={key: group[key] for key in ("completada", "en_progreso", "pendiente")},
+            tasks_by_priority={key: group[key] for key in ("alta", "media", "baja")},
+            completion_seconds=group["completion_seconds"],
+            completion_count=group["completion_count"],
+            last_activity=group["last_activity"],
+            streak_days=StatisticsService.streak_from_days([day for day in group["activity_days"] if day])
+        )
+
+    @staticmethod
+    async def org_groups(user_ids: list):
+        """Genera los grupos de la agregación en el orden de user_ids, incluidos los usuarios sin tareas"""
+        db = await get_database()
+        cursor = db.tasks.aggregate(StatisticsService.org_statistics_pipeline(user_ids), allowDiskUse=True)
+        pending = iter(user_ids)
+        async for group in cursor:
+            # Los usuarios sin tareas no aparecen en la agregación
+            for user_id in pending:
+                if user_id == group["_id"]:
+                    break
+                yield empty_group(user_id)
+            yield group
+        for user_id in pending:
+            yield empty_group(user_id)
+
+    @staticmethod
+    async def stream_org_statistics(user_ids: list):
+        """Genera las estadísticas de una página de usuarios a medida que llegan del cursor"""
+        # Cada grupo ya viene agregado del servidor: convertirlo cuesta poco más que
+        # serializarlo para otro proceso, así que se calcula aquí cediendo el bucle a ratos
+        count = 0
+        async for group in StatisticsService.org_groups(user_ids):
+            yield StatisticsService.statistics_from_group(group)
+            count += 1
+            if count % YIELD_EVERY_USERS == 0:
+                await asyncio.sleep(0)
+
+    @staticmethod
+    def task_contribution(task: dict) -> dict:
+        """Contadores con los que una tarea contribuye a las estadísticas de sus participantes"""
+        contribution = {"total_tasks": 1}
+        if task.get("status") is not None:
+            contribution[f"by_status.{task['status']}"] = 1
+        if task.get("priority") is not None:
+            contribution[f"by_priority.{task['priority']}"] = 1
+        if task.get("status") in COMPLETED_STATUSES and task.get("completed_at") and task.get("created_at"):
+            contribution["completion_seconds"] = (task["completed_at"] - task["created_at"]).total_seconds()
+            contribution["completion_count"] = 1
+        return contribution
+
+    @staticmethod
+    def task_participants(task: dict) -> set:
+        """Usuarios a cuyas estadísticas contribuye la tarea"""
+        if not task:
+            return set()
+        return {user_id for user_id in (task.get("assigned_to"), task.get("created_by")) if user_id is not None}
+
+    @staticmethod
+    async def on_task_change(before: dict = None, after: dict = None):
+        """Actualiza incrementalmente las estadísticas de los usuarios afectados por una escritura de tarea"""
+        try:
+            db = await get_database()
+            before_users = StatisticsService.task_participants(before)
+            after_users = StatisticsService.task_participants(after)
+            activity = (after or {}).get("updated_at") or datetime.utcnow()
+
+            updates = []
+            for user_id in before_users | after_users:
+                increments = {}
+                if user_id in after_users:
+                    for field, value in StatisticsService.task_contribution(after).items():
+                        increments[field] = increments.get(field, 0) + value
+                if user_id in before_users:
+                    for field, value in StatisticsService.task_contribution(before).items():
+                        increments[field] = increments.get(field, 0) - value
+                update = {
+                    "$max": {"last_activity": activity},
+                    "$bit": activity_bitmap.bit_update(activity.date())
+                }
+                increments = {field: value for field, value in increments.items() if value}
+                if increments:
+                    update["$inc"] = increments
+                updates.append(UpdateOne({"user_id": user_id}, update, upsert=True))
+
+            if updates:
+                await db.statistics.bulk_write(updates, ordered=False)
+            await RollupService.apply_task_change(before, before_users, after, after_users)
+            LeaderboardService.apply_task_change(before, before_users, after, after_users)
+        except Exception as e:
+            # El verificador periódico corrige cualquier desviación
+            logger.error(f"Error updating incremental statistics: {str(e)}")
+        finally:
+            # Después de actualizar los contadores, para que el siguiente cálculo ya vea la escritura
+            invalidate_user_statistics(
+                StatisticsService.task_participants(before) | StatisticsService.task_participants(after)
+            )
+
+    @staticmethod
+    async def rebuild_counters(user_id: int) -> dict:
+        """Recalcula desde las tareas el documento de estadísticas de un usuario"""
+        db = await get_database()
+        match = {"$or": [{"assigned_to": user_id}, {"created_by": user_id}]}
+        result = await db.tasks.aggregate(StatisticsService.statistics_pipeline(match)).to_list(1)
+        facets = result[0]
+        totals = facets["totals"][0] if facets["totals"] else {}
+        return {
+            "user_id": user_id,
+            "total_tasks": totals.get("total", 0),
+            "by_status": {group["_id"]: group["count"] for group in facets["by_status"] if group["_id"] is not None},
+            "by_priority": {group["_id"]: group["count"] for group in facets["by_priority"] if group["_id"] is not None},
+            "completion_seconds": totals.get("completion_seconds", 0),
+            "completion_count": totals.get("completion_count", 0),
+            "last_activity": totals.get("last_activity"),
+            "activity": activity_bitmap.activity_from_days([day["_id"] for day in facets["activity_days"]])
+        }
+
+    @staticmethod
+    def statistics_from_document(user_id: str, document: dict) -> UserStatistics:
+        """Convierte un documento de estadísticas mantenido incrementalmente en estadísticas de usuario"""
+        return StatisticsService.build_statistics(
+            user_id=user_id,
+            total_tasks=document.get("total_tasks", 0),
+            tasks_by_status=document.get("by_status", {}),
+            tasks_by_priority=document.get("by_priority", {}),
+            completion_seconds=document.get("completion_seconds", 0),
+            completion_count=document.get("completion_count", 0),
+            last_activity=document.get("last_activity"),
+            streak_days=activity_bitmap.current_streak(document, datetime.utcnow().date())
+        )
+
+    @staticmethod
+    async def get_user_statistics(user_id: str) -> UserStatistics:
+        """Obtiene las estadísticas de un usuario leyendo su documento de contadores"""
+        db = await get_database()
+        numeric_id = await StatisticsService.resolve_user_id(user_id)
+        document = await db.statistics.find_one({"user_id": numeric_id})
+        if document is None:
+            # Primera lectura: construir el documento desde las tareas
+            document = await StatisticsService.rebuild_counters(numeric_id)
+            await db.statistics.replace_one({"user_id": numeric_id}, document, upsert=True)
+        return StatisticsService.statistics_from_document(user_id, document)
+
+    @staticmethod
+    async def get_user_activity(user_id: str, year: int) -> dict:
+        """Obtiene el mapa de actividad anual de un usuario con sus rachas"""
+        db = await get_database()
+        numeric_id = await StatisticsService.resolve_user_id(user_id)
+        document = await db.statistics.find_one({"user_id": numeric_id}, {"activity": 1})
+        bitmap = activity_bitmap.year_bitmap(document, year)
+        return {
+            "user_id": user_id,
+            "year": year,
+            "active_days": bin(bitmap).count("1"),
+            "current_streak": activity_bitmap.current_streak(document, datetime.utcnow().date()),
+            "longest_streak": activity_bitmap.longest_run(bitmap),
+            "days": activity_bitmap.active_days(bitmap, year),
+            "bitmap": base64.b64encode(activity_bitmap.to_bytes(bitmap)).decode()
+        }
+
+    @staticmethod
+    def counters_differ(stored: dict, rebuilt: dict) -> bool:
+        """Compara los contadores de un documento almacenado con los recalculados"""
+        for field in COUNTER_FIELDS:
+            stored_value = stored.get(field, {} if field.startswith("by_") else 0)
+            rebuilt_value = rebuilt[field]
+            if field.startswith("by_"):
+                stored_value = {key: value for key, value in stored_value.items() if value}
+            if field == "completion_seconds":
+                if abs(stored_value - rebuilt_value) > 1:
+                    return True
+            elif stored_value != rebuilt_value:
+                return True
+        return False
+
+    @staticmethod
+    async def verify_statistics(batch_size: int = 100) -> dict:
+        """Recalcula los contadores de todos los usuarios por lotes y corrige las desviaciones"""
+        db = await get_database()
+        logger.info("Verifying incremental statistics")
+        checked = 0
+        repaired = 0
+        last_id = 0
+        while True:
+            users = await db.users.find(
+                {"id": {"$gt": last_id}}, {"id": 1}
+            ).sort("id", 1).to_list(length=batch_size)
+            if not users:
+                break
+            last_id = users[-1]["id"]
+            user_ids = [user["id"] for user in users]
+            stored = {
+                document["user_id"]: document
+                async for document in db.statistics.find({"user_id": {"$in": user_ids}})
+            }
+            for user_id in user_ids:
+                rebuilt = await StatisticsService.rebuild_counters(user_id)
+                checked += 1
+                if user_id not in stored or StatisticsService.counters_differ(stored[user_id], rebuilt):
+                    logger.warning(f"Statistics drift detected for user {user_id}, rebuilding")
+                    # Las tareas solo conservan su última actualización: no perder días ya registrados
+                    rebuilt["activity"] = activity_bitmap.merge_activity(
+                        stored.get(user_id, {}).get("activity"), rebuilt["activity"]
+                    )
+                    await db.statistics.replace_one({"user_id": user_id}, rebuilt, upsert=True)
+                    repaired += 1
+            await asyncio.sleep(0)
+        logger.info(f"Verified statistics of {checked} users, repaired {repaired}")
+        return {"checked": checked, "repaired": repaired}
+
+    @staticmethod
+    async def run_statistics_verifier(interval_seconds: int):
+        """Ejecuta la verificación de estadísticas de forma periódica"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await StatisticsService.verify_statistics()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Statistics verification failed: {str(e)}")
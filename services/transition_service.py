@@ -0,0 +1,272 @@
+from datetime import datetime, timedelta
+from database.database import get_database
+from models.model_board import DEFAULT_BOARD_ID
+from models.model_task import COMPLETED_STATUSES
+from pymongo import UpdateOne
+import math
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_CFD_DAYS = 366
+DWELL_PERCENTILES = [50, 75, 90, 95]
+# Intervalos del histograma de permanencia: cada uno es √2 veces más ancho que el anterior, en minutos
+DWELL_BINS = 48
+
+def day_start(moment: datetime) -> datetime:
+    """Medianoche del día del instante"""
+    return datetime(moment.year, moment.month, moment.day)
+
+def dwell_bin(seconds: float) -> int:
+    """Intervalo del histograma al que pertenece una permanencia"""
+    minutes = max(0.0, seconds) / 60
+    return min(DWELL_BINS - 1, int(2 * math.log2(minutes + 1)))
+
+def dwell_bin_upper_hours(index: int) -> float:
+    """Límite superior en horas de un intervalo del histograma"""
+    return (2 ** ((index + 1) / 2) - 1) / 60
+
+def histogram_percentiles(histogram: dict, count: int) -> dict:
+    """Estima los percentiles con el límite superior del intervalo que los contiene"""
+    percentiles = {f"p{p}": 0.0 for p in DWELL_PERCENTILES}
+    if not count:
+        return percentiles
+    cumulative = 0
+    targets = iter(DWELL_PERCENTILES)
+    target = next(targets)
+    for index in range(DWELL_BINS):
+        cumulative += histogram.get(index, 0)
+        while target is not None and cumulative >= count * target / 100:
+            percentiles[f"p{target}"] = round(dwell_bin_upper_hours(index), 2)
+            target = next(targets, None)
+        if target is None:
+            break
+    return percentiles
+
+def lifecycle_fields(before: dict, after: dict, now: datetime) -> dict:
+    """Campos de ciclo de vida que hay que escribir junto con los cambios de una tarea.
+
+    after contiene los campos nuevos; los que no aparecen conservan el valor de before.
+    Marca column_entered_at al cambiar de columna y completed_at al completarse, y
+    quita overdue cuando la tarea se completa, se reabre o su vencimiento pasa al
+    futuro, para que el planificador la vuelva a marcar al vencer de nuevo.
+    """
+    before = before or {}
+    fields = {}
+    column_id = after.get("column_id", before.get("column_id"))
+    if column_id is not None and (not before or column_id != before.get("column_id")):
+        fields["column_entered_at"] = now
+
+    was_completed = before.get("status") in COMPLETED_STATUSES
+    is_completed = after.get("status", before.get("status")) in COMPLETED_STATUSES
+    if is_completed and not was_completed:
+        fields["completed_at"] = now
+    elif was_completed and not is_completed:
+        fields["completed_at"] = None
+
+    # El planificador de vencimientos marca overdue; aquí solo se quita si deja de aplicar.
+    # Al cambiar el vencimiento o reabrir la tarea se quita aunque before no lo tenga:
+    # el planificador puede haberlo marcado después de leer la tarea
+    due_date = after.get("due_date", before.get("due_date"))
+    not_due = due_date is None or due_date > now
+    reopened = was_completed and not is_completed
+    if reopened or ("due_date" in after and not_due) or (before.get("overdue") and (is_completed or not_due)):
+        fields["overdue"] = False
+    return fields
+
+class TransitionService:
+    @staticmethod
+    async def record_transition(before: dict = None, after: dict = None):
+        """Registra el cambio de columna o estado de una tarea y actualiza los agregados diarios"""
+        try:
+            before = before or {}
+            after = after or {}
+            from_column, to_column = before.get("column_id"), after.get("column_id")
+            from_status, to_status = before.get("status"), after.get("status")
+            if from_column == to_column and from_status == to_status:
+                return
+
+            db = await get_database()
+            task = after or before
+            board_id = task.get("board_id", DEFAULT_BOARD_ID)
+            ts = after.get("updated_at") or datetime.utcnow()
+            day = day_start(ts)
+
+            transition = {
+                "task_id": task["id"],
+                "board_id": board_id,
+                "ts": ts,
+                "from_column": from_column,
+                "to_column": to_column,
+                "from_status": from_status,
+                "to_status": to_status
+            }
+            entered = before.get("column_entered_at") or before.get("created_at")
+            if from_column is not None and from_column != to_column and entered:
+                transition["dwell_seconds"] = (ts - entered).total_seconds()
+            await db.task_transitions.insert_one(transition)
+
+            if from_column == to_column:
+                return
+            updates = []
+            if from_column is not None:
+                updates.append(UpdateOne(
+                    {"board_id": board_id, "column_id": from_column, "day": day},
+                    {"$inc": {"departures": 1}},
+                    upsert=True
+                ))
+            if to_column is not None:
+                updates.append(UpdateOne(
+                    {"board_id": board_id, "column_id": to_column, "day": day},
+                    {"$inc": {"arrivals": 1}},
+                    upsert=True
+                ))
+            await db.kanban_cfd_daily.bulk_write(updates, ordered=False)
+
+            # Las tareas eliminadas no cuentan como permanencia completada en la columna
+            if "dwell_seconds" in transition and to_column is not None:
+                await db.kanban_dwell_daily.update_one(
+                    {"board_id": board_id, "column_id": from_column, "day": day},
+                    {"$inc": {
+                        "count": 1,
+                        "total_seconds": transition["dwell_seconds"],
+                        f"histogram.{dwell_bin(transition['dwell_seconds'])}": 1
+                    }},
+                    upsert=True
+                )
+        except Exception as e:
+            logger.error(f"Error recording task transition: {str(e)}")
+
+    @staticmethod
+    def day_range(start: datetime, end: datetime) -> list:
+        """Días entre start y end, ambos incluidos"""
+        start, end = day_start(start), day_start(end)
+        if end < start:
+            raise ValueError("La fecha final no puede ser anterior a la inicial")
+        if (end - start).days >= MAX_CFD_DAYS:
+            raise ValueError(f"El rango no puede tener más de {MAX_CFD_DAYS} días")
+        return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+    @staticmethod
+    async def board_columns(board_id: int) -> list:
+        db = await get_database()
+        return await db.kanban_columns.find(
+            {"board_id": board_id},
+            {"_id": 0, "id": 1, "title": 1, "order": 1}
+        ).sort("order", 1).to_list(None)
+
+    @staticmethod
+    async def get_cfd(board_id: int, start: datetime, end: datetime) -> dict:
+        """Diagrama de flujo acumulado diario leyendo solo los agregados por día y columna"""
+        days = TransitionService.day_range(start, end)
+        db = await get_database()
+        columns = await TransitionService.board_columns(board_id)
+
+        # Flujo acumulado antes del primer día del rango
+        totals = {column["id"]: {"arrived": 0, "departed": 0} for column in columns}
+        async for group in db.kanban_cfd_daily.aggregate([
+            {"$match": {"board_id": board_id, "day": {"$lt": days[0]}}},
+            {"$group": {
+                "_id": "$column_id",
+                "arrived": {"$sum": "$arrivals"},
+                "departed": {"$sum": "$departures"}
+            }}
+        ]):
+            totals.setdefault(group["_id"], {"arrived": 0, "departed": 0})
+            totals[group["_id"]]["arrived"] = group["arrived"]
+            totals[group["_id"]]["departed"] = group["departed"]
+
+        flows = {}
+        async for bucket in db.kanban_cfd_daily.find(
+            {"board_id": board_id, "day": {"$gte": days[0], "$lte": days[-1]}},
+            {"_id": 0, "column_id": 1, "day": 1, "arrivals": 1, "departures": 1}
+        ):
+            flows[(bucket["day"], bucket["column_id"])] = bucket
+
+        points = []
+        for day in days:
+            point = []
+            for column_id, total in totals.items():
+                bucket = flows.get((day, column_id), {})
+                total["arrived"] += bucket.get("arrivals", 0)
+                total["departed"] += bucket.get("departures", 0)
+                point.append({
+                    "column_id": column_id,
+                    "arrived": total["arrived"],
+                    "departed": total["departed"],
+                    "wip": total["arrived"] - total["departed"]
+                })
+            points.append({"day": day, "columns": point})
+
+        return {"board_id": board_id, "columns": columns, "points": points}
+
+    @staticmethod
+    async def get_dwell_times(board_id: int, start: datetime, end: datetime) -> dict:
+        """Percentiles del tiempo de permanencia por columna a partir de los histogramas diarios"""
+        days = TransitionService.day_range(start, end)
+        db = await get_database()
+        columns = await TransitionService.board_columns(board_id)
+
+        merged = {column["id"]: {"count": 0, "total_seconds": 0.0, "histogram": {}} for column in columns}
+        async for bucket in db.kanban_dwell_daily.find(
+            {"board_id": board_id, "day": {"$gte": days[0], "$lte": days[-1]}},
+            {"_id": 0, "column_id": 1, "count": 1, "total_seconds": 1, "histogram": 1}
+        ):
+            column = merged.setdefault(bucket["column_id"], {"count": 0, "total_seconds": 0.0, "histogram": {}})
+            column["count"] += bucket.get("count", 0)
+            column["total_seconds"] += bucket.get("total_seconds", 0)
+            for index, value in bucket.get("histogram", {}).items():
+                column["histogram"][int(index)] = column["histogram"].get(int(index), 0) + value
+
+        titles = {column["id"]: column["title"] for column in columns}
+        return {
+            "board_id": board_id,
+            "from": days[0],
+            "to": days[-1],
+            "columns": [
+                {
+                    "column_id": column_id,
+                    "title": titles.get(column_id),
+                    "count": dwell["count"],
+                    "mean_hours": round(dwell["total_seconds"] / dwell["count"] / 3600, 2) if dwell["count"] else 0.0,
+                    **histogram_percentiles(dwell["histogram"], dwell["count"])
+                }
+                for column_id, dwell in merged.items()
+            ]
+        }
+
+    @staticmethod
+    async def backfill_cfd():
+        """Siembra el flujo acumulado con la columna actual de cada tarea si aún no hay agregados"""
+        db = await get_database()
+        if await db.kanban_cfd_daily.estimated_document_count():
+            return
+        entered = {"$ifNull": ["$column_entered_at", "$created_at"]}
+        await db.tasks.aggregate([
+            {"$match": {"column_id": {"$ne": None}, "created_at": {"$type": "date"}}},
+            {"$group": {
+                "_id": {
+                    "board_id": "$board_id",
+                    "column_id": "$column_id",
+                    "day": {"$dateTrunc": {"date": entered, "unit": "day"}}
+                },
+                "arrivals": {"$sum": 1}
+            }},
+            {"$project": {
+                "_id": 0,
+                "board_id": "$_id.board_id",
+                "column_id": "$_id.column_id",
+                "day": "$_id.day",
+                "arrivals": 1,
+                "departures": {"$literal": 0}
+            }},
+            {"$merge": {
+                "into": "kanban_cfd_daily",
+                "on": ["board_id", "column_id", "day"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ]).to_list(None)
+        logger.info("Backfilled cumulative flow buckets from current task columns")
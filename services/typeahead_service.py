@@ -0,0 +1,278 @@
+"""Índice en memoria para autocompletar nombres de usuario y títulos de tareas.
+
+Las palabras se guardan en un árbol de prefijos comprimido (radix): cada arista
+lleva una cadena en lugar de un solo carácter, así que las palabras que no
+comparten prefijo no crean un nodo por letra. Los servicios de usuarios y
+tareas lo actualizan en cada escritura y se reconstruye desde la base de datos
+al arrancar y de forma periódica.
+"""
+from array import array
+from collections import deque
+from database.database import collection_tasks, collection_users
+import asyncio
+import logging
+import re
+import sys
+import time
+import unicodedata
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TYPEAHEAD_MAX_LIMIT = 50
+SCAN_BATCH_SIZE = 5000
+MAX_WORDS_PER_TITLE = 12
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+def normalize(text: str) -> str:
+    """Pasa a minúsculas y quita los acentos para que 'Revisión' coincida con 'revis'"""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+def words(text: str) -> tuple:
+    """Palabras normalizadas sin repetir; se internan para que los títulos compartan las cadenas"""
+    return tuple(dict.fromkeys(sys.intern(word) for word in WORD_PATTERN.findall(normalize(text))))
+
+def matches(query_words: list, text_words: list) -> bool:
+    """Cada palabra de la consulta debe ser prefijo de alguna palabra del texto"""
+    return all(any(word.startswith(query) for word in text_words) for query in query_words)
+
+class RadixNode:
+    __slots__ = ("label", "children", "ids")
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.children = None  # primer carácter de la arista -> nodo
+        self.ids = None  # array compacto con las entradas cuya palabra termina en este nodo
+
+class RadixTrie:
+    """Árbol de prefijos comprimido de palabra -> ids de las entradas que la contienen"""
+
+    def __init__(self):
+        self.root = RadixNode()
+
+    def insert(self, word: str, entry_id: int):
+        node = self.root
+        while word:
+            child = node.children.get(word[0]) if node.children else None
+            if child is None:
+                leaf = RadixNode(word)
+                if node.children is None:
+                    node.children = {}
+                node.children[word[0]] = leaf
+                node = leaf
+                break
+            # Longitud del prefijo común entre la palabra y la etiqueta de la arista
+            common = 0
+            limit = min(len(word), len(child.label))
+            while common < limit and word[common] == child.label[common]:
+                common += 1
+            if common < len(child.label):
+                # Partir la arista en el punto donde divergen
+                middle = RadixNode(child.label[:common])
+                child.label = child.label[common:]
+                middle.children = {child.label[0]: child}
+                node.children[word[0]] = middle
+                child = middle
+            node = child
+            word = word[common:]
+        if node.ids is None:
+            node.ids = array("q")
+        node.ids.append(entry_id)
+
+    def remove(self, word: str, entry_id: int):
+        node = self.root
+        while word:
+            child = node.children.get(word[0]) if node.children else None
+            if child is None or not word.startswith(child.label):
+                return
+            word = word[len(child.label):]
+            node = child
+        if node.ids and entry_id in node.ids:
+            node.ids.remove(entry_id)
+            if not node.ids:
+                node.ids = None
+
+    def search(self, prefix: str):
+        """Genera los ids de las palabras que empiezan por prefix, primero las más cortas"""
+        node = self.root
+        while prefix:
+            child = node.children.get(prefix[0]) if node.children else None
+            if child is None:
+                return
+            if prefix.startswith(child.label):
+                prefix = prefix[len(child.label):]
+            elif child.label.startswith(prefix):
+                prefix = ""
+            else:
+                return
+            node = child
+        queue = deque([node])
+        while queue:
+            node = queue.popleft()
+            if node.ids:
+                yield from node.ids
+            if node.children:
+                queue.extend(node.children.values())
+
+class TypeaheadIndex:
+    def __init__(self):
+        self.ready = False
+        self.tasks = {}  # id -> (título, palabras, asignado, creador)
+        self.users = {}  # id -> (username, palabras)
+        self.owner_tasks = {}  # usuario -> ids de sus tareas asignadas o creadas
+        self.task_trie = RadixTrie()
+        self.user_trie = RadixTrie()
+
+    def _link_owners(self, task_id: int, owners: set, link: bool):
+        for owner in owners - {None}:
+            if link:
+                self.owner_tasks.setdefault(owner, array("q")).append(task_id)
+            elif owner in self.owner_tasks and task_id in self.owner_tasks[owner]:
+                self.owner_tasks[owner].remove(task_id)
+                if not self.owner_tasks[owner]:
+                    del self.owner_tasks[owner]
+
+    def add_task(self, task: dict):
+        """Indexa o reindexa una tarea"""
+        if not task or task.get("id") is None:
+            return
+        self.remove_task(task["id"])
+        title_words = words(task.get("title"))[:MAX_WORDS_PER_TITLE]
+        self.tasks[task["id"]] = (task.get("title"), title_words, task.get("assigned_to"), task.get("created_by"))
+        for word in title_words:
+            self.task_trie.insert(word, task["id"])
+        self._link_owners(task["id"], {task.get("assigned_to"), task.get("created_by")}, True)
+
+    def remove_task(self, task_id: int):
+        entry = self.tasks.pop(task_id, None)
+        if entry is None:
+            return
+        _, title_words, assigned_to, created_by = entry
+        for word in title_words:
+            self.task_trie.remove(word, task_id)
+        self._link_owners(task_id, {assigned_to, created_by}, False)
+
+    def add_user(self, user: dict):
+        """Indexa un usuario activo o quita uno desactivado"""
+        if not user or user.get("id") is None:
+            return
+        self.remove_user(user["id"])
+        if not user.get("is_active", True):
+            return
+        username_words = words(user.get("username"))
+        self.users[user["id"]] = (user.get("username"), username_words)
+        for word in username_words:
+            self.user_trie.insert(word, user["id"])
+
+    def remove_user(self, user_id: int):
+        entry = self.users.pop(user_id, None)
+        if entry is None:
+            return
+        for word in entry[1]:
+            self.user_trie.remove(word, user_id)
+
+    def search_users(self, query: str, limit: int) -> list:
+        query_words = words(query)
+        if not query_words:
+            return []
+        results = []
+        seen = set()
+        for user_id in self.user_trie.search(max(query_words, key=len)):
+            if user_id in seen:
+                continue
+            seen.add(user_id)
+            username, username_words = self.users[user_id]
+            if matches(query_words, username_words):
+                results.append({"id": user_id, "username": username})
+                if len(results) == limit:
+                    break
+        return results
+
+    def search_tasks(self, query: str, user_id: int, is_admin: bool, limit: int) -> list:
+        query_words = words(query)
+        if not query_words:
+            return []
+        if is_admin:
+            # La palabra más larga de la consulta es la que menos candidatos da
+            candidates = self.task_trie.search(max(query_words, key=len))
+        else:
+            # Las tareas visibles de un usuario son pocas: recorrerlas, de la más reciente a la más
+            # antigua, es más rápido que filtrar el árbol
+            candidates = reversed(self.owner_tasks.get(user_id, ()))
+        results = []
+        seen = set()
+        for task_id in candidates:
+            if task_id in seen:
+                continue
+            seen.add(task_id)
+            title, title_words, _, _ = self.tasks[task_id]
+            if matches(query_words, title_words):
+                results.append({"id": task_id, "title": title})
+                if len(results) == limit:
+                    break
+        return results
+
+typeahead_index = TypeaheadIndex()
+# Escrituras recibidas mientras se construye un índice nuevo, para aplicarlas después
+_journal = None
+
+def _apply(operation: str, argument):
+    getattr(typeahead_index, operation)(argument)
+    if _journal is not None:
+        _journal.append((operation, argument))
+
+def index_task(task: dict):
+    _apply("add_task", task)
+
+def unindex_task(task_id: int):
+    _apply("remove_task", task_id)
+
+def index_user(user: dict):
+    _apply("add_user", user)
+
+def unindex_user(user_id: int):
+    _apply("remove_user", user_id)
+
+def get_typeahead_index() -> TypeaheadIndex:
+    return typeahead_index
+
+async def build_typeahead_index() -> TypeaheadIndex:
+    """Construye un índice nuevo recorriendo usuarios y tareas por lotes"""
+    started = time.monotonic()
+    index = TypeaheadIndex()
+    async for user in collection_users.find({}, {"_id": 0, "id": 1, "username": 1, "is_active": 1}):
+        index.add_user(user)
+    scanned = 0
+    async for task in collection_tasks.find(
+        {}, {"_id": 0, "id": 1, "title": 1, "assigned_to": 1, "created_by": 1}
+    ).batch_size(SCAN_BATCH_SIZE):
+        index.add_task(task)
+        scanned += 1
+        if scanned % SCAN_BATCH_SIZE == 0:
+            # Ceder el bucle de eventos entre lotes
+            await asyncio.sleep(0)
+    index.ready = True
+    logger.info(f"Built typeahead index with {len(index.users)} users and {len(index.tasks)} tasks "
+                f"in {time.monotonic() - started:.1f} s")
+    return index
+
+async def run_typeahead_indexer(interval_seconds: int):
+    """Construye el índice al arrancar y lo reconstruye periódicamente para recoger escrituras de otros procesos"""
+    global typeahead_index, _journal
+    while True:
+        try:
+            _journal = []
+            index = await build_typeahead_index()
+            # Reaplicar en orden las escrituras que el recorrido pudo no ver
+            for operation, argument in _journal:
+                getattr(index, operation)(argument)
+            typeahead_index = index
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Typeahead index build failed: {str(e)}")
+        finally:
+            _journal = None
+        await asyncio.sleep(interval_seconds)